@@ -1,13 +1,37 @@
-from flask import Flask, jsonify, request, render_template
+from flask import (
+    Flask,
+    Response,
+    jsonify,
+    request,
+    render_template,
+)
 import pickle
 import os
 import pandas as pd
 import json
 from datetime import datetime, timedelta
 import csv
+import atexit
+import threading
+import time
 
 # Import your recommendation function
-from frontend.recommendation_utils import recommend_movies_for_user
+from frontend.recommendation_utils import (
+    recommend_movies_for_user,
+    recommend_movies_for_users,
+)
+from frontend.analytics_aggregator import AggregatorSync, AnalyticsAggregator
+from frontend.model_holder import ModelHolder
+from frontend.response_cache import ResponseCache
+from frontend.telemetry_store import TelemetryStore
+from frontend.telemetry_writer import TelemetryWriter
+from model.artifact import artifact_path, artifact_version, load_artifact, load_extra
+from utils.popularity import (
+    POPULARITY_WINDOWS,
+    PopularityRefresher,
+    refresh_recent_popularity,
+)
+from utils.serving_index import build_serving_index, load_seen_index
 
 # Initialize Flask app
 app = Flask(__name__)
@@ -15,6 +39,39 @@ app = Flask(__name__)
 # Set up data storage for evaluation
 RATINGS_FILE = "user_ratings.csv"
 TELEMETRY_FILE = "telemetry_logs.csv"
+TELEMETRY_STORE_DIR = os.environ.get("TELEMETRY_STORE_DIR", "telemetry_store")
+MODEL_DIR = "models/cf_model"
+# Models saved before the artifact format; used when there is no artifact.
+LEGACY_MODEL_FILE = "models/cf_model.pkl"
+# Seen index saved next to those models; artifacts carry their own.
+SEEN_INDEX_FILE = "models/seen_index.npz"
+# Seconds between checks for a new model file; 0 disables hot reload.
+MODEL_RELOAD_SECONDS = int(os.environ.get("MODEL_RELOAD_SECONDS", 30))
+# Seconds between rebuilds of the week and day popularity lists from recent
+# ratings; 0 disables the refresh.
+POPULARITY_REFRESH_SECONDS = int(os.environ.get("POPULARITY_REFRESH_SECONDS", 3600))
+
+# Shortest time between two updates of an /analytics-stream connection, and
+# the time after which an idle one gets a keep-alive comment.
+ANALYTICS_STREAM_INTERVAL = float(os.environ.get("ANALYTICS_STREAM_INTERVAL", 2.0))
+ANALYTICS_HEARTBEAT_SECONDS = 15
+# Most /analytics-stream connections per process. Each open stream holds a
+# server thread, so under serve.py keep this below SERVE_THREADS; further
+# dashboards get a 503 and poll /analytics-data instead.
+ANALYTICS_MAX_STREAMS = int(os.environ.get("ANALYTICS_MAX_STREAMS", 2))
+# Seconds between reads of the telemetry other processes (serve.py
+# workers) have written, so every dashboard counts all of it; 0 disables.
+ANALYTICS_SYNC_SECONDS = float(os.environ.get("ANALYTICS_SYNC_SECONDS", 5))
+analytics_streams = threading.BoundedSemaphore(ANALYTICS_MAX_STREAMS)
+# Largest number of users accepted by /recommendations/batch.
+BATCH_MAX_USERS = int(os.environ.get("BATCH_MAX_USERS", 1000))
+# Largest count of recommendations per user a request may ask for.
+MAX_RECOMMENDATIONS = int(os.environ.get("MAX_RECOMMENDATIONS", 100))
+# Recommendation lists are cached per (model version, user, count, popularity).
+response_cache = ResponseCache(
+    max_size=int(os.environ.get("RESPONSE_CACHE_SIZE", 10000)),
+    ttl=int(os.environ.get("RESPONSE_CACHE_TTL", 300)),
+)
 
 
 # Initialize the rating CSV if it doesn't exist
@@ -34,9 +91,13 @@ def initialize_telemetry_file():
 
 
 # Load pre-trained model and data
-def load_model():
+def load_model(path=None):
+    """Load the artifact version in path, or the legacy model without one."""
     try:
-        with open("models/cf_model.pkl", "rb") as file:
+        if path is not None:
+            # Memory-mapped, so worker processes share the arrays.
+            return load_artifact(path)
+        with open(LEGACY_MODEL_FILE, "rb") as file:
             model = pickle.load(file)
         return model
     except Exception as e:
@@ -44,22 +105,185 @@ def load_model():
         return None
 
 
-def load_data():
+def get_model_version():
+    """Identify the model by its artifact version or file modification time."""
+    if artifact_path(MODEL_DIR) is not None:
+        return artifact_version(MODEL_DIR)
+    try:
+        return datetime.fromtimestamp(os.path.getmtime(LEGACY_MODEL_FILE)).isoformat()
+    except OSError:
+        return None
+
+
+def load_data(with_ratings=True):
     try:
         movies_df = pd.read_csv("dataframes/movies.csv")
-        ratings_df = pd.read_csv("dataframes/ratings.csv")
+        ratings_df = pd.read_csv("dataframes/ratings.csv") if with_ratings else None
         return movies_df, ratings_df
     except Exception as e:
         print(f"Error loading data: {e}")
         return None, None
 
 
-# Load everything once when app starts
-model = load_model()
-movies_df, ratings_df = load_data()
+def load_serving_state():
+    """Load the model, data and serving index, raising if any of them fails."""
+    # Resolved once, so the model and its seen index come from one version.
+    path = artifact_path(MODEL_DIR)
+    model = load_model(path)
+
+    # Prefer the seen index and popularity lists saved with the model to
+    # rebuilding them from the ratings history.
+    seen_index = popularity = None
+    if path is not None:
+        seen = load_extra(path, "seen_index")
+        if seen is not None:
+            seen_index = (seen["indptr"], seen["movie_rows"])
+        popularity = load_extra(path, "popularity")
+    if seen_index is None and os.path.exists(SEEN_INDEX_FILE):
+        seen_index = load_seen_index(SEEN_INDEX_FILE)
+
+    # ratings.csv is only read for what the model was saved without.
+    needs_ratings = seen_index is None or popularity is None
+    movies_df, ratings_df = load_data(with_ratings=needs_ratings)
+    if model is None or movies_df is None or (needs_ratings and ratings_df is None):
+        raise RuntimeError("model or data could not be loaded")
+
+    serving_index = build_serving_index(
+        model, movies_df, ratings_df, seen_index, popularity
+    )
+    # The week and day lists follow the ratings submitted since training.
+    refresh_recent_popularity(serving_index, lambda: recent_ratings(serving_index))
+
+    # Titles are served from the index, so the raw JSON is not kept.
+    movies_df = movies_df.drop(columns=["json_data"], errors="ignore")
+    return {
+        "model": model,
+        "movies_df": movies_df,
+        "ratings_df": ratings_df,
+        "serving_index": serving_index,
+    }
+
+
+def current_serving_index():
+    state = model_holder.state
+    return None if state is None else state["serving_index"]
+
+
+def recent_ratings(serving_index):
+    """
+    Ratings submitted within the longest popularity window, from the
+    telemetry store, with the movie IDs of their titles in serving_index.
+    """
+    window = max(w for w in POPULARITY_WINDOWS.values() if w is not None)
+    since = pd.Timestamp.now(tz="UTC").tz_localize(None) - pd.Timedelta(seconds=window)
+    ratings = telemetry_store.read("ratings", start=since, columns=["movie_name"])
+
+    # Ratings are submitted with the titles the recommendations showed.
+    movie_ids = {
+        title.replace("+", " "): movie_id
+        for movie_id, title in serving_index["titles"].items()
+    }
+    ratings["movie_id"] = ratings["movie_name"].astype(object).map(movie_ids)
+    return ratings.dropna(subset=["movie_id"])
+
+
 initialize_ratings_file()
 initialize_telemetry_file()
 
+# The analytics dashboard reads telemetry and ratings from day-partitioned
+# segments; CSV logs from before the store existed are imported once.
+telemetry_store = TelemetryStore(
+    TELEMETRY_STORE_DIR,
+    retention_days=int(os.environ.get("TELEMETRY_RETENTION_DAYS", 0)) or None,
+)
+for table, csv_file in (("telemetry", TELEMETRY_FILE), ("ratings", RATINGS_FILE)):
+    if not telemetry_store.partitions(table):
+        telemetry_store.import_csv(table, csv_file)
+
+# Load everything once when app starts; the holder then swaps in new models
+# written by main.py without a restart.
+model_holder = ModelHolder(
+    load_serving_state, get_model_version, on_swap=lambda state: response_cache.clear()
+)
+model_holder.reload()
+
+# Dashboard metrics come from running aggregates, rebuilt here from the
+# store and then updated by log_telemetry and submit_rating, and with what
+# other processes write by analytics_sync.
+analytics = AnalyticsAggregator()
+analytics.rebuild(telemetry_store)
+
+# Telemetry and rating rows are queued by the request handlers and appended
+# in batches by background threads; whatever is queued is written at exit.
+# The threads are created by start_background_services().
+telemetry_writer = None
+ratings_writer = None
+popularity_refresher = None
+analytics_sync = None
+
+
+def start_background_services():
+    """
+    Start the model watcher, the popularity refresher, the analytics sync
+    and the telemetry writers. A thread cannot run in a process forked
+    after it was created, so a preloading server (see serve.py) calls this
+    in each worker instead of at import.
+    """
+    global telemetry_writer, ratings_writer, popularity_refresher, analytics_sync
+    if MODEL_RELOAD_SECONDS > 0:
+        model_holder.start_watching(MODEL_RELOAD_SECONDS)
+    if POPULARITY_REFRESH_SECONDS > 0:
+        popularity_refresher = PopularityRefresher(
+            current_serving_index,
+            lambda: recent_ratings(current_serving_index()),
+            POPULARITY_REFRESH_SECONDS,
+        )
+        popularity_refresher.start()
+    if ANALYTICS_SYNC_SECONDS > 0:
+        analytics_sync = AggregatorSync(
+            analytics, telemetry_store, ANALYTICS_SYNC_SECONDS
+        )
+        analytics_sync.start()
+
+    telemetry_writer = TelemetryWriter(
+        TELEMETRY_FILE,
+        max_queue=int(os.environ.get("TELEMETRY_QUEUE_SIZE", 10000)),
+        batch_size=int(os.environ.get("TELEMETRY_BATCH_SIZE", 500)),
+        flush_interval=float(os.environ.get("TELEMETRY_FLUSH_SECONDS", 1.0)),
+        fsync=os.environ.get("TELEMETRY_FSYNC", "never"),
+        store=telemetry_store,
+        table="telemetry",
+    )
+    # Ratings are user data: rather than being dropped, submissions wait for
+    # room in the queue and fail only if it stays full.
+    ratings_writer = TelemetryWriter(
+        RATINGS_FILE,
+        flush_interval=float(os.environ.get("TELEMETRY_FLUSH_SECONDS", 1.0)),
+        fsync=os.environ.get("TELEMETRY_FSYNC", "never"),
+        put_timeout=5.0,
+        store=telemetry_store,
+        table="ratings",
+    )
+    for writer in (telemetry_writer, ratings_writer):
+        writer.start()
+        atexit.register(writer.close)
+
+
+def stop_background_services():
+    """Stop the background threads, writing out the queued rows."""
+    model_holder.stop()
+    if popularity_refresher is not None:
+        popularity_refresher.stop()
+    if analytics_sync is not None:
+        analytics_sync.stop()
+    for writer in (telemetry_writer, ratings_writer):
+        if writer is not None:
+            writer.close()
+
+
+if int(os.environ.get("START_BACKGROUND_SERVICES", 1)):
+    start_background_services()
+
 
 # Route for the home page
 @app.route("/", methods=["GET"])
@@ -70,9 +294,30 @@ def home():
 # Basic health check endpoint
 @app.route("/health", methods=["GET"])
 def health_check():
-    if model is not None:
-        return jsonify({"status": "healthy", "model_loaded": True})
-    return jsonify({"status": "unhealthy", "model_loaded": False}), 500
+    state, version = model_holder.snapshot()
+    if state is not None:
+        return jsonify(
+            {
+                "status": "healthy",
+                "model_loaded": True,
+                "model_version": version,
+                "model_reload_error": model_holder.last_error,
+                "cache": response_cache.stats(),
+                "telemetry": (
+                    telemetry_writer.stats() if telemetry_writer else "not started"
+                ),
+            }
+        )
+    return (
+        jsonify(
+            {
+                "status": "unhealthy",
+                "model_loaded": False,
+                "model_reload_error": model_holder.last_error,
+            }
+        ),
+        500,
+    )
 
 
 # Main route for getting recommendations
@@ -81,15 +326,26 @@ def get_recommendations(user_id):
     try:
         user_id = str(user_id)
         num_recommendations = request.args.get("count", default=10, type=int)
-
-        if model and movies_df is not None and ratings_df is not None:
-            recommended_titles = recommend_movies_for_user(
-                model,
-                movies_df,
-                ratings_df,
-                user_id=user_id,
-                num_recommendations=num_recommendations,
-            )
+        popularity = request.args.get("popularity", default="all_time")
+        if not 1 <= num_recommendations <= MAX_RECOMMENDATIONS:
+            return count_error()
+
+        state, model_version = model_holder.snapshot()
+
+        if state is not None:
+            cache_key = (model_version, user_id, num_recommendations, popularity)
+            recommended_titles = response_cache.get(cache_key)
+            if recommended_titles is None:
+                recommended_titles = recommend_movies_for_user(
+                    state["model"],
+                    state["movies_df"],
+                    state["ratings_df"],
+                    user_id=user_id,
+                    num_recommendations=num_recommendations,
+                    serving_index=state["serving_index"],
+                    popularity=popularity,
+                )
+                response_cache.put(cache_key, recommended_titles)
 
             recommendations = [
                 {"movie_name": title.replace("+", " ")} for title in recommended_titles
@@ -109,17 +365,100 @@ def get_recommendations(user_id):
                 }
             )
 
-        error_msg = "Required resources not loaded: "
-        if model is None:
-            error_msg += "model, "
-        if movies_df is None:
-            error_msg += "movies_df, "
-        if ratings_df is None:
-            error_msg += "ratings_df"
-        return jsonify({"error": error_msg.strip(", ")}), 500
+        error_msg = "Required resources not loaded: model, movies_df, ratings_df"
+        if model_holder.last_error:
+            error_msg += f" ({model_holder.last_error})"
+        return jsonify({"error": error_msg}), 500
+
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+def count_error():
+    return (
+        jsonify({"error": f"count must be between 1 and {MAX_RECOMMENDATIONS}"}),
+        400,
+    )
+
+
+# Route for getting recommendations for many users in one request
+@app.route("/recommendations/batch", methods=["POST"])
+def get_batch_recommendations():
+    try:
+        payload = request.get_json(silent=True) or {}
+        user_ids = payload.get("user_ids")
+        if not isinstance(user_ids, list) or not user_ids:
+            return jsonify({"error": "user_ids must be a non-empty list"}), 400
+        if len(user_ids) > BATCH_MAX_USERS:
+            return (
+                jsonify({"error": f"At most {BATCH_MAX_USERS} user_ids per batch"}),
+                400,
+            )
+        user_ids = [str(user_id) for user_id in user_ids]
+        num_recommendations = int(payload.get("count", 10))
+        popularity = payload.get("popularity", "all_time")
+        if not 1 <= num_recommendations <= MAX_RECOMMENDATIONS:
+            return count_error()
+
+        state, model_version = model_holder.snapshot()
+        if state is None:
+            error_msg = "Required resources not loaded: model, movies_df, ratings_df"
+            if model_holder.last_error:
+                error_msg += f" ({model_holder.last_error})"
+            return jsonify({"error": error_msg}), 500
+
+        # Serve what the cache has and score the rest in one batch.
+        cache_keys = {
+            user_id: (model_version, user_id, num_recommendations, popularity)
+            for user_id in user_ids
+        }
+        titles_by_user = {}
+        for user_id, cache_key in cache_keys.items():
+            cached = response_cache.get(cache_key)
+            if cached is not None:
+                titles_by_user[user_id] = cached
+
+        missing = [user_id for user_id in cache_keys if user_id not in titles_by_user]
+        if missing:
+            recommended = recommend_movies_for_users(
+                state["model"],
+                state["movies_df"],
+                state["ratings_df"],
+                user_ids=missing,
+                num_recommendations=num_recommendations,
+                serving_index=state["serving_index"],
+                popularity=popularity,
+            )
+            for user_id, recommended_titles in zip(missing, recommended):
+                response_cache.put(cache_keys[user_id], recommended_titles)
+                titles_by_user[user_id] = recommended_titles
+
+        results = [
+            {
+                "user_id": user_id,
+                "recommendations": [
+                    {"movie_name": title.replace("+", " ")}
+                    for title in titles_by_user[user_id]
+                ],
+                "count": len(titles_by_user[user_id]),
+            }
+            for user_id in user_ids
+        ]
+
+        log_telemetry(
+            event="batch_recommendations_served",
+            user_id=None,
+            data={
+                "users": len(user_ids),
+                "count": num_recommendations,
+                "scored": len(missing),
+            },
+        )
+
+        return jsonify({"results": results, "count": len(results)})
 
     except ValueError:
-        return jsonify({"error": "Invalid user ID format"}), 400
+        return jsonify({"error": "Invalid count"}), 400
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -135,17 +474,27 @@ def submit_rating():
             if field not in rating_data:
                 return jsonify({"error": f"Missing field: {field}"}), 400
 
-        with open(RATINGS_FILE, "a", newline="") as file:
-            writer = csv.writer(file)
-            writer.writerow(
-                [
-                    rating_data["user_id"],
-                    rating_data["movie_name"],
-                    rating_data["rating"],
-                    rating_data["watched"],
-                    rating_data["timestamp"],
-                ]
-            )
+        # None until start_background_services() has run in this process.
+        if ratings_writer is None:
+            return jsonify({"error": "Ratings are not being recorded yet"}), 503
+
+        recorded = ratings_writer.log(
+            [
+                rating_data["user_id"],
+                rating_data["movie_name"],
+                rating_data["rating"],
+                rating_data["watched"],
+                rating_data["timestamp"],
+            ]
+        )
+        if not recorded:
+            return jsonify({"error": "Too many ratings, try again later"}), 503
+        analytics.add_rating(
+            rating_data["timestamp"], rating_data["movie_name"], rating_data["rating"]
+        )
+
+        # The user's cached recommendations may include the movie just rated.
+        response_cache.invalidate_user(str(rating_data["user_id"]))
 
         log_telemetry(
             event="rating_submitted",
@@ -179,23 +528,22 @@ def log_telemetry_endpoint():
         return jsonify({"error": str(e)}), 500
 
 
-# Function to log telemetry data
+# Function to log telemetry data; the row is written by telemetry_writer
 def log_telemetry(event, user_id, data):
+    if telemetry_writer is None:
+        return False
     try:
-        timestamp = datetime.now().isoformat()
-
-        with open(TELEMETRY_FILE, "a", newline="") as file:
-            writer = csv.writer(file)
-            writer.writerow(
-                [
-                    timestamp,
-                    event,
-                    user_id,
-                    json.dumps(data) if not isinstance(data, str) else data,
-                ]
-            )
-
-        return True
+        now = datetime.now()
+        analytics.add_event(now, event, user_id)
+
+        return telemetry_writer.log(
+            [
+                now.isoformat(),
+                event,
+                user_id,
+                json.dumps(data) if not isinstance(data, str) else data,
+            ]
+        )
     except Exception as e:
         print(f"Error logging telemetry: {e}")
         return False
@@ -211,14 +559,72 @@ def analytics_data():
     """Return JSON analytics data for the dashboard."""
     try:
         time_range = request.args.get("timeRange", "week")
-        metrics = process_telemetry_data(TELEMETRY_FILE, RATINGS_FILE, time_range)
+        metrics = process_telemetry_data(analytics, time_range)
         return jsonify(metrics)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 
-def process_telemetry_data(telemetry_file, ratings_file, time_range='week'):
-    """Process telemetry and ratings data to compute evaluation metrics."""
+# Streams dashboard metrics as server-sent events: the full metrics once,
+# then only the metrics that changed, at most once per interval
+@app.route("/analytics-stream", methods=["GET"])
+def analytics_stream():
+    time_range = request.args.get("timeRange", "week")
+    if not analytics_streams.acquire(blocking=False):
+        return jsonify({"error": "Too many analytics streams, poll /analytics-data"}), 503
+
+    response = Response(
+        analytics_events(time_range),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+    response.call_on_close(analytics_streams.release)
+    return response
+
+
+def shutting_down():
+    """Whether the server is stopping; serve.py replaces this in its workers."""
+    return False
+
+
+def analytics_events(time_range):
+    version = analytics.version
+    metrics = process_telemetry_data(analytics, time_range)
+    yield server_sent_event("snapshot", metrics)
+
+    # Streams end when the server stops, so they do not hold up a graceful
+    # restart; the browser reconnects to another worker.
+    last_sent = time.monotonic()
+    while not shutting_down():
+        if analytics.wait_for_change(version, 1.0) == version:
+            # An idle dashboard only gets a comment now and then, which
+            # keeps proxies from closing the connection.
+            if time.monotonic() - last_sent >= ANALYTICS_HEARTBEAT_SECONDS:
+                last_sent = time.monotonic()
+                yield ": keep-alive\n\n"
+            continue
+
+        # Let the events of the next interval arrive, then send them as
+        # one update.
+        time.sleep(ANALYTICS_STREAM_INTERVAL)
+        version = analytics.version
+        updated = process_telemetry_data(analytics, time_range)
+        delta = {key: value for key, value in updated.items() if metrics.get(key) != value}
+        metrics = updated
+        if delta:
+            last_sent = time.monotonic()
+            yield server_sent_event("delta", delta)
+
+
+def server_sent_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def process_telemetry_data(aggregator, time_range='week'):
+    """
+    Compute evaluation metrics from the running aggregates of an
+    AnalyticsAggregator, merged over the requested time range.
+    """
     try:
         # Calculate date range
         now = datetime.now().replace(tzinfo=None)  # Ensure naive datetime
@@ -229,27 +635,16 @@ def process_telemetry_data(telemetry_file, ratings_file, time_range='week'):
         elif time_range == 'month':
             start_date = now - timedelta(days=30)
         else:  # 'all'
-            start_date = datetime.min
-        
-        # Load telemetry data
-        telemetry_df = pd.read_csv(telemetry_file)
-        
-        # Convert timestamp to datetime, removing timezone if present
-        telemetry_df['timestamp'] = pd.to_datetime(
-            telemetry_df['timestamp'],
-            errors='coerce',  # Handle invalid formats
-            utc=True          # Properly parse 'Z' timezone marker
-        ).dt.tz_localize(None)
+            start_date = None
         
-        # Filter by date range if not 'all'
-        if time_range != 'all':
-            telemetry_df = telemetry_df[telemetry_df['timestamp'] >= start_date]
+        # Merge the pre-aggregated buckets of the time range
+        aggregates = aggregator.query(start_date)
         
         # Process into metrics
         metrics = {}
         
         # Count different event types
-        events_count = telemetry_df['event'].value_counts().to_dict()
+        events_count = aggregates['events']
         
         # Total recommendations shown
         total_recommendations = events_count.get('recommendations_shown', 0) * 10
@@ -282,60 +677,42 @@ def process_telemetry_data(telemetry_file, ratings_file, time_range='week'):
             100 - metrics['rated_percentage'] - metrics['clicked_not_rated_percentage']
         )
         
-        # Load ratings data if available
-        if ratings_file and os.path.exists(ratings_file):
-            ratings_df = pd.read_csv(ratings_file)
-            
-            # Convert timestamp to datetime, removing timezone if present
-            if 'timestamp' in ratings_df.columns:
-                ratings_df['timestamp'] = pd.to_datetime(
-                    ratings_df['timestamp'],
-                    errors='coerce',  # Handle invalid formats
-                    utc=True          # Properly parse 'Z' timezone marker
-                ).dt.tz_localize(None)
-                
-                # Filter by date range if not 'all'
-                if time_range != 'all':
-                    ratings_df = ratings_df[ratings_df['timestamp'] >= start_date]
-            
-            # Calculate average rating (excluding 'not watched' ratings which are 0)
-            valid_ratings = ratings_df[ratings_df['rating'] > 0]['rating'].astype(float)
-            metrics['average_rating'] = (
-                float(valid_ratings.mean()) if len(valid_ratings) > 0 else 0
-            )
+        # Rating histogram (value -> count), excluding 'not watched'
+        # ratings which are 0
+        valid_ratings = {
+            rating: count
+            for rating, count in sorted(aggregates['ratings'].items())
+            if rating > 0
+        }
+        total_valid_ratings = sum(valid_ratings.values())
+
+        # Calculate average rating
+        metrics['average_rating'] = (
+            sum(rating * count for rating, count in valid_ratings.items())
+            / total_valid_ratings
+            if total_valid_ratings > 0 else 0
+        )
+
+        # Rating distribution
+        metrics['rating_distribution'] = {
+            str(int(rating)): (count / total_valid_ratings) * 100
+            for rating, count in valid_ratings.items()
+        }
+
+        # Top rated movies, from the running per-movie sums and counts
+        movie_ratings = [
+            {
+                'title': title,
+                'average_rating': total / count,
+                'recommendations': count,
+            }
+            for title, (total, count) in aggregates['movies'].items()
+        ]
+        movie_ratings.sort(key=lambda movie: movie['average_rating'], reverse=True)
+        metrics['top_rated_movies'] = movie_ratings[:5]
 
-            # Rating distribution
-            if len(valid_ratings) > 0:
-                rating_counts = valid_ratings.value_counts().sort_index()
-                total_valid_ratings = len(valid_ratings)
-                metrics['rating_distribution'] = {
-                    str(int(rating)): (count / total_valid_ratings) * 100 
-                    for rating, count in rating_counts.items()
-                }
-            else:
-                metrics['rating_distribution'] = {}
-            
-            # Top rated movies (if we have movie titles)
-            if 'movie_name' in ratings_df.columns:
-                movie_ratings = ratings_df[ratings_df['rating'] > 0].groupby('movie_name').agg({
-                    'rating': ['mean', 'count']
-                }).reset_index()
-                
-                movie_ratings.columns = ['title', 'average_rating', 'recommendations']
-                
-                # Sort by average rating and take top 5
-                top_movies = movie_ratings.sort_values(
-                    'average_rating', ascending=False
-                ).head(5)
-                
-                metrics['top_rated_movies'] = top_movies.to_dict('records')
-        else:
-            metrics['average_rating'] = 0
-            metrics['rating_distribution'] = {}
-            metrics['top_rated_movies'] = []
-        
         # Count unique users
-        metrics['unique_users'] = telemetry_df['user_id'].nunique()
+        metrics['unique_users'] = aggregates['unique_users']
         
         return metrics
         
@@ -0,0 +1,83 @@
+"""
+Benchmark Hogwild SGD against the serial trainer on synthetic ratings.
+
+Usage (from Movie_Recommender):
+    PYTHONPATH=. python benchmarks/bench_hogwild.py [n_ratings] [max_threads]
+
+Prints epoch throughput, speedup over one thread and validation RMSE for
+each thread count, next to the mini-batch NumPy trainer.
+"""
+
+import contextlib
+import io
+import os
+import sys
+import time
+import numpy as np
+import pandas as pd
+from model.collaborative_filtering import train_collaborative_filtering
+from model.evaluation import evaluate_model
+
+
+def synthetic_ratings(n_ratings, n_users, n_movies, n_factors=10, seed=0):
+    """
+    Ratings drawn from a random low-rank model plus noise, clipped to 1..5.
+    """
+    rng = np.random.default_rng(seed)
+    user_factors = rng.normal(0, 0.5, (n_users, n_factors))
+    movie_factors = rng.normal(0, 0.5, (n_movies, n_factors))
+    users = rng.integers(0, n_users, n_ratings)
+    movies = rng.integers(0, n_movies, n_ratings)
+    ratings = 3.5 + np.einsum("ij,ij->i", user_factors[users], movie_factors[movies])
+    ratings += rng.normal(0, 0.3, n_ratings)
+
+    return pd.DataFrame(
+        {"user_id": users, "movie_id": movies, "rating": np.clip(ratings, 1, 5)}
+    )
+
+
+def run(train_df, val_df, n_epochs, **options):
+    start = time.perf_counter()
+    # Silence the per-epoch log lines.
+    with contextlib.redirect_stdout(io.StringIO()):
+        model = train_collaborative_filtering(
+            train_df, n_factors=20, n_epochs=n_epochs, lr=0.01, reg=0.02, **options
+        )
+    elapsed = time.perf_counter() - start
+    return elapsed, evaluate_model(model, val_df)["RMSE"]
+
+
+def main():
+    n_ratings = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    max_threads = int(sys.argv[2]) if len(sys.argv) > 2 else os.cpu_count()
+    n_epochs = 5
+
+    ratings_df = synthetic_ratings(n_ratings, n_ratings // 50, n_ratings // 200)
+    split = int(n_ratings * 0.9)
+    train_df, val_df = ratings_df.iloc[:split], ratings_df.iloc[split:]
+
+    # Compile the kernel outside the timed runs.
+    run(train_df.iloc[:1000], val_df, 1, n_threads=1)
+
+    print(f"{split} training ratings, {n_epochs} epochs, {os.cpu_count()} cores")
+    print(f"{'trainer':<16}{'ratings/s':>14}{'speedup':>10}{'val RMSE':>10}")
+
+    baseline = None
+    thread_counts = sorted({1, *[2**i for i in range(max_threads.bit_length())]})
+    for n_threads in [n for n in thread_counts if n <= max_threads]:
+        elapsed, rmse = run(train_df, val_df, n_epochs, n_threads=n_threads)
+        baseline = baseline or elapsed
+        print(
+            f"{f'hogwild x{n_threads}':<16}{split * n_epochs / elapsed:>14,.0f}"
+            f"{baseline / elapsed:>9.2f}x{rmse:>10.4f}"
+        )
+
+    elapsed, rmse = run(train_df, val_df, n_epochs, batch_size=4096)
+    print(
+        f"{'numpy batch':<16}{split * n_epochs / elapsed:>14,.0f}"
+        f"{baseline / elapsed:>9.2f}x{rmse:>10.4f}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,249 @@
+"""
+Benchmark recommendation throughput of serve.py by worker count.
+
+Usage (from Movie_Recommender):
+    PYTHONPATH=. python benchmarks/bench_serving.py [max_workers] [seconds]
+
+Trains a small model on synthetic ratings in a temporary directory, then
+for 1, 2, 4, ... max_workers workers starts serve.py there and drives
+GET /recommendations/<user_id> for random known users from client
+processes holding a fixed number of keep-alive connections. The response
+cache is disabled so every request is scored. Prints requests per second,
+speedup over one worker and latency percentiles.
+
+The clients run on the same machine, so the numbers level off before the
+worker count reaches the number of CPUs.
+"""
+
+import contextlib
+import http.client
+import io
+import json
+import multiprocessing
+import os
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import numpy as np
+import pandas as pd
+from model.artifact import save_artifact
+from model.collaborative_filtering import train_collaborative_filtering
+from utils.serving_index import build_seen_index
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+N_USERS = 20000
+N_MOVIES = 5000
+N_CONNECTIONS = 32
+
+
+def write_model(directory, n_ratings=500000, seed=0):
+    """
+    Lay out dataframes/ and models/ in directory as main.py would.
+    """
+    rng = np.random.default_rng(seed)
+    ratings_df = pd.DataFrame(
+        {
+            "user_id": [f"user{i}" for i in rng.integers(0, N_USERS, n_ratings)],
+            "movie_id": [f"movie{i}" for i in rng.integers(0, N_MOVIES, n_ratings)],
+            "rating": rng.integers(1, 6, n_ratings),
+        }
+    )
+    movie_ids = sorted(ratings_df["movie_id"].unique())
+    movies_df = pd.DataFrame(
+        {
+            "movie_id": movie_ids,
+            "json_data": [json.dumps({"title": movie_id}) for movie_id in movie_ids],
+        }
+    )
+
+    os.makedirs(os.path.join(directory, "dataframes"))
+    os.makedirs(os.path.join(directory, "models"))
+    movies_df.to_csv(os.path.join(directory, "dataframes", "movies.csv"), index=False)
+    ratings_df.to_csv(os.path.join(directory, "dataframes", "ratings.csv"), index=False)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        model = train_collaborative_filtering(ratings_df, n_factors=50, n_epochs=2)
+    indptr, movie_rows = build_seen_index(model, ratings_df)
+    save_artifact(
+        model,
+        os.path.join(directory, "models", "cf_model"),
+        extras={"seen_index": {"indptr": indptr, "movie_rows": movie_rows}},
+    )
+    return sorted(ratings_df["user_id"].unique())
+
+
+def start_server(directory, port, n_workers, n_threads):
+    env = dict(
+        os.environ,
+        PYTHONPATH=REPO_DIR,
+        PORT=str(port),
+        SERVE_WORKERS=str(n_workers),
+        SERVE_THREADS=str(n_threads),
+        RESPONSE_CACHE_SIZE="0",
+        MODEL_RELOAD_SECONDS="0",
+        POPULARITY_REFRESH_SECONDS="0",
+    )
+    server = subprocess.Popen(
+        [sys.executable, os.path.join(REPO_DIR, "serve.py")],
+        cwd=directory,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+
+    # Ready once every worker has booted, which /health cannot tell, so
+    # wait until the health check has been answered by n_workers processes.
+    deadline = time.monotonic() + 120
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError("serve.py exited during startup")
+        try:
+            if worker_count(server.pid) >= n_workers and get(port, "/health") == 200:
+                return server
+        except OSError:
+            pass
+        time.sleep(0.5)
+    stop_server(server)
+    raise RuntimeError("serve.py did not start")
+
+
+def worker_count(pid):
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as f:
+            return len(f.read().split())
+    except OSError:
+        # No /proc: assume the workers are up once the server answers.
+        return sys.maxsize
+
+
+def stop_server(server):
+    server.send_signal(signal.SIGTERM)
+    try:
+        server.wait(timeout=60)
+    except subprocess.TimeoutExpired:
+        server.kill()
+        server.wait()
+
+
+def get(port, path):
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+    try:
+        connection.request("GET", path)
+        response = connection.getresponse()
+        response.read()
+        return response.status
+    finally:
+        connection.close()
+
+
+def client(args):
+    """
+    Keep n_connections requests in flight until the deadline; returns the
+    latencies of the successful ones and the number of errors.
+    """
+    port, user_ids, n_connections, deadline, seed = args
+    latencies, errors = [], [0]
+    lock = threading.Lock()
+
+    def loop(thread_seed):
+        rng = np.random.default_rng(thread_seed)
+        connection = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+        while time.time() < deadline:
+            user_id = user_ids[rng.integers(len(user_ids))]
+            start = time.perf_counter()
+            try:
+                connection.request("GET", f"/recommendations/{user_id}")
+                response = connection.getresponse()
+                response.read()
+                ok = response.status == 200
+            except (OSError, http.client.HTTPException):
+                connection.close()
+                connection = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+                ok = False
+            elapsed = time.perf_counter() - start
+            with lock:
+                if ok:
+                    latencies.append(elapsed)
+                else:
+                    errors[0] += 1
+        connection.close()
+
+    threads = [
+        threading.Thread(target=loop, args=(seed * 1000 + i,))
+        for i in range(n_connections)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, errors[0]
+
+
+def run(port, user_ids, seconds, n_processes):
+    deadline = time.time() + seconds
+    per_process = max(N_CONNECTIONS // n_processes, 1)
+    with multiprocessing.Pool(n_processes) as pool:
+        results = pool.map(
+            client,
+            [
+                (port, user_ids, per_process, deadline, seed)
+                for seed in range(n_processes)
+            ],
+        )
+    latencies = np.concatenate([np.asarray(r[0]) for r in results])
+    errors = sum(r[1] for r in results)
+    return latencies, errors
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def main():
+    max_workers = int(sys.argv[1]) if len(sys.argv) > 1 else os.cpu_count()
+    seconds = float(sys.argv[2]) if len(sys.argv) > 2 else 10.0
+    n_processes = min(4, os.cpu_count() or 1)
+
+    worker_counts = [1]
+    while worker_counts[-1] * 2 <= max_workers:
+        worker_counts.append(worker_counts[-1] * 2)
+    if worker_counts[-1] != max_workers:
+        worker_counts.append(max_workers)
+
+    with tempfile.TemporaryDirectory() as directory:
+        print("Training a model on synthetic ratings...")
+        user_ids = write_model(directory)
+
+        print(
+            f"{N_CONNECTIONS} connections from {n_processes} client processes, "
+            f"{seconds:g}s per run"
+        )
+        print(f"{'workers':>8} {'req/s':>9} {'speedup':>8} {'p50 ms':>8} {'p99 ms':>8}")
+        baseline = None
+        for n_workers in worker_counts:
+            port = free_port()
+            server = start_server(directory, port, n_workers, n_threads=4)
+            try:
+                # Warm up each worker's code paths outside the timed run.
+                run(port, user_ids, 1.0, n_processes)
+                latencies, errors = run(port, user_ids, seconds, n_processes)
+            finally:
+                stop_server(server)
+
+            throughput = len(latencies) / seconds
+            baseline = baseline or throughput
+            p50, p99 = np.percentile(latencies, [50, 99]) * 1000
+            print(
+                f"{n_workers:>8} {throughput:>9.0f} {throughput / baseline:>7.2f}x "
+                f"{p50:>8.1f} {p99:>8.1f}" + (f"  ({errors} errors)" if errors else "")
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -17,3 +17,41 @@ DB_CONFIG = {
     "host": os.getenv("DB_HOST", "localhost"),
     "port": os.getenv("DB_PORT", "5432"),
 }
+
+# Training options for main.py. CF_SOLVER is "sgd" or "als"; SGD updates
+# per rating unless CF_BATCH_SIZE > 0 selects mini-batches of that size.
+# CF_N_JOBS sets the processes used for the parallel grid search and ALS
+# solves (0 uses every core). CF_TUNER is "grid" (full grid search) or
+# "halving" (successive halving), which trains every configuration for
+# CF_HALVING_MIN_EPOCHS and keeps the best 1/CF_HALVING_REDUCTION_FACTOR of
+# them for each longer rung.
+# CF_N_THREADS > 0 trains the final SGD model with that many Hogwild threads
+# (requires numba).
+# CF_TRAINING_MODE=warm_start updates the saved model with the ratings
+# recorded since it was trained, plus CF_REPLAY_SIZE older ratings.
+# CF_TRAINING_MODE=streaming trains from CF_CHUNK_SIZE-row chunks of the
+# rating table cached in CF_CHUNK_CACHE (rebuilt from the database unless
+# CF_REUSE_CHUNK_CACHE=1), shuffling CF_BUFFER_SIZE ratings at a time.
+# CF_DTYPE is the float type factors are trained and stored in; float32
+# halves their memory, the default float64 keeps the original precision.
+# Set CF_SERVING_DTYPE=float16 to save a half-size model for serving, kept only
+# if its test RMSE is within CF_RMSE_TOLERANCE of the trained model's.
+TRAINING_CONFIG = {
+    "mode": os.getenv("CF_TRAINING_MODE", "full"),
+    "warm_start_epochs": int(os.getenv("CF_WARM_START_EPOCHS", "3")),
+    "replay_size": int(os.getenv("CF_REPLAY_SIZE", "100000")),
+    "chunk_cache": os.getenv("CF_CHUNK_CACHE", "dataframes/rating_chunks"),
+    "reuse_chunk_cache": os.getenv("CF_REUSE_CHUNK_CACHE", "0") == "1",
+    "chunk_size": int(os.getenv("CF_CHUNK_SIZE", "100000")),
+    "buffer_size": int(os.getenv("CF_BUFFER_SIZE", "1000000")),
+    "solver": os.getenv("CF_SOLVER", "sgd"),
+    "tuner": os.getenv("CF_TUNER", "grid"),
+    "halving_min_epochs": int(os.getenv("CF_HALVING_MIN_EPOCHS", "2")),
+    "halving_reduction_factor": float(os.getenv("CF_HALVING_REDUCTION_FACTOR", "2")),
+    "batch_size": int(os.getenv("CF_BATCH_SIZE", "0")) or None,
+    "n_jobs": int(os.getenv("CF_N_JOBS", "0")) or None,
+    "n_threads": int(os.getenv("CF_N_THREADS", "0")) or None,
+    "dtype": os.getenv("CF_DTYPE", "float64"),
+    "serving_dtype": os.getenv("CF_SERVING_DTYPE", ""),
+    "rmse_tolerance": float(os.getenv("CF_RMSE_TOLERANCE", "0.001")),
+}
@@ -10,11 +10,11 @@ def get_connection():
     return psycopg2.connect(**DB_CONFIG)
 
 
-def fetch_data(query):
+def fetch_data(query, params=None):
     """Fetch data from the database."""
     conn = get_connection()
     cursor = conn.cursor()
-    cursor.execute(query)
+    cursor.execute(query, params)
     data = cursor.fetchall()
     columns = [desc[0] for desc in cursor.description]
     cursor.close()  # Close cursor before closing connection
@@ -27,6 +27,44 @@ def load_ratings():
     return fetch_data("SELECT * FROM rating;")
 
 
+def stream_ratings(chunk_size=100000):
+    """
+    Yield the ratings table as DataFrames of up to chunk_size rows.
+
+    Rows come from a server-side cursor, so only one chunk is held in memory.
+    Duplicate (user_id, movie_id) ratings are resolved in the query, keeping
+    the latest one like preprocess_ratings.
+    """
+    conn = get_connection()
+    cursor = conn.cursor(name="rating_stream")
+    cursor.itersize = chunk_size
+
+    try:
+        cursor.execute(
+            "SELECT DISTINCT ON (user_id, movie_id) * FROM rating "
+            "ORDER BY user_id, movie_id, time DESC;"
+        )
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            columns = [desc[0] for desc in cursor.description]
+            yield pd.DataFrame(rows, columns=columns)
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def load_ratings_since(last_time):
+    """Load ratings recorded after last_time from the database."""
+    return fetch_data("SELECT * FROM rating WHERE time > %s;", (last_time,))
+
+
+def load_ratings_sample(n_rows):
+    """Load a uniform random sample of n_rows ratings from the database."""
+    return fetch_data("SELECT * FROM rating ORDER BY random() LIMIT %s;", (n_rows,))
+
+
 def load_movies():
     """Load movies data from the database."""
     return fetch_data("SELECT * FROM movie;")
@@ -0,0 +1,130 @@
+# rating_chunks.py
+
+import json
+import os
+import numpy as np
+from data.ratings_matrix import grow_codes
+
+MANIFEST_NAME = "manifest.json"
+
+
+class RatingChunkCache:
+    """
+    Encoded ratings stored on disk as fixed-size .npz chunks.
+
+    Each chunk holds int32 user and movie codes and float32 ratings; the
+    code -> id tables and the totals needed for training are kept alongside,
+    so epochs can stream the chunks without the ratings ever being loaded
+    at once.
+    """
+
+    def __init__(self, directory):
+        with open(os.path.join(directory, MANIFEST_NAME)) as f:
+            manifest = json.load(f)
+
+        ids = np.load(os.path.join(directory, "ids.npz"))
+        self.directory = directory
+        self.user_ids = ids["user_ids"]
+        self.movie_ids = ids["movie_ids"]
+        self.n_chunks = manifest["n_chunks"]
+        self.n_ratings = manifest["n_ratings"]
+        self.global_mean = manifest["global_mean"]
+        self.last_rating_time = manifest["last_rating_time"]
+
+    @classmethod
+    def build(cls, chunks, directory):
+        """
+        Encode an iterable of rating DataFrames into directory.
+
+        Ids are assigned codes in order of first appearance as the chunks
+        go by, so only the id maps grow with the data.
+        """
+        os.makedirs(directory, exist_ok=True)
+        user_to_code, movie_to_code = {}, {}
+        n_chunks = n_ratings = 0
+        rating_sum = 0.0
+        last_rating_time = None
+
+        for chunk in chunks:
+            ratings = chunk["rating"].to_numpy(dtype=np.float32)
+            np.savez(
+                _chunk_path(directory, n_chunks),
+                user_codes=grow_codes(user_to_code, chunk["user_id"]).astype(np.int32),
+                movie_codes=grow_codes(movie_to_code, chunk["movie_id"]).astype(
+                    np.int32
+                ),
+                ratings=ratings,
+            )
+            n_chunks += 1
+            n_ratings += len(ratings)
+            rating_sum += float(ratings.sum(dtype=np.float64))
+
+            if "time" in chunk.columns and len(chunk):
+                chunk_last = chunk["time"].max()
+                if isinstance(chunk_last, np.generic):
+                    chunk_last = chunk_last.item()
+                if last_rating_time is None or chunk_last > last_rating_time:
+                    last_rating_time = chunk_last
+
+        np.savez(
+            os.path.join(directory, "ids.npz"),
+            user_ids=_id_array(user_to_code),
+            movie_ids=_id_array(movie_to_code),
+        )
+        with open(os.path.join(directory, MANIFEST_NAME), "w") as f:
+            json.dump(
+                {
+                    "n_chunks": n_chunks,
+                    "n_ratings": n_ratings,
+                    "global_mean": rating_sum / n_ratings if n_ratings else 0.0,
+                    "last_rating_time": last_rating_time,
+                },
+                f,
+                default=str,
+            )
+
+        return cls(directory)
+
+    @staticmethod
+    def exists(directory):
+        return os.path.exists(os.path.join(directory, MANIFEST_NAME))
+
+    @property
+    def n_users(self):
+        return len(self.user_ids)
+
+    @property
+    def n_movies(self):
+        return len(self.movie_ids)
+
+    def iter_chunks(self, shuffle=False):
+        """
+        Yield (user_codes, movie_codes, ratings) per chunk, in random chunk
+        order when shuffle is set.
+        """
+        order = np.arange(self.n_chunks)
+        if shuffle:
+            np.random.shuffle(order)
+
+        for i in order:
+            with np.load(_chunk_path(self.directory, i)) as chunk:
+                yield chunk["user_codes"], chunk["movie_codes"], chunk["ratings"]
+
+    def codes(self):
+        """
+        All user and movie codes, concatenated in chunk order.
+        """
+        if not self.n_chunks:
+            return np.empty(0, dtype=np.int32), np.empty(0, dtype=np.int32)
+        user_codes, movie_codes, _ = zip(*self.iter_chunks())
+        return np.concatenate(user_codes), np.concatenate(movie_codes)
+
+
+def _chunk_path(directory, i):
+    return os.path.join(directory, f"chunk_{i:06d}.npz")
+
+
+def _id_array(id_to_code):
+    # Dicts keep insertion order, which is the code order.
+    ids = np.asarray(list(id_to_code))
+    return ids.astype(str) if ids.dtype == object else ids
@@ -0,0 +1,320 @@
+# ratings_matrix.py
+
+import numpy as np
+import pandas as pd
+
+
+class RatingsMatrix:
+    """
+    Ratings with user and movie ids factorized once into dense int32 codes.
+
+    user_ids and movie_ids are the code -> id tables (pd.Index, so
+    get_indexer maps ids back to codes). Matrices produced by take(),
+    time_split() and compact() of the same source share its tables until
+    they are compacted, so their codes can be compared directly.
+    """
+
+    def __init__(
+        self, user_codes, movie_codes, ratings, timestamps, user_ids, movie_ids
+    ):
+        self.user_codes = user_codes
+        self.movie_codes = movie_codes
+        self.ratings = ratings
+        self.timestamps = timestamps
+        self.user_ids = user_ids
+        self.movie_ids = movie_ids
+        self._csr = None
+        self._csc = None
+        self._compact = None
+
+    @classmethod
+    def from_dataframe(cls, ratings_df):
+        """
+        Build a matrix from a DataFrame with user_id, movie_id, rating and
+        an optional time column (epoch seconds, datetimes or date strings).
+        """
+        user_codes, user_ids = pd.factorize(ratings_df["user_id"])
+        movie_codes, movie_ids = pd.factorize(ratings_df["movie_id"])
+
+        timestamps = None
+        if "time" in ratings_df.columns:
+            timestamps = epoch_seconds(ratings_df["time"])
+
+        return cls(
+            user_codes.astype(np.int32),
+            movie_codes.astype(np.int32),
+            ratings_df["rating"].to_numpy(dtype=np.float32),
+            timestamps,
+            pd.Index(user_ids),
+            pd.Index(movie_ids),
+        )
+
+    def __len__(self):
+        return len(self.ratings)
+
+    @property
+    def n_users(self):
+        return len(self.user_ids)
+
+    @property
+    def n_movies(self):
+        return len(self.movie_ids)
+
+    def take(self, rows):
+        """
+        Select ratings by position or boolean mask, keeping the id tables.
+        """
+        return RatingsMatrix(
+            self.user_codes[rows],
+            self.movie_codes[rows],
+            self.ratings[rows],
+            None if self.timestamps is None else self.timestamps[rows],
+            self.user_ids,
+            self.movie_ids,
+        )
+
+    def time_split(self, test_size=0.2, validation_size=0.2):
+        """
+        Split by timestamp like data.preprocessing.time_based_split.
+        """
+        order = np.argsort(self.timestamps, kind="stable")
+        n = len(order)
+
+        test_idx = int(n * (1 - test_size))
+        val_idx = int(test_idx * (1 - validation_size))
+
+        return (
+            self.take(order[:val_idx]),
+            self.take(order[val_idx:test_idx]),
+            self.take(order[test_idx:]),
+        )
+
+    def compact(self):
+        """
+        Drop ids without ratings from the tables and re-number the codes,
+        as needed for training on a split.
+        """
+        if self._compact is None:
+            user_codes, user_ids = _compact_codes(self.user_codes, self.user_ids)
+            movie_codes, movie_ids = _compact_codes(self.movie_codes, self.movie_ids)
+            self._compact = RatingsMatrix(
+                user_codes,
+                movie_codes,
+                self.ratings,
+                self.timestamps,
+                user_ids,
+                movie_ids,
+            )
+        return self._compact
+
+    def user_counts(self):
+        """
+        Number of ratings per user code.
+        """
+        return np.bincount(self.user_codes, minlength=self.n_users)
+
+    def present_users(self):
+        """
+        Boolean mask over user codes that have at least one rating.
+        """
+        return self.user_counts() > 0
+
+    def present_movies(self):
+        """
+        Boolean mask over movie codes that have at least one rating.
+        """
+        return np.bincount(self.movie_codes, minlength=self.n_movies) > 0
+
+    @property
+    def csr(self):
+        """
+        Ratings grouped by user: (indptr, movie_codes, ratings).
+        """
+        if self._csr is None:
+            self._csr = compress(
+                self.user_codes, self.movie_codes, self.ratings, self.n_users
+            )
+        return self._csr
+
+    @property
+    def csc(self):
+        """
+        Ratings grouped by movie: (indptr, user_codes, ratings).
+        """
+        if self._csc is None:
+            self._csc = compress(
+                self.movie_codes, self.user_codes, self.ratings, self.n_movies
+            )
+        return self._csc
+
+    def codes_in(self, user_to_idx, movie_to_idx):
+        """
+        Map this matrix's codes to the row indices of a model's id dicts,
+        with -1 for ids the model does not know. Only the id tables are
+        looked up; the per-rating mapping is a NumPy gather.
+        """
+        user_rows = _lookup_table(user_to_idx, self.user_ids)
+        movie_rows = _lookup_table(movie_to_idx, self.movie_ids)
+        return user_rows[self.user_codes], movie_rows[self.movie_codes]
+
+
+def compress(row_codes, col_codes, values, n_rows):
+    """
+    Build a compressed sparse row layout (indptr, indices, data).
+    """
+    order = np.argsort(row_codes, kind="stable")
+    indptr = np.zeros(n_rows + 1, dtype=np.int64)
+    np.cumsum(np.bincount(row_codes, minlength=n_rows), out=indptr[1:])
+    return indptr, col_codes[order], values[order]
+
+
+def grow_codes(id_to_code, ids):
+    """
+    Map ids to codes, adding unseen ids to id_to_code in place with the next
+    free code. Only the distinct ids of the batch are looked up.
+    """
+    codes, unique_ids = pd.factorize(ids)
+    unique_codes = np.empty(len(unique_ids), dtype=np.int64)
+
+    for i, id_ in enumerate(unique_ids):
+        unique_codes[i] = id_to_code.setdefault(id_, len(id_to_code))
+
+    return unique_codes[codes]
+
+
+def lookup_codes(id_to_code, ids):
+    """
+    Map ids to codes with -1 for unknown ids. Only the distinct ids are
+    looked up in the dict; the per-row mapping is a NumPy gather.
+    """
+    codes, unique_ids = pd.factorize(np.asarray(ids))
+    # Missing ids get code -1, which then picks the trailing -1.
+    return np.append(_lookup_table(id_to_code, unique_ids), -1)[codes]
+
+
+class IdIndex:
+    """
+    Read-only id -> row mapping over an array of ids, a drop-in for the
+    model's id dicts (in, [], get, items, len) that can be memory-mapped.
+
+    ids[row] is the id of a model row and order is the argsort of ids;
+    lookups are np.searchsorted calls instead of dict probes. Ids are int64
+    or fixed-width strings.
+    """
+
+    def __init__(self, ids, order):
+        self.ids = ids
+        self.order = order
+
+    @classmethod
+    def from_dict(cls, id_to_idx):
+        """
+        Build an index from an id -> row dict covering rows 0..n-1.
+        """
+        if isinstance(id_to_idx, IdIndex):
+            return id_to_idx
+
+        ids = [None] * len(id_to_idx)
+        for id_, i in id_to_idx.items():
+            ids[i] = id_
+        ids = _typed_ids(ids)
+        if ids is None:
+            raise ValueError("Ids must be all integers or all strings")
+        return cls(ids, np.argsort(ids, kind="stable"))
+
+    def lookup(self, ids):
+        """
+        Rows of many ids at once, with -1 for unknown ids.
+        """
+        values = _typed_ids(ids)
+        if values is None:
+            # Mixed types can only be matched one by one.
+            return np.fromiter(
+                (self.get(id_, -1) for id_ in ids), dtype=np.int64, count=len(ids)
+            )
+        return self._rows(values)
+
+    def get(self, id_, default=None):
+        values = _typed_ids([id_])
+        if values is None:
+            return default
+        row = self._rows(values)[0]
+        return default if row < 0 else int(row)
+
+    def __getitem__(self, id_):
+        row = self.get(id_)
+        if row is None:
+            raise KeyError(id_)
+        return row
+
+    def __contains__(self, id_):
+        return self.get(id_) is not None
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def keys(self):
+        return self.ids.tolist()
+
+    def values(self):
+        return range(len(self.ids))
+
+    def items(self):
+        return zip(self.keys(), self.values())
+
+    def _rows(self, values):
+        if not len(self.ids) or values.dtype.kind != self.ids.dtype.kind:
+            return np.full(len(values), -1, dtype=np.int64)
+
+        positions = np.searchsorted(self.ids, values, sorter=self.order)
+        rows = self.order[np.minimum(positions, len(self.order) - 1)]
+        return np.where(self.ids[rows] == values, rows, -1).astype(np.int64)
+
+
+def epoch_seconds(times):
+    """
+    Convert a time column (epoch seconds, datetimes or date strings) to
+    int64 epoch seconds.
+    """
+    if pd.api.types.is_numeric_dtype(times):
+        return times.to_numpy(dtype=np.int64)
+
+    times = pd.to_datetime(times)
+    return ((times - pd.Timestamp(0)) // pd.Timedelta(seconds=1)).to_numpy(
+        dtype=np.int64
+    )
+
+
+def _compact_codes(codes, ids):
+    present = np.bincount(codes, minlength=len(ids)) > 0
+    new_codes = (np.cumsum(present) - 1).astype(np.int32)
+    return new_codes[codes], ids[present]
+
+
+def _typed_ids(ids):
+    """
+    ids as an int64 or fixed-width string array, or None for mixed types.
+    """
+    values = np.asarray(ids)
+    if values.dtype.kind in "iu" or not values.size:
+        return values.astype(np.int64)
+    if values.dtype.kind == "U":
+        return values
+
+    kind = pd.api.types.infer_dtype(values, skipna=False)
+    if kind == "integer":
+        return values.astype(np.int64)
+    if kind == "string":
+        return values.astype(str)
+    return None
+
+
+def _lookup_table(id_to_idx, ids):
+    if isinstance(id_to_idx, IdIndex):
+        return id_to_idx.lookup(ids)
+    return np.fromiter(
+        (id_to_idx.get(id_, -1) for id_ in ids), dtype=np.int64, count=len(ids)
+    )
@@ -0,0 +1,352 @@
+import os
+import threading
+from collections import Counter
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from frontend.telemetry_store import parse_times
+
+_EPOCH = datetime(1970, 1, 1)
+# User ids of events that belong to no single user, as read back as text.
+_MISSING_USER_IDS = {"", "None", "nan"}
+
+
+class AnalyticsAggregator:
+    """
+    Running dashboard aggregates, updated as telemetry and ratings arrive.
+
+    Each hour of the last retention_days days, and each minute of the last
+    minute_hours hours, has a bucket with event counts, a histogram of
+    rating values and per-movie rating sums and counts (of ratings above 0,
+    as shown on the dashboard); an all-time bucket covers everything.
+    Unique users are counted with HyperLogLog registers (2**precision of
+    them) per hour and all-time, and exactly per minute. query() merges the
+    hour buckets inside the window and the minute buckets at its start, so
+    its cost depends on the window length in hours, not on the number of
+    events. Windows that start before the minute buckets are rounded to the
+    nearest hour, which keeps memory at a few hundred buckets however long
+    the retention.
+
+    version counts the updates, and wait_for_change() lets a stream sleep
+    until the next one instead of polling.
+
+    Times are naive datetimes or epoch seconds, like the telemetry logs.
+    Each process adds what it logs as it happens, on top of the history it
+    was rebuilt from; sync() adds what other processes have written to the
+    store since.
+    """
+
+    def __init__(self, retention_days=31, precision=11, minute_hours=2):
+        self.retention_minutes = retention_days * 1440
+        self.minute_retention = minute_hours * 60
+        self.precision = precision
+        self._minutes = {}
+        self._hours = {}
+        self._total = self._new_bucket(per_minute=False)
+        self.version = 0
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        # Store rows read so far, per table (see TelemetryStore.read_new).
+        self._marks = {}
+        self._sync_lock = threading.Lock()
+
+    def add_event(self, when, event, user_id):
+        # Events of no single user (user_id None) count, but not as a user.
+        user_ids = [user_id] if _has_user([user_id])[0] else []
+        user_hash = _hash_users(user_ids)
+        with self._lock:
+            for bucket in self._buckets(_seconds(when) // 60):
+                bucket["events"][event] += 1
+                self._add_users(bucket, user_hash)
+            self._notify()
+
+    def add_rating(self, when, movie_name, rating):
+        seconds = _parse_seconds([when])
+        try:
+            rating = float(rating)
+        except (TypeError, ValueError):
+            return
+        if not len(seconds) or np.isnan(rating):
+            return
+        with self._lock:
+            for bucket in self._buckets(int(seconds[0]) // 60):
+                _count_rating(bucket, movie_name, rating, 1)
+            self._notify()
+
+    def rebuild(self, store):
+        """
+        Reset the aggregates and refill them from a TelemetryStore, one day
+        partition at a time.
+        """
+        with self._sync_lock:
+            with self._lock:
+                self._minutes, self._hours = {}, {}
+                self._total = self._new_bucket(per_minute=False)
+            self._marks = {}
+            self._read_new(store, skip_pid=None)
+
+    def sync(self, store):
+        """
+        Add the rows other processes have written to the store since the
+        last rebuild or sync. This process's own rows are skipped, since
+        they were added as they were logged.
+        """
+        with self._sync_lock:
+            self._read_new(store, skip_pid=os.getpid())
+
+    def _read_new(self, store, skip_pid):
+        for events in store.read_new(
+            "telemetry", self._marks.setdefault("telemetry", {}), skip_pid=skip_pid
+        ):
+            self._add_events(events)
+        for ratings in store.read_new(
+            "ratings",
+            self._marks.setdefault("ratings", {}),
+            columns=["movie_name", "rating"],
+            skip_pid=skip_pid,
+        ):
+            self._add_ratings(ratings)
+
+    def query(self, start=None):
+        """
+        Aggregates of everything at or after start (all time when None):
+        a dict with events (name -> count), ratings (value -> count),
+        movies (name -> [rating sum, count]) and unique_users (estimate).
+        """
+        with self._lock:
+            if start is None:
+                buckets = [self._total]
+            else:
+                first_minute = -(-_seconds(start) // 60)
+                if first_minute >= self._now_minute() - self.minute_retention:
+                    first_hour = -(-first_minute // 60)
+                    buckets = [
+                        self._minutes[minute]
+                        for minute in range(first_minute, first_hour * 60)
+                        if minute in self._minutes
+                    ]
+                else:
+                    first_hour = (first_minute + 30) // 60
+                    buckets = []
+                buckets += [
+                    bucket for hour, bucket in self._hours.items() if hour >= first_hour
+                ]
+
+            result = {"events": Counter(), "ratings": Counter(), "movies": {}}
+            registers = np.zeros(2**self.precision, dtype=np.uint8)
+            for bucket in buckets:
+                result["events"].update(bucket["events"])
+                result["ratings"].update(bucket["ratings"])
+                for movie, (total, count) in bucket["movies"].items():
+                    movie_total = result["movies"].setdefault(movie, [0.0, 0])
+                    movie_total[0] += total
+                    movie_total[1] += count
+                users = bucket["users"]
+                if isinstance(users, set):
+                    self._update_registers(registers, np.fromiter(users, np.uint64))
+                else:
+                    np.maximum(registers, users, out=registers)
+
+        result["unique_users"] = _estimate(registers)
+        return result
+
+    def wait_for_change(self, version, timeout=None):
+        """
+        Block until the aggregates have changed since version, or timeout
+        seconds have passed. Returns the current version.
+        """
+        with self._changed:
+            self._changed.wait_for(lambda: self.version != version, timeout)
+            return self.version
+
+    def _notify(self):
+        # Called with the lock held.
+        self.version += 1
+        self._changed.notify_all()
+
+    def _add_events(self, events):
+        if events.empty:
+            return
+        frame = pd.DataFrame(
+            {
+                "minute": _epoch_seconds(events["time"]) // 60,
+                "event": np.asarray(events["event"], dtype=object),
+                "user": _hash_users(events["user_id"]),
+            }
+        )
+        counts = frame.groupby(["minute", "event"]).size()
+        users = frame[_has_user(events["user_id"])].drop_duplicates(["minute", "user"])
+
+        with self._lock:
+            for (minute, event), count in counts.items():
+                for bucket in self._buckets(minute):
+                    bucket["events"][event] += int(count)
+            for minute, user_hashes in users.groupby("minute")["user"]:
+                for bucket in self._buckets(minute):
+                    self._add_users(bucket, user_hashes.to_numpy())
+            self._notify()
+
+    def _add_ratings(self, ratings):
+        ratings = ratings[ratings["rating"].notna()]
+        if ratings.empty:
+            return
+        frame = pd.DataFrame(
+            {
+                "minute": _epoch_seconds(ratings["time"]) // 60,
+                "movie": np.asarray(ratings["movie_name"], dtype=object),
+                "rating": ratings["rating"].to_numpy(dtype=float),
+            }
+        )
+        counts = frame.groupby(["minute", "movie", "rating"]).size()
+
+        with self._lock:
+            for (minute, movie, rating), count in counts.items():
+                for bucket in self._buckets(minute):
+                    _count_rating(bucket, movie, float(rating), int(count))
+            self._notify()
+
+    def _buckets(self, minute):
+        """
+        The minute, hour and all-time buckets a minute falls into; no
+        minute bucket for minutes older than minute_hours, and only the
+        all-time one for minutes older than the retention period.
+        """
+        minute = int(minute)
+        now_minute = self._now_minute()
+        cutoff = now_minute - self.retention_minutes
+        if minute < cutoff:
+            return [self._total]
+
+        hour = minute // 60
+        if hour not in self._hours:
+            self._hours[hour] = self._new_bucket(per_minute=False)
+            self._prune(now_minute)
+        buckets = [self._hours[hour], self._total]
+        if minute >= now_minute - self.minute_retention:
+            if minute not in self._minutes:
+                self._minutes[minute] = self._new_bucket(per_minute=True)
+            buckets.append(self._minutes[minute])
+        return buckets
+
+    def _prune(self, now_minute):
+        # Runs once per new hour, so it costs nothing per event.
+        minute_cutoff = now_minute - self.minute_retention
+        hour_cutoff = (now_minute - self.retention_minutes) // 60
+        self._minutes = {m: b for m, b in self._minutes.items() if m >= minute_cutoff}
+        self._hours = {h: b for h, b in self._hours.items() if h >= hour_cutoff}
+
+    def _now_minute(self):
+        return _seconds(datetime.now()) // 60
+
+    def _new_bucket(self, per_minute):
+        return {
+            "events": Counter(),
+            "ratings": Counter(),
+            "movies": {},
+            "users": (
+                set() if per_minute else np.zeros(2**self.precision, dtype=np.uint8)
+            ),
+        }
+
+    def _add_users(self, bucket, user_hashes):
+        if isinstance(bucket["users"], set):
+            bucket["users"].update(user_hashes.tolist())
+        else:
+            self._update_registers(bucket["users"], user_hashes)
+
+    def _update_registers(self, registers, user_hashes):
+        """
+        HyperLogLog update: the top precision bits of a hash pick the
+        register, which keeps the highest position of the first 1 bit in
+        the remaining bits.
+        """
+        if not len(user_hashes):
+            return
+        user_hashes = np.asarray(user_hashes, dtype=np.uint64)
+        rest_bits = 64 - self.precision
+        index = (user_hashes >> np.uint64(rest_bits)).astype(np.intp)
+        rest = user_hashes & np.uint64((1 << rest_bits) - 1)
+        # rest < 2**53, so it converts to float exactly and frexp gives its
+        # bit length.
+        bit_length = np.frexp(rest.astype(np.float64))[1]
+        np.maximum.at(registers, index, (rest_bits - bit_length + 1).astype(np.uint8))
+
+
+def _count_rating(bucket, movie, rating, count):
+    bucket["ratings"][rating] += count
+    if rating > 0:
+        movie_total = bucket["movies"].setdefault(movie, [0.0, 0])
+        movie_total[0] += rating * count
+        movie_total[1] += count
+
+
+def _estimate(registers):
+    """
+    HyperLogLog cardinality estimate, with linear counting for small sets.
+    """
+    m = len(registers)
+    zeros = np.count_nonzero(registers == 0)
+    if zeros == m:
+        return 0
+    estimate = (
+        0.7213 / (1 + 1.079 / m) * m * m / np.sum(np.ldexp(1.0, -registers.astype(int)))
+    )
+    if estimate <= 2.5 * m and zeros:
+        estimate = m * np.log(m / zeros)
+    return int(round(estimate))
+
+
+class AggregatorSync(threading.Thread):
+    """
+    Daemon thread that calls aggregator.sync(store) every interval
+    seconds, so each serving process also counts what the others log.
+    """
+
+    def __init__(self, aggregator, store, interval):
+        super().__init__(daemon=True, name="analytics-sync")
+        self.aggregator = aggregator
+        self.store = store
+        self.interval = interval
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            try:
+                self.aggregator.sync(self.store)
+            except Exception as e:
+                print(f"Error syncing analytics: {e}")
+
+    def stop(self):
+        self._stopped.set()
+
+
+def _has_user(user_ids):
+    """
+    Mask of the ids that name a user; a missing id reads back from the
+    store as "None", or from an imported CSV as "nan".
+    """
+    return np.array(
+        [u is not None and str(u) not in _MISSING_USER_IDS for u in user_ids],
+        dtype=bool,
+    )
+
+
+def _hash_users(user_ids):
+    # Ids are compared as strings: the store keeps them as text while
+    # request handlers may pass numbers.
+    return pd.util.hash_array(np.asarray([str(u) for u in user_ids], dtype=object))
+
+
+def _seconds(when):
+    if isinstance(when, datetime):
+        return int((when.replace(tzinfo=None) - _EPOCH).total_seconds())
+    return int(when)
+
+
+def _parse_seconds(values):
+    times = parse_times(values)
+    return times[~np.isnat(times)].astype("datetime64[s]").astype(np.int64)
+
+
+def _epoch_seconds(times):
+    return times.to_numpy(dtype="datetime64[s]").astype(np.int64)
@@ -0,0 +1,82 @@
+import threading
+
+
+class ModelHolder:
+    """
+    Holds the active serving state (model, data and indexes) and swaps in a
+    new one when the model artifact changes.
+
+    load_state() builds a complete state and get_version() cheaply
+    identifies the artifact on disk (e.g. its mtime). A watcher thread polls
+    get_version() and, when it changes, builds the new state in the
+    background; requests keep using the old state until the new one is
+    assigned in a single step. If loading fails the old state stays active
+    and that version is not retried until the artifact changes again.
+    """
+
+    def __init__(self, load_state, get_version, on_swap=None):
+        # The state and its version are replaced together as one tuple.
+        self._active = (None, None)
+        self.last_error = None
+        self._load_state = load_state
+        self._get_version = get_version
+        self._on_swap = on_swap
+        self._failed_version = None
+        self._reload_lock = threading.Lock()
+        self._stopped = threading.Event()
+
+    @property
+    def state(self):
+        return self._active[0]
+
+    @property
+    def version(self):
+        return self._active[1]
+
+    def snapshot(self):
+        """
+        The active (state, version) pair; a request should take one
+        snapshot and use it throughout.
+        """
+        return self._active
+
+    def reload(self):
+        """
+        Load the artifact if its version differs from the active one.
+        Returns True if a new state was swapped in.
+        """
+        with self._reload_lock:
+            version = self._get_version()
+            if version is None or version in (self.version, self._failed_version):
+                return False
+
+            try:
+                state = self._load_state()
+            except Exception as e:
+                print(f"Error loading model version {version}: {e}")
+                self.last_error = str(e)
+                self._failed_version = version
+                return False
+
+            self._active = (state, version)
+            self.last_error = None
+            if self._on_swap is not None:
+                self._on_swap(state)
+            return True
+
+    def start_watching(self, interval):
+        """
+        Poll for a new artifact every interval seconds on a daemon thread.
+        """
+        thread = threading.Thread(
+            target=self._watch, args=(interval,), daemon=True, name="model-watch"
+        )
+        thread.start()
+        return thread
+
+    def stop(self):
+        self._stopped.set()
+
+    def _watch(self, interval):
+        while not self._stopped.wait(interval):
+            self.reload()
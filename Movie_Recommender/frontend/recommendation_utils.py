@@ -1,113 +1,50 @@
-import numpy as np
-import json
+# predict_rating and recommend_movies_for_user are re-exported for frontend
+# callers.
+from model.evaluation import predict_rating
+from utils.recommender import (
+    popular_movie_ids,
+    recommend_movies_for_user,
+    top_movies_for_users,
+)
+from utils.serving_index import movie_titles
+
+
+def recommend_movies_for_users(
+    model_data,
+    movies_df,
+    ratings_df,
+    user_ids,
+    num_recommendations=10,
+    serving_index=None,
+    popularity="all_time",
+):
+    """
+    recommend_movies_for_user for many users at once.
 
+    The known users are scored together by top_movies_for_users; the
+    unknown ones all get the same popularity list, built once.
 
-def predict_rating(model_data, user_id, movie_id):
-    """
-    Predict rating for a user-movie pair.
+    Returns:
+        list: Recommended movie titles for each user ID, in order.
     """
     user_to_idx = model_data["user_to_idx"]
-    movie_to_idx = model_data["movie_to_idx"]
-
-    if user_id not in user_to_idx or movie_id not in movie_to_idx:
-        return None
-
-    u = user_to_idx[user_id]
-    m = movie_to_idx[movie_id]
-    user_factors = model_data["user_factors"]
-    movie_factors = model_data["movie_factors"]
-    user_biases = model_data["user_biases"]
-    movie_biases = model_data["movie_biases"]
-    global_mean = model_data["global_mean"]
-
-    pred = (
-        global_mean
-        + user_biases[u]
-        + movie_biases[m]
-        + np.dot(user_factors[u], movie_factors[m])
-    )
+    known = [user_id for user_id in user_ids if user_id in user_to_idx]
 
-    return max(1, min(5, pred))
-
-
-def recommend_movies_for_user(
-    model_data, movies_df, ratings_df, user_id, num_recommendations=10
-):
-    """
-    Recommend movies for a user.
-    """
-    if user_id not in model_data["user_to_idx"]:
-        print(
-            f"User {user_id} not found in training data. "
-            "Using popularity-based recommendations."
+    titles = {}
+    if known:
+        top_movie_ids = top_movies_for_users(
+            model_data, ratings_df, known, num_recommendations, serving_index
         )
-        popular_movies = (
-            ratings_df.groupby("movie_id")["rating"]
-            .count()
-            .sort_values(ascending=False)
-            .head(num_recommendations)
-            .index
+        for user_id, movie_ids in zip(known, top_movie_ids):
+            titles[user_id] = movie_titles(movie_ids, movies_df, serving_index)
+
+    if len(titles) < len(set(user_ids)):
+        popular = movie_titles(
+            popular_movie_ids(
+                ratings_df, num_recommendations, serving_index, popularity
+            ),
+            movies_df,
+            serving_index,
         )
-        recommendations = []
-
-        for movie_id in popular_movies:
-            movie_row = movies_df[movies_df["movie_id"] == movie_id]
-
-            if not movie_row.empty:
-                if "json_data" in movies_df.columns:
-                    try:
-                        json_str = movie_row["json_data"].iloc[0]
-                        json_data = (
-                            json.loads(json_str)
-                            if isinstance(json_str, str)
-                            else json_str
-                        )
-                        title = json_data.get("title", movie_id)
-                    except (json.JSONDecodeError, AttributeError):
-                        title = movie_id
-                else:
-                    title = movie_id
-                recommendations.append(title)
-            else:
-                recommendations.append(movie_id)
-
-        return recommendations
-
-    user_rated_movies = set(ratings_df[ratings_df["user_id"] == user_id]["movie_id"])
-    all_movies = set(model_data["movie_to_idx"].keys())
-    candidate_movies = list(all_movies - user_rated_movies)
-
-    predictions = [
-        (movie_id, predict_rating(model_data, user_id, movie_id))
-        for movie_id in candidate_movies
-    ]
-
-    predictions = [
-        (movie_id, rating) for movie_id, rating in predictions if rating is not None
-    ]
-
-    predictions.sort(key=lambda x: x[1], reverse=True)
-    top_movie_ids = [movie_id for movie_id, _ in predictions[:num_recommendations]]
-
-    recommendations = []
-
-    for movie_id in top_movie_ids:
-        movie_row = movies_df[movies_df["movie_id"] == movie_id]
-
-        if not movie_row.empty:
-            if "json_data" in movies_df.columns:
-                try:
-                    json_str = movie_row["json_data"].iloc[0]
-                    json_data = (
-                        json.loads(json_str) if isinstance(json_str, str) else json_str
-                    )
-                    title = json_data.get("title", movie_id)
-                except (json.JSONDecodeError, AttributeError):
-                    title = movie_id
-            else:
-                title = movie_id
-            recommendations.append(title)
-        else:
-            recommendations.append(movie_id)
-
-    return recommendations
+        return [titles.get(user_id, popular) for user_id in user_ids]
+    return [titles[user_id] for user_id in user_ids]
@@ -0,0 +1,436 @@
+import glob
+import os
+import time
+from datetime import date, timedelta
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+# Columns kept per table, as (row position, kind). Every table also has a
+# time column at TIME_COLUMNS[table]; categorical columns are stored as
+# int32 codes with a per-segment table of values.
+TABLES = {
+    "telemetry": {"event": (1, "category"), "user_id": (2, "category")},
+    "ratings": {
+        "user_id": (0, "category"),
+        "movie_name": (1, "category"),
+        "rating": (2, "float32"),
+    },
+}
+TIME_COLUMNS = {"telemetry": 0, "ratings": 4}
+COMPACTED_FILE = "compacted.npz"
+# Sorts before every segment key; see _segment_key.
+_NO_SEGMENT = (-1, -1)
+# Without fcntl, a compaction lock file older than this is assumed to be
+# left by a process that died while merging.
+_STALE_LOCK_SECONDS = 600
+# Unless told the values are ISO 8601, pandas 2 infers one format from the
+# first value and rejects the others; pandas 1.5 has no such option, and
+# already parses each ISO 8601 value on its own.
+_ISO_FORMAT = {"format": "ISO8601"} if int(pd.__version__.split(".")[0]) >= 2 else {}
+
+
+class TelemetryStore:
+    """
+    Telemetry and ratings in day partitions of compact column segments.
+
+    Each append writes one .npz segment per day it covers, under
+    directory/<table>/<YYYY-MM-DD>/, with the time as int64 epoch seconds,
+    categorical columns (event names, user ids, movie names) as int32 codes
+    plus the segment's own category table, and ratings as float32. Segments
+    are never modified, so several processes can append at once.
+
+    Reads only open the partitions that overlap the requested time window
+    and only load the requested columns. compact() merges the segments of
+    days that are over into one file and prune() deletes old days.
+    """
+
+    def __init__(self, directory, retention_days=None):
+        self.directory = directory
+        self.retention_days = retention_days
+        self._sequence = 0
+        self._maintained_day = None
+
+    def append(self, table, rows):
+        """
+        Store rows in the layout of the table's CSV file (see TABLES).
+        Rows with an unparseable time are skipped.
+        """
+        if not rows:
+            return
+
+        columns = list(zip(*rows))
+        times = parse_times(columns[TIME_COLUMNS[table]])
+        valid = ~np.isnat(times)
+        seconds = times[valid].astype("datetime64[s]").astype(np.int64)
+        days = times[valid].astype("datetime64[D]")
+
+        values = {}
+        for name, (position, kind) in TABLES[table].items():
+            column = np.asarray(columns[position], dtype=object)[valid]
+            if kind == "category":
+                values[name] = column.astype(str)
+            else:
+                values[name] = pd.to_numeric(column, errors="coerce").astype(kind)
+
+        for day in np.unique(days):
+            in_day = days == day
+            partition = self._partition(table, str(day))
+            os.makedirs(partition, exist_ok=True)
+            self._sequence += 1
+            name = f"{os.getpid()}-{time.time_ns()}-{self._sequence}.npz"
+            path = os.path.join(partition, name)
+            _save_segment(
+                path,
+                seconds[in_day],
+                {name: column[in_day] for name, column in values.items()},
+            )
+
+        self._maintain()
+
+    def read(self, table, start=None, end=None, columns=None):
+        """
+        Rows with start <= time < end as a DataFrame with a datetime time
+        column and the requested columns (all by default); categorical
+        columns come back as pandas Categoricals.
+        """
+        columns = list(TABLES[table]) if columns is None else columns
+        start_day = None if start is None else pd.Timestamp(start).date()
+        end_day = None if end is None else pd.Timestamp(end).date()
+
+        times, parts = [], {name: [] for name in columns}
+        for day in self.partitions(table):
+            if (start_day and day < start_day) or (end_day and day > end_day):
+                continue
+            for path in self._segments(table, day):
+                try:
+                    segment = np.load(path)
+                except FileNotFoundError:
+                    # Merged away by a concurrent compaction.
+                    continue
+                with segment:
+                    seconds = segment["time"]
+                    keep = _in_window(seconds, start, end)
+                    times.append(seconds[keep])
+                    for name in columns:
+                        parts[name].append(_read_column(segment, name, keep))
+
+        return _frame(table, times, parts)
+
+    def read_new(self, table, marks, columns=None, skip_pid=None):
+        """
+        Rows appended since the last call with the same marks dict, as one
+        DataFrame like read() per day partition with new rows.
+
+        Each process names its segments <pid>-<time_ns>-<n>.npz and writes
+        them one after the other, so marks only keeps the newest segment
+        read per day and process; compacted files list the segments they
+        were merged from, so their rows are matched the same way. Rows
+        written by process skip_pid are left out.
+        """
+        columns = list(TABLES[table]) if columns is None else columns
+        skip_pid = None if skip_pid is None else str(skip_pid)
+        for day in self.partitions(table):
+            day_marks = marks.setdefault(day, {"segments": {}, "compacted": None})
+            times, parts = [], {name: [] for name in columns}
+
+            compacted = os.path.join(self._partition(table, str(day)), COMPACTED_FILE)
+            try:
+                stat = os.stat(compacted)
+                changed = day_marks["compacted"] != (stat.st_mtime_ns, stat.st_size)
+                if changed:
+                    with np.load(compacted) as segment:
+                        keep = _unread_rows(segment, day_marks["segments"], skip_pid)
+                        times.append(segment["time"][keep])
+                        for name in columns:
+                            parts[name].append(_read_column(segment, name, keep))
+                    day_marks["compacted"] = (stat.st_mtime_ns, stat.st_size)
+            except FileNotFoundError:
+                pass
+
+            # A segment that disappears was merged into the compacted file;
+            # the later ones of its process wait until that is read.
+            merged_away = set()
+            for path in self._segments(table, day):
+                name = os.path.basename(path)
+                if name == COMPACTED_FILE:
+                    continue
+                pid, key = _segment_key(name)
+                if pid == skip_pid or pid in merged_away:
+                    continue
+                if key <= day_marks["segments"].get(pid, _NO_SEGMENT):
+                    continue
+                try:
+                    segment = np.load(path)
+                except FileNotFoundError:
+                    merged_away.add(pid)
+                    continue
+                with segment:
+                    times.append(segment["time"])
+                    for name in columns:
+                        parts[name].append(_read_column(segment, name))
+                day_marks["segments"][pid] = key
+
+            if times and sum(len(t) for t in times):
+                yield _frame(table, times, {name: parts[name] for name in columns})
+
+    def partitions(self, table):
+        """
+        Days that have data, oldest first.
+        """
+        table_dir = os.path.join(self.directory, table)
+        if not os.path.isdir(table_dir):
+            return []
+
+        days = []
+        for name in os.listdir(table_dir):
+            try:
+                days.append(date.fromisoformat(name))
+            except ValueError:
+                continue
+        return sorted(days)
+
+    def compact(self, table, before=None):
+        """
+        Merge the segments of each day before `before` (default today) into
+        one file. A lock file keeps two processes from merging the same day.
+        """
+        before = before or date.today()
+        for day in self.partitions(table):
+            if day >= before:
+                break
+            if len(self._segments(table, day)) < 2:
+                continue
+
+            path = os.path.join(self._partition(table, str(day)), ".compacting")
+            lock = _take_lock(path)
+            if lock is None:
+                continue
+            try:
+                # Another process may have merged the day meanwhile.
+                segments = self._segments(table, day)
+                if len(segments) >= 2:
+                    self._merge(table, day, segments)
+            finally:
+                os.remove(path)
+                os.close(lock)
+
+    def prune(self, table, retention_days):
+        """
+        Delete the partitions older than retention_days days.
+        """
+        cutoff = date.today() - timedelta(days=retention_days)
+        for day in self.partitions(table):
+            if day >= cutoff:
+                break
+            partition = self._partition(table, str(day))
+            for path in glob.glob(os.path.join(partition, "*")):
+                os.remove(path)
+            os.rmdir(partition)
+
+    def import_csv(self, table, path, chunk_size=100000):
+        """
+        Load an existing CSV log (with its header row) into the store.
+        """
+        for chunk in pd.read_csv(path, dtype=str, chunksize=chunk_size):
+            self.append(table, list(chunk.itertuples(index=False, name=None)))
+
+    def _maintain(self):
+        # Once a day, compact the days that are over and drop expired ones.
+        today = date.today()
+        if self._maintained_day == today:
+            return
+        self._maintained_day = today
+        for table in TABLES:
+            self.compact(table, today)
+            if self.retention_days:
+                self.prune(table, self.retention_days)
+
+    def _merge(self, table, day, segments):
+        # The merged file lists the segments it holds, in order, for
+        # read_new.
+        times, parts = [], {name: [] for name in TABLES[table]}
+        sources, source_rows = [], []
+        for path in segments:
+            with np.load(path) as segment:
+                times.append(segment["time"])
+                for name in parts:
+                    parts[name].append(_read_column(segment, name))
+                if "sources" in segment.files:
+                    sources.extend(segment["sources"].tolist())
+                    source_rows.extend(segment["source_rows"].tolist())
+                else:
+                    sources.append(os.path.basename(path))
+                    source_rows.append(len(segment["time"]))
+
+        values = {}
+        for name, (_, kind) in TABLES[table].items():
+            column = _combine(parts[name], kind)
+            values[name] = (
+                np.asarray(column, dtype=str) if kind == "category" else column
+            )
+
+        _save_segment(
+            os.path.join(self._partition(table, str(day)), COMPACTED_FILE),
+            np.concatenate(times),
+            values,
+            sources=np.asarray(sources, dtype=str),
+            source_rows=np.asarray(source_rows, dtype=np.int64),
+        )
+        for path in segments:
+            if os.path.basename(path) != COMPACTED_FILE:
+                os.remove(path)
+
+    def _partition(self, table, day):
+        return os.path.join(self.directory, table, day)
+
+    def _segments(self, table, day):
+        return sorted(
+            glob.glob(os.path.join(self._partition(table, str(day)), "*.npz"))
+        )
+
+
+def _take_lock(path):
+    """
+    Create and lock path, returning its descriptor, or None if another
+    process holds the lock. With fcntl the lock is released by the OS when
+    its holder dies, so a crash mid-merge does not block the day forever;
+    without it, a lock file older than _STALE_LOCK_SECONDS is taken over.
+    """
+    if fcntl is None:
+        try:
+            if time.time() - os.path.getmtime(path) > _STALE_LOCK_SECONDS:
+                os.remove(path)
+        except FileNotFoundError:
+            pass
+        try:
+            return os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            return None
+
+    fd = os.open(path, os.O_CREAT | os.O_WRONLY)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        # The holder removes the file before unlocking it; a lock taken on
+        # a removed file would not keep anyone else out.
+        if os.fstat(fd).st_ino == os.stat(path).st_ino:
+            return fd
+    except OSError:
+        pass
+    os.close(fd)
+    return None
+
+
+def parse_times(values):
+    """
+    Parse timestamp strings like the analytics dashboard always has: UTC
+    markers are honoured, then the time zone is dropped. Unparseable
+    values become NaT.
+    """
+    times = pd.to_datetime(
+        pd.Series(values, dtype=object), errors="coerce", utc=True, **_ISO_FORMAT
+    )
+    return times.dt.tz_localize(None).to_numpy(dtype="datetime64[ns]")
+
+
+def _save_segment(path, seconds, values, **extra):
+    arrays = {"time": seconds, **extra}
+    for name, column in values.items():
+        if column.dtype.kind == "U":
+            codes, categories = pd.factorize(column)
+            arrays[name] = codes.astype(np.int32)
+            arrays[name + "_categories"] = np.asarray(categories, dtype=str)
+        else:
+            arrays[name] = column
+    # Staged under a name the readers skip, so they never see a partial
+    # file; written through a file object so np.savez adds no suffix.
+    directory, name = os.path.split(path)
+    staging = os.path.join(directory, f".{name}.{os.getpid()}.tmp")
+    with open(staging, "wb") as f:
+        np.savez(f, **arrays)
+    os.replace(staging, path)
+
+
+def _segment_key(name):
+    """
+    (pid, (time_ns, n)) of a segment named by append(); a compacted file
+    from before compacted files listed their sources is one segment of
+    an empty pid.
+    """
+    try:
+        pid, time_ns, n = name[: -len(".npz")].split("-")
+        return pid, (int(time_ns), int(n))
+    except ValueError:
+        return "", (0, 0)
+
+
+def _unread_rows(segment, segment_marks, skip_pid):
+    """
+    Mask of the rows of a compacted segment whose source segments are
+    newer than segment_marks, which is advanced past them.
+    """
+    if "sources" in segment.files:
+        sources = segment["sources"].tolist()
+        source_rows = segment["source_rows"].tolist()
+    else:
+        sources, source_rows = [COMPACTED_FILE], [len(segment["time"])]
+
+    keep = np.zeros(sum(source_rows), dtype=bool)
+    newest = {}
+    start = 0
+    for source, rows in zip(sources, source_rows):
+        pid, key = _segment_key(source)
+        if pid != skip_pid and key > segment_marks.get(pid, _NO_SEGMENT):
+            keep[start : start + rows] = True
+            newest[pid] = max(newest.get(pid, _NO_SEGMENT), key)
+        start += rows
+    for pid, key in newest.items():
+        segment_marks[pid] = max(segment_marks.get(pid, _NO_SEGMENT), key)
+    return keep
+
+
+def _frame(table, times, parts):
+    data = {"time": pd.to_datetime(_concat(times, np.int64), unit="s")}
+    for name, values in parts.items():
+        data[name] = _combine(values, TABLES[table][name][1])
+    return pd.DataFrame(data)
+
+
+def _read_column(segment, name, keep=slice(None)):
+    if name + "_categories" in segment.files:
+        return pd.Categorical.from_codes(
+            segment[name][keep], segment[name + "_categories"]
+        )
+    return segment[name][keep]
+
+
+def _in_window(seconds, start, end):
+    keep = np.ones(len(seconds), dtype=bool)
+    if start is not None:
+        keep &= seconds >= _epoch_seconds(start)
+    if end is not None:
+        keep &= seconds < _epoch_seconds(end)
+    return keep
+
+
+def _epoch_seconds(moment):
+    return int(
+        np.datetime64(pd.Timestamp(moment).to_datetime64(), "s").astype(np.int64)
+    )
+
+
+def _concat(parts, dtype):
+    return np.concatenate(parts) if parts else np.empty(0, dtype=dtype)
+
+
+def _combine(parts, kind):
+    if kind == "category":
+        if not parts:
+            return pd.Categorical([])
+        return union_categoricals(parts)
+    return _concat(parts, kind)
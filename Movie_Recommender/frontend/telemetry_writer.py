@@ -0,0 +1,163 @@
+import csv
+import io
+import os
+import queue
+import threading
+import time
+
+# When to fsync the telemetry file: never (leave it to the OS), always (after
+# every batch) or every fsync_interval seconds.
+FSYNC_POLICIES = ("never", "always", "interval")
+
+_STOP = object()
+
+
+class TelemetryWriter(threading.Thread):
+    """
+    Daemon thread that appends telemetry rows to a CSV file in batches.
+
+    Request handlers call log(), which only puts the row on a bounded
+    queue. The writer collects up to batch_size rows, or whatever arrived
+    within flush_interval seconds, and appends them with a single write to
+    a file opened with O_APPEND, so the batches of several processes do not
+    interleave. When the queue is full, log() waits up to put_timeout
+    seconds and then drops the row; drops are counted in stats().
+
+    With a TelemetryStore, every batch is also appended to the store's
+    table as one segment per day.
+    """
+
+    def __init__(
+        self,
+        path,
+        max_queue=10000,
+        batch_size=500,
+        flush_interval=1.0,
+        fsync="never",
+        fsync_interval=5.0,
+        put_timeout=0.0,
+        store=None,
+        table="telemetry",
+    ):
+        super().__init__(daemon=True, name="telemetry-writer")
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"fsync must be one of {FSYNC_POLICIES}")
+
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+        self.fsync_interval = fsync_interval
+        self.put_timeout = put_timeout
+        self.store = store
+        self.table = table
+        self.written = 0
+        self.dropped = 0
+        self.flushes = 0
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._last_fsync = time.monotonic()
+        self._closed = False
+        self._lock = threading.Lock()
+
+    def log(self, row):
+        """
+        Queue a row for writing. Returns False if it was dropped.
+        """
+        if not self._closed:
+            try:
+                if self.put_timeout > 0:
+                    self._queue.put(row, timeout=self.put_timeout)
+                else:
+                    self._queue.put_nowait(row)
+                return True
+            except queue.Full:
+                pass
+
+        with self._lock:
+            self.dropped += 1
+        return False
+
+    def close(self, timeout=10.0):
+        """
+        Stop accepting rows, write everything queued and stop the thread.
+        """
+        if self._closed:
+            return
+        self._closed = True
+        if self.is_alive():
+            # Blocks until the writer has made room for the sentinel.
+            self._queue.put(_STOP)
+            self.join(timeout)
+        else:
+            self._write(self._drain())
+
+    def stats(self):
+        return {
+            "queued": self._queue.qsize(),
+            "written": self.written,
+            "dropped": self.dropped,
+            "flushes": self.flushes,
+        }
+
+    def run(self):
+        stopping = False
+        while not stopping:
+            batch = []
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                try:
+                    row = self._queue.get(timeout=max(deadline - time.monotonic(), 0))
+                except queue.Empty:
+                    break
+                if row is _STOP:
+                    stopping = True
+                    batch.extend(self._drain())
+                    break
+                batch.append(row)
+
+            try:
+                self._write(batch)
+            except OSError as e:
+                print(f"Error writing telemetry: {e}")
+                with self._lock:
+                    self.dropped += len(batch)
+
+    def _drain(self):
+        rows = []
+        while True:
+            try:
+                row = self._queue.get_nowait()
+            except queue.Empty:
+                return rows
+            if row is not _STOP:
+                rows.append(row)
+
+    def _write(self, rows):
+        if not rows:
+            return
+
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(rows)
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            data = buffer.getvalue().encode()
+            while data:
+                data = data[os.write(fd, data) :]
+            now = time.monotonic()
+            if self.fsync == "always" or (
+                self.fsync == "interval"
+                and now - self._last_fsync >= self.fsync_interval
+            ):
+                os.fsync(fd)
+                self._last_fsync = now
+        finally:
+            os.close(fd)
+
+        self.written += len(rows)
+        self.flushes += 1
+
+        if self.store is not None:
+            try:
+                self.store.append(self.table, rows)
+            except Exception as e:
+                print(f"Error storing {self.table} rows: {e}")
@@ -1,20 +1,53 @@
 # main.py
+import json
 import os
-import pickle
-from data.data_loader import load_ratings, load_movies
-from data.preprocessing import time_based_split, preprocess_ratings
+import numpy as np
+import pandas as pd
+from config import TRAINING_CONFIG
+from data.data_loader import (
+    load_ratings,
+    load_ratings_sample,
+    load_ratings_since,
+    load_movies,
+    stream_ratings,
+)
+from data.preprocessing import preprocess_ratings
+from data.rating_chunks import RatingChunkCache
+from data.ratings_matrix import RatingsMatrix, lookup_codes
+from model.artifact import load_artifact, load_extra, save_artifact
 from model.collaborative_filtering import (
-    train_collaborative_filtering,
+    cast_model,
+    get_trainer,
     tune_collaborative_filtering,
+    train_collaborative_filtering_streaming,
+    tune_successive_halving,
+    warm_start_collaborative_filtering,
 )
-from model.evaluation import evaluate_model
+from model.evaluation import evaluate_model, evaluate_ranking
 from utils.validation import validate_before_training
 
 # from utils.segment import evaluate_user_segments
 from utils.recommender import recommend_movies_for_user
+from utils.serving_index import (
+    build_seen_index,
+    seen_index_from_rows,
+    seen_popularity,
+)
+
+MODEL_DIR = "models/cf_model"
+MODEL_META_PATH = "models/cf_model_meta.json"
+RATINGS_PATH = "dataframes/ratings.csv"
+DEFAULT_PARAMS = {"n_factors": 50, "n_epochs": 20, "lr": 0.01, "reg": 0.01}
 
 
 def main():
+    if TRAINING_CONFIG["mode"] == "warm_start" and os.path.exists(MODEL_META_PATH):
+        warm_start()
+        return
+    if TRAINING_CONFIG["mode"] == "streaming":
+        train_streaming()
+        return
+
     print("Starting recommendation system pipeline...")
 
     # Step 1: Load data
@@ -25,81 +58,310 @@ def main():
     os.makedirs("dataframes", exist_ok=True)
     os.makedirs("models", exist_ok=True)
 
-    # Saving processed data 
+    # Saving processed data
     movies_df.to_csv("dataframes/movies.csv", index=False)
-    ratings_df.to_csv("dataframes/ratings.csv", index=False)
+    ratings_df.to_csv(RATINGS_PATH, index=False)
 
     print(f"Loaded {len(ratings_df)} ratings and {len(movies_df)} movies")
+    last_rating_time = ratings_df["time"].max()
 
     # Step 2: Preprocess data
     print("Preprocessing ratings data...")
     processed_ratings = preprocess_ratings(ratings_df)
 
     # Step 3: Split data
+    # Ids are factorized once here; every later stage works on the codes.
     print("Splitting data into train/validation/test sets...")
-    train_df, val_df, test_df = time_based_split(processed_ratings)
+    ratings_matrix = RatingsMatrix.from_dataframe(processed_ratings)
+    train_set, val_set, test_set = ratings_matrix.time_split()
 
     print(
-        f"Split sizes - Train: {len(train_df)}, "
-        f"Validation: {len(val_df)}, Test: {len(test_df)}"
+        f"Split sizes - Train: {len(train_set)}, "
+        f"Validation: {len(val_set)}, Test: {len(test_set)}"
     )
 
     # Step 4: Validate data
     print("Validating data before training...")
-    is_valid = validate_before_training(train_df, val_df, test_df)
+    is_valid = validate_before_training(train_set, val_set, test_set)
 
     if not is_valid:
         print("⚠️ Validation issues detected. Consider addressing before proceeding.")
 
     # Step 5: Get best params
-    print("Getting best params...")
+    solver = TRAINING_CONFIG["solver"]
+    n_jobs = TRAINING_CONFIG["n_jobs"] or os.cpu_count()
+    train_options = {"dtype": TRAINING_CONFIG["dtype"]}
+    if solver != "als":
+        train_options["batch_size"] = TRAINING_CONFIG["batch_size"]
+    print(f"Getting best params for the {solver} solver...")
     param_grid = {
         "n_factors": [20, 50, 100],
         "n_epochs": [15, 20],
         "lr": [0.01, 0.005],
         "reg": [0.01, 0.1],
     }
+    if solver == "als":
+        # ALS converges in a few epochs and has no learning rate.
+        param_grid.update({"n_epochs": [5, 10], "lr": [None]})
 
-    best_params = tune_collaborative_filtering(train_df, val_df, param_grid)
+    if TRAINING_CONFIG["tuner"] == "halving":
+        best_params, _ = tune_successive_halving(
+            train_set,
+            val_set,
+            param_grid,
+            solver=solver,
+            min_epochs=TRAINING_CONFIG["halving_min_epochs"],
+            reduction_factor=TRAINING_CONFIG["halving_reduction_factor"],
+            **train_options,
+        )
+    else:
+        best_params = tune_collaborative_filtering(
+            train_set,
+            val_set,
+            param_grid,
+            solver=solver,
+            n_jobs=n_jobs,
+            **train_options,
+        )
 
     # Step 6: Train model
     print("Training collaborative filtering model...")
+    # Tuning already keeps every core busy with one process per grid point,
+    # so Hogwild threads are only used for the final model.
+    final_options = dict(train_options)
+    if solver == "als":
+        final_options["n_jobs"] = n_jobs
+    elif TRAINING_CONFIG["n_threads"]:
+        final_options["n_threads"] = TRAINING_CONFIG["n_threads"]
 
-    model = train_collaborative_filtering(
-        train_df,
+    model = get_trainer(solver)(
+        train_set,
         n_factors=best_params["n_factors"],
         n_epochs=best_params["n_epochs"],
         lr=best_params["lr"],
         reg=best_params["reg"],
+        **final_options,
     )
 
     # Step 7: Evaluate model
     print("Evaluating model on test data...")
-    evaluation_results = evaluate_model(model, test_df)
+    evaluation_results = evaluate_model(model, test_set)
 
     print(
         f"Test set metrics - RMSE: {evaluation_results['RMSE']:.4f}, "
         f"MAE: {evaluation_results['MAE']:.4f}"
     )
 
+    ranking_results = evaluate_ranking(model, train_set, test_set, k=10)
+    print(
+        f"Test set ranking - Precision@10: {ranking_results['precision@10']:.4f}, "
+        f"Recall@10: {ranking_results['recall@10']:.4f}, "
+        f"NDCG@10: {ranking_results['NDCG@10']:.4f} "
+        f"({ranking_results['users']} users)"
+    )
+
     # Step 8: Generate sample recommendations for a user
     print("\nGenerating sample recommendations:")
 
-    sample_user_id = train_df["user_id"].iloc[0]
+    sample_user_id = train_set.user_ids[train_set.user_codes[0]]
     recommendation = recommend_movies_for_user(
         model, movies_df, ratings_df, str(sample_user_id)
     )
 
     print(recommendation)
 
-    # Step 9: Save the trained model
-    print("Saving trained model...")
+    # Step 9: Optionally shrink the model for serving
+    if TRAINING_CONFIG["serving_dtype"]:
+        model = compact_for_serving(model, test_set, evaluation_results["RMSE"])
 
-    with open("models/cf_model.pkl", "wb") as f:
-        pickle.dump(model, f)
+    # Step 10: Save the trained model
+    save_model(
+        model, best_params, last_rating_time, build_seen_index(model, ratings_df)
+    )
 
     print("\nPipeline completed successfully!")
 
 
+def compact_for_serving(model, test_set, test_rmse):
+    """
+    Cast the model to the serving dtype if test RMSE stays within tolerance.
+    """
+    serving_dtype = TRAINING_CONFIG["serving_dtype"]
+    compact_model = cast_model(model, serving_dtype)
+    compact_rmse = evaluate_model(compact_model, test_set)["RMSE"]
+    regression = compact_rmse - test_rmse
+
+    print(
+        f"{serving_dtype} test RMSE: {compact_rmse:.4f} "
+        f"({regression:+.5f} vs. trained model)"
+    )
+    if regression > TRAINING_CONFIG["rmse_tolerance"]:
+        print(
+            f"⚠️ {serving_dtype} RMSE regression exceeds "
+            f"{TRAINING_CONFIG['rmse_tolerance']}; saving the trained model."
+        )
+        return model
+
+    return compact_model
+
+
+def warm_start():
+    """
+    Update the saved model with the ratings recorded since it was trained.
+    """
+    print("Starting warm-start model refresh...")
+
+    # Warm start updates the factors in place, so load them into memory.
+    model = load_artifact(MODEL_DIR, mmap_mode=None)
+    with open(MODEL_META_PATH) as f:
+        meta = json.load(f)
+
+    print(f"Loading ratings recorded after {meta['last_rating_time']}...")
+    delta_df = load_ratings_since(meta["last_rating_time"])
+
+    if delta_df.empty:
+        print("No new ratings. Model is up to date.")
+        return
+
+    last_rating_time = delta_df["time"].max()
+
+    replay_df = None
+    if TRAINING_CONFIG["replay_size"] > 0:
+        replay_df = preprocess_ratings(
+            load_ratings_sample(TRAINING_CONFIG["replay_size"])
+        )
+
+    params = meta["params"]
+    model = warm_start_collaborative_filtering(
+        model,
+        preprocess_ratings(delta_df),
+        n_epochs=TRAINING_CONFIG["warm_start_epochs"],
+        lr=params["lr"] or 0.01,
+        reg=params["reg"],
+        replay_df=replay_df,
+        batch_size=TRAINING_CONFIG["batch_size"],
+    )
+
+    save_model(model, params, last_rating_time, warm_seen_index(model, delta_df))
+
+    # Only once the model is saved, so a failed run can be repeated without
+    # adding the delta twice; the next run starts after last_rating_time.
+    os.makedirs(os.path.dirname(RATINGS_PATH), exist_ok=True)
+    delta_df.to_csv(
+        RATINGS_PATH,
+        mode="a",
+        header=not os.path.exists(RATINGS_PATH),
+        index=False,
+    )
+    print("\nWarm-start refresh completed successfully!")
+
+
+def warm_seen_index(model, delta_df):
+    """
+    Seen index of a warm-started model: the saved model's seen index plus
+    the delta ratings. Warm start only appends user and movie rows, so the
+    saved rows still refer to the same users and movies.
+
+    Models saved without a seen index get one built from ratings.csv.
+    """
+    seen = load_extra(MODEL_DIR, "seen_index")
+    if seen is None:
+        history = [delta_df]
+        if os.path.exists(RATINGS_PATH):
+            history.insert(0, pd.read_csv(RATINGS_PATH))
+        return build_seen_index(model, pd.concat(history, ignore_index=True))
+
+    indptr, movie_rows = seen["indptr"], seen["movie_rows"]
+    user_rows = np.repeat(np.arange(len(indptr) - 1), np.diff(indptr))
+    delta_users = lookup_codes(model["user_to_idx"], delta_df["user_id"])
+    delta_movies = lookup_codes(model["movie_to_idx"], delta_df["movie_id"])
+    known = (delta_users >= 0) & (delta_movies >= 0)
+
+    return seen_index_from_rows(
+        np.concatenate([user_rows, delta_users[known]]),
+        np.concatenate([movie_rows, delta_movies[known]]),
+        len(model["user_to_idx"]),
+    )
+
+
+def train_streaming():
+    """
+    Train on the full rating table chunk by chunk, without loading it.
+
+    Hyperparameters are reused from the saved model's metadata when present,
+    since tuning needs in-memory validation splits.
+    """
+    print("Starting streaming training pipeline...")
+    os.makedirs("models", exist_ok=True)
+
+    cache_dir = TRAINING_CONFIG["chunk_cache"]
+    if TRAINING_CONFIG["reuse_chunk_cache"] and RatingChunkCache.exists(cache_dir):
+        print(f"Reading rating chunks from {cache_dir}...")
+        chunks = RatingChunkCache(cache_dir)
+    else:
+        print(f"Streaming ratings from the database into {cache_dir}...")
+        chunks = RatingChunkCache.build(
+            stream_ratings(TRAINING_CONFIG["chunk_size"]), cache_dir
+        )
+
+    print(
+        f"{chunks.n_ratings} ratings in {chunks.n_chunks} chunks - "
+        f"{chunks.n_users} users, {chunks.n_movies} movies"
+    )
+
+    params = DEFAULT_PARAMS
+    if os.path.exists(MODEL_META_PATH):
+        with open(MODEL_META_PATH) as f:
+            params = json.load(f)["params"]
+
+    model = train_collaborative_filtering_streaming(
+        chunks,
+        n_factors=params["n_factors"],
+        n_epochs=params["n_epochs"],
+        lr=params["lr"] or DEFAULT_PARAMS["lr"],
+        reg=params["reg"],
+        batch_size=TRAINING_CONFIG["batch_size"],
+        buffer_size=TRAINING_CONFIG["buffer_size"],
+        n_threads=TRAINING_CONFIG["n_threads"],
+        dtype=TRAINING_CONFIG["dtype"],
+    )
+
+    # Model rows are the cache's codes, so the seen index needs no lookups.
+    user_codes, movie_codes = chunks.codes()
+    seen_index = seen_index_from_rows(user_codes, movie_codes, chunks.n_users)
+    save_model(model, params, chunks.last_rating_time, seen_index)
+    print("\nStreaming training completed successfully!")
+
+
+def save_model(model, params, last_rating_time, seen_index):
+    """
+    Save the model with the parameters and rating watermark used by
+    warm_start, and the seen index the app uses to exclude rated movies.
+
+    The seen index and the all-time popular movies counted from it are
+    saved inside the model artifact, so they always match the model and
+    the app serves them without reading ratings.csv. The artifact is
+    written last, since the app reloads when its version changes.
+    """
+    print("Saving trained model...")
+
+    with open(MODEL_META_PATH, "w") as f:
+        json.dump(
+            {"last_rating_time": last_rating_time, "params": params},
+            f,
+            default=str,
+        )
+
+    indptr, movie_rows = seen_index
+    save_artifact(
+        model,
+        MODEL_DIR,
+        extras={
+            "seen_index": {"indptr": indptr, "movie_rows": movie_rows},
+            "popularity": seen_popularity(model, seen_index),
+        },
+    )
+
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,206 @@
+import json
+import os
+import shutil
+import time
+from datetime import datetime
+import numpy as np
+from data.ratings_matrix import IdIndex
+
+ARTIFACT_FORMAT_VERSION = 1
+MANIFEST_FILE = "manifest.json"
+# Names the version directory the artifact currently points at.
+CURRENT_FILE = "CURRENT"
+_FACTOR_KEYS = ("user_factors", "movie_factors", "user_biases", "movie_biases")
+# Staging files older than this were left by a save that did not finish;
+# newer ones may belong to a save still running in another process.
+_STALE_STAGING_SECONDS = 3600
+
+
+def save_artifact(model_data, directory, extras=None):
+    """
+    Save a model as a directory of .npy arrays plus a manifest.json.
+
+    The factors and biases are stored as they are; the id dicts become an
+    id array per side (ids[row]) with its argsort, so loading needs no
+    unpickling and the id lookups work on memory-mapped arrays (IdIndex).
+
+    Each save writes a new version directory inside directory and then
+    replaces directory/CURRENT, which names it, in one step, so readers
+    always find a complete artifact. The previous version is kept for
+    processes still loading it; older ones are deleted.
+
+    Args:
+        model_data (dict): The trained model data.
+        directory (str): Artifact directory, e.g. models/cf_model.
+        extras (dict, optional): Name -> dict of arrays to save with the
+            model, e.g. its seen index; read back with load_extra.
+
+    Returns:
+        str: The version recorded in the manifest.
+    """
+    arrays = {key: np.asarray(model_data[key]) for key in _FACTOR_KEYS}
+    for side in ("user", "movie"):
+        index = IdIndex.from_dict(model_data[f"{side}_to_idx"])
+        arrays[f"{side}_ids"] = index.ids
+        arrays[f"{side}_order"] = index.order
+    extras = extras or {}
+
+    saved_at = datetime.now()
+    version = saved_at.isoformat()
+    manifest = {
+        "format_version": ARTIFACT_FORMAT_VERSION,
+        "version": version,
+        "global_mean": float(model_data["global_mean"]),
+        "arrays": {
+            name: {"dtype": str(values.dtype), "shape": list(values.shape)}
+            for name, values in arrays.items()
+        },
+        "extras": sorted(extras),
+    }
+
+    name = saved_at.strftime("%Y%m%dT%H%M%S%f")
+    staging = os.path.join(directory, f".{name}.tmp")
+    os.makedirs(staging)
+    for array_name, values in arrays.items():
+        np.save(os.path.join(staging, array_name + ".npy"), values)
+    for extra_name, extra_arrays in extras.items():
+        with open(os.path.join(staging, extra_name + ".npz"), "wb") as f:
+            np.savez(
+                f, **{key: _storable(values) for key, values in extra_arrays.items()}
+            )
+    with open(os.path.join(staging, MANIFEST_FILE), "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.rename(staging, os.path.join(directory, name))
+
+    pointer = os.path.join(directory, f".{name}.{CURRENT_FILE}")
+    with open(pointer, "w") as f:
+        f.write(name)
+    os.replace(pointer, os.path.join(directory, CURRENT_FILE))
+
+    _remove_old_versions(directory)
+    return version
+
+
+def load_artifact(directory, mmap_mode="r"):
+    """
+    Load a model saved by save_artifact.
+
+    With the default mmap_mode="r" the arrays are read-only memory maps, so
+    every process serving the same artifact shares one copy in the page
+    cache and loading reads little more than the manifest. Pass
+    mmap_mode=None to get writable in-memory arrays, e.g. for training.
+
+    Returns:
+        dict: Model data like the trainers return; user_to_idx and
+        movie_to_idx are IdIndex objects and idx_to_user / idx_to_movie are
+        the id arrays.
+    """
+    path = artifact_path(directory)
+    if path is None:
+        raise FileNotFoundError(f"No model artifact in {directory}")
+    manifest = read_manifest(path)
+    if manifest["format_version"] != ARTIFACT_FORMAT_VERSION:
+        raise ValueError(
+            f"Unsupported model artifact format {manifest['format_version']}"
+        )
+
+    arrays = {
+        name: np.load(os.path.join(path, name + ".npy"), mmap_mode=mmap_mode)
+        for name in manifest["arrays"]
+    }
+
+    return {
+        **{key: arrays[key] for key in _FACTOR_KEYS},
+        "global_mean": manifest["global_mean"],
+        "user_to_idx": IdIndex(arrays["user_ids"], arrays["user_order"]),
+        "movie_to_idx": IdIndex(arrays["movie_ids"], arrays["movie_order"]),
+        "idx_to_user": arrays["user_ids"],
+        "idx_to_movie": arrays["movie_ids"],
+    }
+
+
+def load_extra(directory, name):
+    """
+    The arrays saved as extras[name] with the artifact, as a dict, or None
+    if it was saved without them.
+    """
+    path = os.path.join(artifact_path(directory) or directory, name + ".npz")
+    if not os.path.exists(path):
+        return None
+    with np.load(path) as extra:
+        return {key: extra[key] for key in extra.files}
+
+
+def artifact_path(directory):
+    """
+    Directory holding the files of the current version of the artifact in
+    directory, or None if there is none. A version directory is its own.
+    """
+    try:
+        with open(os.path.join(directory, CURRENT_FILE)) as f:
+            return os.path.join(directory, f.read().strip())
+    except OSError:
+        pass
+    # A version directory, or an artifact saved before versions existed.
+    if os.path.exists(os.path.join(directory, MANIFEST_FILE)):
+        return directory
+    return None
+
+
+def read_manifest(directory):
+    with open(os.path.join(artifact_path(directory) or directory, MANIFEST_FILE)) as f:
+        return json.load(f)
+
+
+def artifact_version(directory):
+    """
+    Version of the artifact in directory, or None if there is none.
+    """
+    try:
+        return read_manifest(directory)["version"]
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def _storable(values):
+    # Object arrays of ids would need pickling; store them with the dtype
+    # of their items, or as strings if those are mixed.
+    values = np.asarray(values)
+    if values.dtype == object:
+        values = np.array(values.tolist())
+        if values.dtype == object:
+            values = values.astype(str)
+    return values
+
+
+def _remove_old_versions(directory, keep=2):
+    """
+    Delete all but the newest keep versions, the staging directories and
+    pointer files of saves that did not finish, and the files of an
+    artifact saved before versions existed.
+    """
+    versions = sorted(
+        name
+        for name in os.listdir(directory)
+        if not name.startswith(".") and os.path.isdir(os.path.join(directory, name))
+    )
+    for name in versions[:-keep]:
+        shutil.rmtree(os.path.join(directory, name), ignore_errors=True)
+
+    for name in os.listdir(directory):
+        path = os.path.join(directory, name)
+        if not name.startswith(".") or not name.endswith((".tmp", "." + CURRENT_FILE)):
+            continue
+        try:
+            if time.time() - os.path.getmtime(path) < _STALE_STAGING_SECONDS:
+                continue
+            if os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+            else:
+                os.remove(path)
+        except OSError:
+            pass
+
+    for name in os.listdir(directory):
+        if name == MANIFEST_FILE or name.endswith(".npy"):
+            os.remove(os.path.join(directory, name))
@@ -1,124 +1,735 @@
+import os
+import time
 import numpy as np
 import pandas as pd
-from math import sqrt
-from model.evaluation import evaluate_model
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from math import ceil, sqrt
+from data.ratings_matrix import RatingsMatrix, compress, grow_codes
+from model.evaluation import evaluate_encoded, evaluate_model
+from model.hogwild import hogwild_epoch
+from model.shared_arrays import SharedArrays, attach_arrays
 
 
 def train_collaborative_filtering(
-    ratings_df, n_factors=50, n_epochs=20, lr=0.01, reg=0.01
+    ratings_df,
+    n_factors=50,
+    n_epochs=20,
+    lr=0.01,
+    reg=0.01,
+    batch_size=None,
+    dtype="float64",
+    n_threads=None,
 ):
     """
     Train a matrix factorization model for collaborative filtering.
+
+    With batch_size set, each epoch applies the SGD updates for batch_size
+    ratings at a time with vectorized NumPy scatter-adds instead of one
+    Python step per rating. With n_threads set, per-rating updates instead
+    run Hogwild-style in a compiled kernel on n_threads threads (requires
+    numba; see model.hogwild). Factors and biases are trained and stored as
+    dtype (float64 or float32).
+    """
+    data = _encode_ratings(ratings_df)
+    factors = _fit_sgd(
+        data,
+        n_factors,
+        n_epochs,
+        lr,
+        reg,
+        batch_size=batch_size,
+        dtype=dtype,
+        n_threads=n_threads,
+    )
+    return _build_model_data(
+        factors, data["global_mean"], data["unique_users"], data["unique_movies"]
+    )
+
+
+def _encode_ratings(ratings_df):
+    """
+    Factorize user and movie ids into dense row indices. A RatingsMatrix is
+    used as already encoded, after dropping ids without ratings.
+    """
+    if isinstance(ratings_df, RatingsMatrix):
+        matrix = ratings_df.compact()
+        return {
+            "user_indices": matrix.user_codes,
+            "movie_indices": matrix.movie_codes,
+            "ratings": matrix.ratings,
+            "n_users": matrix.n_users,
+            "n_movies": matrix.n_movies,
+            "global_mean": float(matrix.ratings.mean(dtype=np.float64)),
+            "unique_users": matrix.user_ids,
+            "unique_movies": matrix.movie_ids,
+            "matrix": matrix,
+        }
+
+    user_indices, unique_users = pd.factorize(ratings_df["user_id"])
+    movie_indices, unique_movies = pd.factorize(ratings_df["movie_id"])
+
+    return {
+        "user_indices": user_indices,
+        "movie_indices": movie_indices,
+        "ratings": ratings_df["rating"].to_numpy(dtype=float),
+        "n_users": len(unique_users),
+        "n_movies": len(unique_movies),
+        "global_mean": ratings_df["rating"].mean(),
+        "unique_users": unique_users,
+        "unique_movies": unique_movies,
+    }
+
+
+def _fit_sgd(
+    data,
+    n_factors,
+    n_epochs,
+    lr,
+    reg,
+    batch_size=None,
+    factors=None,
+    dtype="float64",
+    n_threads=None,
+):
+    """
+    Fit factors and biases with SGD on encoded ratings, continuing from
+    factors when given.
     """
     n_factors = int(n_factors)
     n_epochs = int(n_epochs)
 
-    unique_users = ratings_df["user_id"].unique()
-    unique_movies = ratings_df["movie_id"].unique()
+    user_indices, movie_indices = data["user_indices"], data["movie_indices"]
+    ratings, global_mean = data["ratings"], data["global_mean"]
+    if factors is None:
+        factors = _init_factors(data["n_users"], data["n_movies"], n_factors, dtype)
 
-    user_to_idx = {user: i for i, user in enumerate(unique_users)}
-    movie_to_idx = {movie: i for i, movie in enumerate(unique_movies)}
+    for epoch in range(n_epochs):
+        start = time.perf_counter()
+        sse = _sgd_pass(
+            factors,
+            user_indices,
+            movie_indices,
+            ratings,
+            global_mean,
+            lr,
+            reg,
+            batch_size,
+            n_threads,
+        )
+        _log_epoch(epoch, n_epochs, sse, len(ratings), time.perf_counter() - start)
 
-    n_users, n_movies = len(unique_users), len(unique_movies)
+    return factors
 
-    user_factors = np.random.normal(0, 0.1, (n_users, n_factors))
-    movie_factors = np.random.normal(0, 0.1, (n_movies, n_factors))
 
-    global_mean = ratings_df["rating"].mean()
-    user_biases, movie_biases = np.zeros(n_users), np.zeros(n_movies)
+def _sgd_pass(
+    factors,
+    user_indices,
+    movie_indices,
+    ratings,
+    global_mean,
+    lr,
+    reg,
+    batch_size,
+    n_threads=None,
+):
+    """
+    Run one shuffled SGD pass over the given ratings and return the SSE.
+    """
+    # Ratings in the factors' dtype, and Python float scalars (a NumPy
+    # float64 one would promote the arithmetic), keep float32 updates from
+    # being widened to float64 and cast back on every write.
+    ratings = np.asarray(ratings).astype(factors["user_factors"].dtype, copy=False)
+    global_mean, lr, reg = float(global_mean), float(lr), float(reg)
+    if n_threads:
+        return hogwild_epoch(
+            factors,
+            user_indices,
+            movie_indices,
+            ratings,
+            global_mean,
+            lr,
+            reg,
+            int(n_threads),
+        )
+    if batch_size:
+        return _sgd_minibatch_epoch(
+            factors,
+            user_indices,
+            movie_indices,
+            ratings,
+            global_mean,
+            lr,
+            reg,
+            int(batch_size),
+        )
+    return _sgd_epoch(
+        factors, user_indices, movie_indices, ratings, global_mean, lr, reg
+    )
 
-    user_indices = [user_to_idx[user] for user in ratings_df["user_id"]]
-    movie_indices = [movie_to_idx[movie] for movie in ratings_df["movie_id"]]
-    ratings = ratings_df["rating"].values
 
-    for epoch in range(n_epochs):
-        indices = np.arange(len(ratings_df))
-        np.random.shuffle(indices)
+def train_collaborative_filtering_streaming(
+    chunks,
+    n_factors=50,
+    n_epochs=20,
+    lr=0.01,
+    reg=0.01,
+    batch_size=None,
+    buffer_size=1000000,
+    dtype="float64",
+    n_threads=None,
+):
+    """
+    Train the SGD model from a RatingChunkCache without loading all ratings.
 
-        user_indices_shuffled = [user_indices[i] for i in indices]
-        movie_indices_shuffled = [movie_indices[i] for i in indices]
-        ratings_shuffled = ratings[indices]
+    Each epoch visits the chunks in random order and concatenates them into
+    shuffle buffers of about buffer_size ratings, which are shuffled and
+    trained on one at a time. Memory use is bounded by the factors and a
+    single buffer rather than by the number of ratings.
+    """
+    n_epochs = int(n_epochs)
+    factors = _init_factors(chunks.n_users, chunks.n_movies, int(n_factors), dtype)
 
-        total_error = 0
+    for epoch in range(n_epochs):
+        start = time.perf_counter()
+        sse = 0.0
 
-        for i in range(len(ratings_shuffled)):
-            u, m, r = (
-                user_indices_shuffled[i],
-                movie_indices_shuffled[i],
-                ratings_shuffled[i],
+        for user_indices, movie_indices, ratings in _shuffle_buffers(
+            chunks, buffer_size
+        ):
+            sse += _sgd_pass(
+                factors,
+                user_indices,
+                movie_indices,
+                ratings,
+                chunks.global_mean,
+                lr,
+                reg,
+                batch_size,
+                n_threads,
             )
 
-            pred = (
-                global_mean
-                + user_biases[u]
-                + movie_biases[m]
-                + np.dot(user_factors[u], movie_factors[m])
-            )
+        _log_epoch(epoch, n_epochs, sse, chunks.n_ratings, time.perf_counter() - start)
+
+    return _build_model_data(
+        factors,
+        chunks.global_mean,
+        chunks.user_ids.tolist(),
+        chunks.movie_ids.tolist(),
+    )
 
-            error = r - pred
-            total_error += error**2
 
-            user_biases[u] += lr * (error - reg * user_biases[u])
-            movie_biases[m] += lr * (error - reg * movie_biases[m])
+def _shuffle_buffers(chunks, buffer_size):
+    """
+    Group shuffled chunks into buffers of at least buffer_size ratings (the
+    last one may be smaller); the SGD pass shuffles within each buffer.
+    """
+    pending, n_pending = [], 0
+
+    for chunk in chunks.iter_chunks(shuffle=True):
+        pending.append(chunk)
+        n_pending += len(chunk[2])
+
+        if n_pending >= buffer_size:
+            yield tuple(np.concatenate(columns) for columns in zip(*pending))
+            pending, n_pending = [], 0
+
+    if pending:
+        yield tuple(np.concatenate(columns) for columns in zip(*pending))
+
+
+def _init_factors(n_users, n_movies, n_factors, dtype="float64"):
+    """
+    Allocate randomly initialised factors and zero biases of the given dtype.
+    """
+    return {
+        "user_factors": np.random.normal(0, 0.1, (n_users, n_factors)).astype(
+            dtype, copy=False
+        ),
+        "movie_factors": np.random.normal(0, 0.1, (n_movies, n_factors)).astype(
+            dtype, copy=False
+        ),
+        "user_biases": np.zeros(n_users, dtype=dtype),
+        "movie_biases": np.zeros(n_movies, dtype=dtype),
+    }
+
+
+def _sgd_epoch(factors, user_indices, movie_indices, ratings, global_mean, lr, reg):
+    """
+    Run one epoch of per-rating SGD in shuffled order and return the SSE.
+    """
+    user_factors, movie_factors = factors["user_factors"], factors["movie_factors"]
+    user_biases, movie_biases = factors["user_biases"], factors["movie_biases"]
+
+    order = np.random.permutation(len(ratings))
+    total_error = 0
+
+    # The scalar arithmetic runs on Python floats: NumPy float32 scalars are
+    # several times slower than float64 ones.
+    for u, m, r in zip(
+        user_indices[order].tolist(),
+        movie_indices[order].tolist(),
+        ratings[order].tolist(),
+    ):
+        user_factors_u = user_factors[u]
+        movie_factors_m = movie_factors[m]
+        user_bias = user_biases.item(u)
+        movie_bias = movie_biases.item(m)
+
+        pred = (
+            global_mean
+            + user_bias
+            + movie_bias
+            + float(np.dot(user_factors_u, movie_factors_m))
+        )
+
+        error = r - pred
+        total_error += error**2
+
+        user_biases[u] = user_bias + lr * (error - reg * user_bias)
+        movie_biases[m] = movie_bias + lr * (error - reg * movie_bias)
+
+        # Both gradients are computed before either row is written, so the
+        # row views do not need to be copied.
+        user_step = lr * (error * movie_factors_m - reg * user_factors_u)
+        movie_step = lr * (error * user_factors_u - reg * movie_factors_m)
+
+        user_factors[u] += user_step
+        movie_factors[m] += movie_step
+
+    return total_error
+
+
+def _sgd_minibatch_epoch(
+    factors, user_indices, movie_indices, ratings, global_mean, lr, reg, batch_size
+):
+    """
+    Run one epoch of mini-batch SGD in shuffled order and return the SSE.
+
+    Every rating in a batch is scored against the factors as they were at the
+    start of the batch; the per-rating gradients are then summed into the
+    factor and bias rows with np.add.at, so users or movies that appear
+    several times in a batch receive all of their updates.
+    """
+    user_factors, movie_factors = factors["user_factors"], factors["movie_factors"]
+    user_biases, movie_biases = factors["user_biases"], factors["movie_biases"]
 
-            user_factors_u = user_factors[u].copy()
-            movie_factors_m = movie_factors[m].copy()
+    order = np.random.permutation(len(ratings))
+    total_error = 0.0
 
-            user_factors[u] += lr * (error * movie_factors_m - reg * user_factors_u)
-            movie_factors[m] += lr * (error * user_factors_u - reg * movie_factors_m)
+    for start in range(0, len(order), batch_size):
+        batch = order[start : start + batch_size]
+        u, m, r = user_indices[batch], movie_indices[batch], ratings[batch]
 
-        rmse = sqrt(total_error / len(ratings))
+        user_factors_u = user_factors[u]
+        movie_factors_m = movie_factors[m]
 
-        if (epoch + 1) % 5 == 0:
-            print(f"Epoch {epoch + 1}/{n_epochs} - RMSE: {rmse:.4f}")
+        pred = (
+            global_mean
+            + user_biases[u]
+            + movie_biases[m]
+            + np.einsum("ij,ij->i", user_factors_u, movie_factors_m)
+        )
 
-    model_data = {
-        "user_factors": user_factors,
-        "movie_factors": movie_factors,
-        "user_biases": user_biases,
-        "movie_biases": movie_biases,
+        error = r - pred
+        total_error += float(error @ error)
+
+        np.add.at(user_biases, u, lr * (error - reg * user_biases[u]))
+        np.add.at(movie_biases, m, lr * (error - reg * movie_biases[m]))
+
+        error = error[:, np.newaxis]
+        np.add.at(
+            user_factors, u, lr * (error * movie_factors_m - reg * user_factors_u)
+        )
+        np.add.at(
+            movie_factors, m, lr * (error * user_factors_u - reg * movie_factors_m)
+        )
+
+    return total_error
+
+
+def _log_epoch(epoch, n_epochs, sse, n_ratings, elapsed):
+    """
+    Print training RMSE and throughput for one epoch.
+    """
+    rmse = sqrt(sse / n_ratings) if n_ratings else 0.0
+    throughput = n_ratings / elapsed if elapsed > 0 else float("inf")
+    print(
+        f"Epoch {epoch + 1}/{n_epochs} - RMSE: {rmse:.4f} - "
+        f"{throughput:,.0f} ratings/s"
+    )
+
+
+def _build_model_data(factors, global_mean, unique_users, unique_movies):
+    """
+    Assemble the model dict consumed by evaluation and serving.
+    """
+    return {
+        "user_factors": factors["user_factors"],
+        "movie_factors": factors["movie_factors"],
+        "user_biases": factors["user_biases"],
+        "movie_biases": factors["movie_biases"],
         "global_mean": global_mean,
+        **_id_maps(unique_users, unique_movies),
+    }
+
+
+def cast_model(model_data, dtype):
+    """
+    Return a copy of the model with factors and biases stored as dtype.
+
+    float16 is meant for serving only: scoring upcasts the rows it reads
+    to float32.
+    """
+    return {
+        **model_data,
+        **{key: np.asarray(model_data[key]).astype(dtype) for key in _FACTOR_KEYS},
+    }
+
+
+def _id_maps(unique_users, unique_movies):
+    """
+    Build the id <-> row index dicts of the model.
+    """
+    user_to_idx = {user: i for i, user in enumerate(unique_users)}
+    movie_to_idx = {movie: i for i, movie in enumerate(unique_movies)}
+
+    return {
+        "user_to_idx": user_to_idx,
+        "movie_to_idx": movie_to_idx,
+        "idx_to_user": {i: user for user, i in user_to_idx.items()},
+        "idx_to_movie": {i: movie for movie, i in movie_to_idx.items()},
+    }
+
+
+def warm_start_collaborative_filtering(
+    model_data,
+    delta_df,
+    n_epochs=3,
+    lr=0.01,
+    reg=0.01,
+    replay_df=None,
+    batch_size=None,
+):
+    """
+    Update a trained model with new ratings instead of retraining it.
+
+    Users and movies in delta_df that the model has not seen are appended to
+    the id maps with random factors and zero biases. SGD then continues from
+    the existing factors for n_epochs over delta_df, plus replay_df when
+    given (a sample of older ratings keeps the update from drifting towards
+    the new ones only). global_mean is kept. A float16 serving model is
+    trained in float32. Returns a new model dict with the same layout;
+    model_data is left unchanged.
+    """
+    ratings_df = delta_df if replay_df is None else pd.concat([delta_df, replay_df])
+
+    user_to_idx = dict(model_data["user_to_idx"])
+    movie_to_idx = dict(model_data["movie_to_idx"])
+    user_indices = grow_codes(user_to_idx, ratings_df["user_id"])
+    movie_indices = grow_codes(movie_to_idx, ratings_df["movie_id"])
+
+    if np.asarray(model_data["user_factors"]).dtype == np.float16:
+        model_data = cast_model(model_data, np.float32)
+
+    user_factors = np.asarray(model_data["user_factors"])
+    movie_factors = np.asarray(model_data["movie_factors"])
+    n_factors = user_factors.shape[1]
+
+    factors = {
+        "user_factors": _grow_rows(user_factors, len(user_to_idx)),
+        "movie_factors": _grow_rows(movie_factors, len(movie_to_idx)),
+        "user_biases": _grow_rows(model_data["user_biases"], len(user_to_idx)),
+        "movie_biases": _grow_rows(model_data["movie_biases"], len(movie_to_idx)),
+    }
+    print(
+        f"Warm start: {len(user_to_idx) - len(user_factors)} new users, "
+        f"{len(movie_to_idx) - len(movie_factors)} new movies, "
+        f"{len(ratings_df)} ratings"
+    )
+
+    data = {
+        "user_indices": user_indices,
+        "movie_indices": movie_indices,
+        "ratings": ratings_df["rating"].to_numpy(dtype=float),
+        "n_users": len(user_to_idx),
+        "n_movies": len(movie_to_idx),
+        "global_mean": model_data["global_mean"],
+    }
+    factors = _fit_sgd(
+        data, n_factors, n_epochs, lr, reg, batch_size=batch_size, factors=factors
+    )
+
+    return {
+        **factors,
+        "global_mean": model_data["global_mean"],
         "user_to_idx": user_to_idx,
         "movie_to_idx": movie_to_idx,
         "idx_to_user": {i: user for user, i in user_to_idx.items()},
         "idx_to_movie": {i: movie for movie, i in movie_to_idx.items()},
     }
 
-    return model_data
 
+def _grow_rows(array, n_rows):
+    """
+    Copy a factor matrix or bias vector, appending rows up to n_rows; new
+    factor rows are drawn like freshly initialised ones and new biases are 0.
+    """
+    array = np.asarray(array)
+    n_new = n_rows - len(array)
+
+    if array.ndim == 1:
+        extra = np.zeros(n_new, dtype=array.dtype)
+    else:
+        extra = np.random.normal(0, 0.1, (n_new, array.shape[1])).astype(array.dtype)
+
+    return np.concatenate([array, extra])
+
+
+def train_als_collaborative_filtering(
+    ratings_df,
+    n_factors=50,
+    n_epochs=10,
+    lr=None,
+    reg=0.1,
+    n_jobs=None,
+    dtype="float64",
+):
+    """
+    Train the same biased matrix factorization model with Alternating Least
+    Squares.
+
+    Each epoch solves every user's factors and bias as a ridge regression
+    against fixed movie factors, then every movie's against the new user
+    factors. The ridge penalty is scaled by each row's rating count. The
+    solves of a half-step are split across n_jobs worker processes (all
+    cores by default) that attach to the factors and the CSR/CSC views of
+    the ratings in shared memory. Each solve runs in float64 and the results
+    are stored as dtype. lr is accepted so that SGD parameter grids can be
+    reused, and is ignored.
+    """
+    data = _encode_ratings(ratings_df)
+    factors = _fit_als(data, n_factors, n_epochs, lr, reg, n_jobs=n_jobs, dtype=dtype)
+    return _build_model_data(
+        factors, data["global_mean"], data["unique_users"], data["unique_movies"]
+    )
+
+
+def _fit_als(
+    data, n_factors, n_epochs, lr, reg, n_jobs=None, factors=None, dtype="float64"
+):
+    """
+    Fit factors and biases with ALS on encoded ratings, continuing from
+    factors when given.
+    """
+    n_factors = int(n_factors)
+    n_epochs = int(n_epochs)
+    n_jobs = int(n_jobs or os.cpu_count() or 1)
+
+    user_indices, movie_indices = data["user_indices"], data["movie_indices"]
+    ratings, global_mean = data["ratings"], data["global_mean"]
+    n_users, n_movies = data["n_users"], data["n_movies"]
+
+    arrays = dict(factors or _init_factors(n_users, n_movies, n_factors, dtype))
+    if "matrix" in data:
+        csr, csc = data["matrix"].csr, data["matrix"].csc
+    else:
+        csr = compress(user_indices, movie_indices, ratings, n_users)
+        csc = compress(movie_indices, user_indices, ratings, n_movies)
+    arrays.update(zip(("csr_indptr", "csr_indices", "csr_data"), csr))
+    arrays.update(zip(("csc_indptr", "csc_indices", "csc_data"), csc))
+
+    if n_jobs == 1:
+        return _run_als(arrays, None, 1, n_epochs, global_mean, reg)
+
+    with SharedArrays(arrays) as shared, ProcessPoolExecutor(
+        max_workers=n_jobs, initializer=_attach_worker, initargs=(shared.spec,)
+    ) as pool:
+        _run_als(shared.arrays, pool, 4 * n_jobs, n_epochs, global_mean, reg)
+        return {key: shared.arrays[key].copy() for key in _FACTOR_KEYS}
+
+
+_FACTOR_KEYS = ("user_factors", "movie_factors", "user_biases", "movie_biases")
+
+# Shared arrays attached by each ALS or tuning pool worker.
+_worker_arrays = {}
+_worker_segments = []
 
-def tune_collaborative_filtering(train_df, val_df, param_grid):
+
+def _attach_worker(spec):
+    global _worker_arrays, _worker_segments
+    _worker_arrays, _worker_segments = attach_arrays(spec)
+
+
+def _run_als(arrays, pool, n_chunks, n_epochs, global_mean, reg):
+    """
+    Run the ALS epochs, in-process when pool is None.
+    """
+    n_ratings = len(arrays["csr_data"])
+
+    for epoch in range(n_epochs):
+        start = time.perf_counter()
+
+        for side in ("user", "movie"):
+            prefix = "csr" if side == "user" else "csc"
+            chunks = _row_chunks(arrays[f"{prefix}_indptr"], n_chunks)
+
+            if pool is None:
+                for lo, hi in chunks:
+                    _als_solve_rows(arrays, side, lo, hi, global_mean, reg)
+            else:
+                tasks = [
+                    pool.submit(_als_pool_task, side, lo, hi, global_mean, reg)
+                    for lo, hi in chunks
+                ]
+                for task in tasks:
+                    task.result()
+
+        sse = _squared_error(arrays, global_mean)
+        _log_epoch(epoch, n_epochs, sse, n_ratings, time.perf_counter() - start)
+
+    return {key: arrays[key] for key in _FACTOR_KEYS}
+
+
+def _row_chunks(indptr, n_chunks):
+    """
+    Split rows into contiguous ranges holding roughly equal numbers of ratings.
+    """
+    n_rows = len(indptr) - 1
+    targets = np.linspace(0, indptr[-1], n_chunks + 1)[1:-1]
+    bounds = np.unique(
+        np.concatenate([[0], np.searchsorted(indptr, targets), [n_rows]])
+    )
+    return list(zip(bounds[:-1].tolist(), bounds[1:].tolist()))
+
+
+def _als_pool_task(side, start, end, global_mean, reg):
+    _als_solve_rows(_worker_arrays, side, start, end, global_mean, reg)
+
+
+def _als_solve_rows(arrays, side, start, end, global_mean, reg):
+    """
+    Solve the ridge regressions for rows [start, end) of one side in place.
+    """
+    if side == "user":
+        prefix, solved, fixed = "csr", "user", "movie"
+    else:
+        prefix, solved, fixed = "csc", "movie", "user"
+
+    indptr = arrays[f"{prefix}_indptr"]
+    indices = arrays[f"{prefix}_indices"]
+    data = arrays[f"{prefix}_data"]
+    solved_factors = arrays[f"{solved}_factors"]
+    solved_biases = arrays[f"{solved}_biases"]
+    fixed_factors = arrays[f"{fixed}_factors"]
+    fixed_biases = arrays[f"{fixed}_biases"]
+
+    n_factors = solved_factors.shape[1]
+    identity = np.eye(n_factors + 1)
+
+    for row in range(start, end):
+        lo, hi = indptr[row], indptr[row + 1]
+        if lo == hi:
+            continue
+
+        cols = indices[lo:hi]
+        # The trailing column of ones makes the row's bias part of the solve.
+        features = np.ones((hi - lo, n_factors + 1))
+        features[:, :n_factors] = fixed_factors[cols]
+        targets = data[lo:hi] - global_mean - fixed_biases[cols]
+
+        solution = np.linalg.solve(
+            features.T @ features + reg * (hi - lo) * identity,
+            features.T @ targets,
+        )
+        solved_factors[row] = solution[:n_factors]
+        solved_biases[row] = solution[n_factors]
+
+
+def _squared_error(arrays, global_mean, block_size=65536):
+    """
+    Sum of squared training errors, computed in blocks to bound memory.
+    """
+    ratings = arrays["csr_data"]
+    indptr = arrays["csr_indptr"]
+    users = np.repeat(np.arange(len(indptr) - 1), np.diff(indptr))
+
+    sse = 0.0
+    for lo in range(0, len(ratings), block_size):
+        u = users[lo : lo + block_size]
+        m = arrays["csr_indices"][lo : lo + block_size]
+        pred = (
+            global_mean
+            + arrays["user_biases"][u]
+            + arrays["movie_biases"][m]
+            + np.einsum(
+                "ij,ij->i", arrays["user_factors"][u], arrays["movie_factors"][m]
+            )
+        )
+        error = ratings[lo : lo + block_size] - pred
+        sse += float(error @ error)
+
+    return sse
+
+
+TRAINERS = {
+    "sgd": train_collaborative_filtering,
+    "als": train_als_collaborative_filtering,
+}
+
+# Fitters on encoded ratings, keyed like TRAINERS.
+_FITTERS = {"sgd": _fit_sgd, "als": _fit_als}
+
+
+def get_trainer(solver):
+    """
+    Return the training function registered under solver.
+    """
+    try:
+        return TRAINERS[solver]
+    except KeyError:
+        raise ValueError(
+            f"Unknown solver '{solver}'. Expected one of: {', '.join(TRAINERS)}"
+        )
+
+
+def tune_collaborative_filtering(
+    train_df, val_df, param_grid, solver="sgd", n_jobs=1, **train_options
+):
     """
     Tune hyperparameters for the collaborative filtering model.
+
+    The training ids are factorized once and shared by every grid point.
+    With n_jobs > 1 the grid points train concurrently in a process pool
+    whose workers attach to the encoded training and validation arrays in
+    shared memory, and each result is printed as soon as its run finishes.
+    solver names the trainer in TRAINERS; train_options (e.g. batch_size)
+    are passed to it for every grid point.
     """
-    results = []
-
-    for n_factors in param_grid.get("n_factors", [50]):
-        for n_epochs in param_grid.get("n_epochs", [20]):
-            for lr in param_grid.get("lr", [0.01]):
-                for reg in param_grid.get("reg", [0.01]):
-                    print(
-                        f"Training with n_factors={n_factors}, "
-                        f"n_epochs={n_epochs}, lr={lr}, reg={reg}"
-                    )
-
-                    model_data = train_collaborative_filtering(
-                        train_df, n_factors=n_factors, n_epochs=n_epochs, lr=lr, reg=reg
-                    )
-
-                    metrics = evaluate_model(model_data, val_df)
-
-                    results.append(
-                        {
-                            "n_factors": n_factors,
-                            "n_epochs": n_epochs,
-                            "lr": lr,
-                            "reg": reg,
-                            "rmse": metrics["RMSE"],
-                            "mae": metrics["MAE"],
-                            "coverage": metrics["coverage"],
-                        }
-                    )
+    get_trainer(solver)
+    data = _encode_ratings(train_df)
+    grid = _param_combinations(param_grid)
+
+    if n_jobs and n_jobs > 1 and len(grid) > 1:
+        results = _tune_in_pool(data, val_df, grid, solver, n_jobs, train_options)
+    else:
+        results = []
+        for params in grid:
+            print(
+                f"Training with n_factors={params['n_factors']}, "
+                f"n_epochs={params['n_epochs']}, lr={params['lr']}, "
+                f"reg={params['reg']}"
+            )
+
+            factors = _FITTERS[solver](data, **params, **train_options)
+            model_data = _build_model_data(
+                factors,
+                data["global_mean"],
+                data["unique_users"],
+                data["unique_movies"],
+            )
+
+            metrics = evaluate_model(model_data, val_df)
+            results.append(_tune_result(params, metrics))
 
     results_df = pd.DataFrame(results)
     best_idx = results_df["rmse"].idxmin()
@@ -129,3 +740,216 @@ def tune_collaborative_filtering(train_df, val_df, param_grid):
     print(f"Best parameters: {best_params}")
 
     return best_params
+
+
+def _param_combinations(param_grid):
+    """
+    Expand a parameter grid into a list of parameter dicts.
+    """
+    return [
+        {"n_factors": n_factors, "n_epochs": n_epochs, "lr": lr, "reg": reg}
+        for n_factors in param_grid.get("n_factors", [50])
+        for n_epochs in param_grid.get("n_epochs", [20])
+        for lr in param_grid.get("lr", [0.01])
+        for reg in param_grid.get("reg", [0.01])
+    ]
+
+
+def _tune_result(params, metrics):
+    return {**params, **_metrics(metrics)}
+
+
+def _tune_in_pool(data, val_df, grid, solver, n_jobs, train_options):
+    """
+    Train and score the grid points in a process pool, in completion order.
+    """
+    arrays = {
+        "user_indices": data["user_indices"],
+        "movie_indices": data["movie_indices"],
+        "ratings": data["ratings"],
+    }
+    if isinstance(val_df, RatingsMatrix):
+        arrays["val_user_indices"] = data["unique_users"].get_indexer(val_df.user_ids)[
+            val_df.user_codes
+        ]
+        arrays["val_movie_indices"] = data["unique_movies"].get_indexer(
+            val_df.movie_ids
+        )[val_df.movie_codes]
+        arrays["val_ratings"] = val_df.ratings
+    else:
+        arrays["val_user_indices"] = data["unique_users"].get_indexer(val_df["user_id"])
+        arrays["val_movie_indices"] = data["unique_movies"].get_indexer(
+            val_df["movie_id"]
+        )
+        arrays["val_ratings"] = val_df["rating"].to_numpy(dtype=float)
+    scalars = {
+        "n_users": data["n_users"],
+        "n_movies": data["n_movies"],
+        "global_mean": data["global_mean"],
+    }
+    results = [None] * len(grid)
+
+    with SharedArrays(arrays) as shared, ProcessPoolExecutor(
+        max_workers=min(n_jobs, len(grid)),
+        initializer=_attach_worker,
+        initargs=(shared.spec,),
+    ) as pool:
+        futures = {
+            pool.submit(_tune_pool_task, solver, params, scalars, train_options): i
+            for i, params in enumerate(grid)
+        }
+
+        for done, future in enumerate(as_completed(futures), start=1):
+            i = futures[future]
+            results[i] = _tune_result(grid[i], future.result())
+            print(
+                f"[{done}/{len(grid)}] n_factors={grid[i]['n_factors']}, "
+                f"n_epochs={grid[i]['n_epochs']}, lr={grid[i]['lr']}, "
+                f"reg={grid[i]['reg']} - RMSE: {results[i]['rmse']:.4f}"
+            )
+
+    return results
+
+
+def _tune_pool_task(solver, params, scalars, train_options):
+    data = {
+        **scalars,
+        "user_indices": _worker_arrays["user_indices"],
+        "movie_indices": _worker_arrays["movie_indices"],
+        "ratings": _worker_arrays["ratings"],
+    }
+    if solver == "als":
+        # Pool workers cannot start nested pools.
+        train_options = {**train_options, "n_jobs": 1}
+
+    factors = _FITTERS[solver](data, **params, **train_options)
+
+    return evaluate_encoded(
+        {**factors, "global_mean": data["global_mean"]},
+        _worker_arrays["val_user_indices"],
+        _worker_arrays["val_movie_indices"],
+        _worker_arrays["val_ratings"],
+    )
+
+
+def tune_successive_halving(
+    train_df,
+    val_df,
+    param_grid,
+    solver="sgd",
+    min_epochs=2,
+    reduction_factor=2,
+    patience=2,
+    min_delta=1e-4,
+    **train_options,
+):
+    """
+    Tune hyperparameters with successive halving and early stopping.
+
+    Every n_factors/lr/reg combination in param_grid first trains for
+    min_epochs and is scored on val_df with evaluate_model. Only the best
+    1/reduction_factor of them resume training, from the factors they
+    stopped at, until the next rung, whose epoch count is reduction_factor
+    times larger, capped by the largest n_epochs in the grid. A configuration
+    also stops early once its validation RMSE has not improved by min_delta
+    for patience rungs.
+
+    Returns best_params in the format of tune_collaborative_filtering, with
+    n_epochs set to where the best validation RMSE was reached, and a log
+    with the epochs, configurations and seconds spent per rung.
+    """
+    get_trainer(solver)
+    # Otherwise the rungs never reach max_epochs and the loop never ends.
+    if reduction_factor <= 1:
+        raise ValueError(f"reduction_factor must be above 1, got {reduction_factor}")
+    if min_epochs < 1:
+        raise ValueError(f"min_epochs must be at least 1, got {min_epochs}")
+    data = _encode_ratings(train_df)
+    max_epochs = int(max(param_grid.get("n_epochs", [20])))
+
+    configs = [
+        {"params": params, "factors": None, "epochs": 0, "stale": 0, "best": None}
+        for params in _param_combinations({**param_grid, "n_epochs": [None]})
+    ]
+    id_maps = _id_maps(data["unique_users"], data["unique_movies"])
+    rung_log = []
+    active = configs
+    target = min(int(min_epochs), max_epochs)
+
+    while active:
+        start = time.perf_counter()
+
+        for config in active:
+            params = config["params"]
+            print(
+                f"Rung {len(rung_log) + 1}: training n_factors={params['n_factors']}, "
+                f"lr={params['lr']}, reg={params['reg']} to epoch {target}"
+            )
+
+            config["factors"] = _FITTERS[solver](
+                data,
+                params["n_factors"],
+                target - config["epochs"],
+                params["lr"],
+                params["reg"],
+                factors=config["factors"],
+                **train_options,
+            )
+            config["epochs"] = target
+
+            model_data = {
+                **config["factors"],
+                "global_mean": data["global_mean"],
+                **id_maps,
+            }
+            metrics = evaluate_model(model_data, val_df)
+
+            best = config["best"]
+            if best is None or metrics["RMSE"] < best["rmse"] - min_delta:
+                config["best"] = {**params, "n_epochs": target, **_metrics(metrics)}
+                config["stale"] = 0
+            else:
+                config["stale"] += 1
+
+        running = [config for config in active if config["stale"] < patience]
+        rung_log.append(
+            {
+                "rung": len(rung_log) + 1,
+                "epochs": target,
+                "configs": len(active),
+                "stopped_early": len(active) - len(running),
+                "best_rmse": min(config["best"]["rmse"] for config in active),
+                "seconds": time.perf_counter() - start,
+            }
+        )
+
+        if target >= max_epochs:
+            break
+
+        running.sort(key=lambda config: config["best"]["rmse"])
+        active = running[: max(1, int(len(running) / reduction_factor))]
+        # Release the factors of configurations that will not train again.
+        survivors = {id(config) for config in active}
+        for config in configs:
+            if id(config) not in survivors:
+                config["factors"] = None
+        # Rounded up so a fractional reduction_factor still adds epochs.
+        target = min(int(ceil(target * reduction_factor)), max_epochs)
+
+    best_params = min(
+        (config["best"] for config in configs), key=lambda best: best["rmse"]
+    )
+
+    print("Successive halving rungs:")
+    print(pd.DataFrame(rung_log))
+    print(f"Best parameters: {best_params}")
+
+    return best_params, rung_log
+
+
+def _metrics(metrics):
+    return {
+        "rmse": metrics["RMSE"],
+        "mae": metrics["MAE"],
+        "coverage": metrics["coverage"],
+    }
@@ -1,7 +1,7 @@
 # evaluation.py
 import numpy as np
-from sklearn.metrics import mean_squared_error, mean_absolute_error
 from math import sqrt
+from data.ratings_matrix import RatingsMatrix, compress, lookup_codes
 
 
 def predict_rating(model_data, user_id, movie_id):
@@ -21,36 +21,260 @@ def predict_rating(model_data, user_id, movie_id):
     global_mean = model_data["global_mean"]
     pred = (
         global_mean
-        + user_biases[u]
-        + movie_biases[m]
-        + np.dot(user_factors[u], movie_factors[m])
+        + float(user_biases[u])
+        + float(movie_biases[m])
+        + float(np.dot(upcast(user_factors[u]), upcast(movie_factors[m])))
     )
     pred = max(1, min(5, pred))
     return pred
 
 
+def predict_all_movies(model_data, user_index, movie_offsets=None, movie_factors=None):
+    """
+    Predict clamped ratings of every movie for one model user row, with one
+    matrix-vector product. movie_offsets (global mean plus movie bias) and
+    the upcast movie_factors can be passed in precomputed
+    """
+    if movie_offsets is None:
+        movie_offsets = model_data["global_mean"] + upcast(model_data["movie_biases"])
+    if movie_factors is None:
+        movie_factors = upcast(model_data["movie_factors"])
+    user_vector = upcast(model_data["user_factors"][user_index])
+    user_bias = float(model_data["user_biases"][user_index])
+    return np.clip(movie_factors @ user_vector + movie_offsets + user_bias, 1, 5)
+
+
+def predict_users(model_data, user_indices, movie_offsets=None, movie_factors=None):
+    """
+    Predict clamped ratings of every movie for several model user rows at
+    once: one row of scores per user, from a single matrix product.
+    movie_offsets and movie_factors can be passed in precomputed, as for
+    predict_all_movies
+    """
+    if movie_offsets is None:
+        movie_offsets = model_data["global_mean"] + upcast(model_data["movie_biases"])
+    if movie_factors is None:
+        movie_factors = upcast(model_data["movie_factors"])
+    user_vectors = upcast(model_data["user_factors"][user_indices])
+    user_biases = upcast(model_data["user_biases"][user_indices])
+    return np.clip(
+        user_vectors @ movie_factors.T + movie_offsets + user_biases[:, np.newaxis],
+        1,
+        5,
+    )
+
+
 def predict_ratings_batch(model_data, user_ids, movie_ids):
     """
-    Predict ratings for multiple user-movie pairs
+    Predict ratings for multiple user-movie pairs, with None for pairs whose
+    user or movie the model does not know
     """
+    user_indices = lookup_codes(model_data["user_to_idx"], user_ids)
+    movie_indices = lookup_codes(model_data["movie_to_idx"], movie_ids)
+    known = (user_indices >= 0) & (movie_indices >= 0)
+
+    preds = np.full(len(known), np.nan)
+    preds[known] = predict_encoded(
+        model_data, user_indices[known], movie_indices[known]
+    )
     return [
-        predict_rating(model_data, user_id, movie_id)
-        for user_id, movie_id in zip(user_ids, movie_ids)
+        pred if known_pair else None
+        for pred, known_pair in zip(preds.tolist(), known.tolist())
     ]
 
 
 def evaluate_model(model_data, test_df):
     """
-    Evaluate the model on test data
-    """
-    user_ids = test_df["user_id"].values
-    movie_ids = test_df["movie_id"].values
-    true_ratings = test_df["rating"].values
-    pred_ratings = predict_ratings_batch(model_data, user_ids, movie_ids)
-    valid_indices = [i for i, r in enumerate(pred_ratings) if r is not None]
-    filtered_true = [true_ratings[i] for i in valid_indices]
-    filtered_pred = [pred_ratings[i] for i in valid_indices]
-    rmse = sqrt(mean_squared_error(filtered_true, filtered_pred))
-    mae = mean_absolute_error(filtered_true, filtered_pred)
-    coverage = len(valid_indices) / len(true_ratings)
-    return {"RMSE": rmse, "MAE": mae, "coverage": coverage, "count": len(filtered_true)}
+    Evaluate the model on test data (a DataFrame or RatingsMatrix)
+    """
+    if isinstance(test_df, RatingsMatrix):
+        user_indices, movie_indices = test_df.codes_in(
+            model_data["user_to_idx"], model_data["movie_to_idx"]
+        )
+        true_ratings = test_df.ratings
+    else:
+        user_indices = lookup_codes(model_data["user_to_idx"], test_df["user_id"])
+        movie_indices = lookup_codes(model_data["movie_to_idx"], test_df["movie_id"])
+        true_ratings = test_df["rating"].to_numpy(dtype=float)
+
+    return evaluate_encoded(model_data, user_indices, movie_indices, true_ratings)
+
+
+def evaluate_encoded(model_data, user_indices, movie_indices, true_ratings):
+    """
+    Evaluate on pairs already mapped to model row indices, where -1 marks an
+    id the model has not seen
+    """
+    user_indices = np.asarray(user_indices)
+    movie_indices = np.asarray(movie_indices)
+    known = (user_indices >= 0) & (movie_indices >= 0)
+
+    pred = predict_encoded(model_data, user_indices[known], movie_indices[known])
+    errors = np.asarray(true_ratings, dtype=float)[known] - pred
+    count = len(errors)
+
+    return {
+        "RMSE": sqrt(np.mean(errors**2)) if count else float("nan"),
+        "MAE": float(np.mean(np.abs(errors))) if count else float("nan"),
+        "coverage": count / len(known) if len(known) else 0.0,
+        "count": count,
+    }
+
+
+def predict_encoded(model_data, user_indices, movie_indices, block_size=65536):
+    """
+    Predict clamped ratings for known model row indices, in blocks to bound
+    the memory of the gathered factor rows
+    """
+    user_factors = np.asarray(model_data["user_factors"])
+    movie_factors = np.asarray(model_data["movie_factors"])
+    user_biases = np.asarray(model_data["user_biases"])
+    movie_biases = np.asarray(model_data["movie_biases"])
+
+    pred = np.empty(len(user_indices))
+    for lo in range(0, len(pred), block_size):
+        u = user_indices[lo : lo + block_size]
+        m = movie_indices[lo : lo + block_size]
+        pred[lo : lo + block_size] = (
+            model_data["global_mean"]
+            + upcast(user_biases[u])
+            + upcast(movie_biases[m])
+            + np.einsum("ij,ij->i", upcast(user_factors[u]), upcast(movie_factors[m]))
+        )
+
+    return np.clip(pred, 1, 5)
+
+
+def upcast(values):
+    """
+    Widen float16 storage to float32 for scoring; other dtypes pass through
+    """
+    values = np.asarray(values)
+    if values.dtype == np.float16:
+        return values.astype(np.float32)
+    return values
+
+
+def evaluate_ranking(
+    model_data, train_df, test_df, k=10, relevance_threshold=4.0, block_size=1024
+):
+    """
+    Score top-k recommendations for every user against the test split
+
+    Users are scored in blocks of block_size against the full movie factor
+    matrix, movies rated in train_df are masked out, and precision@k,
+    recall@k and NDCG@k are averaged over the users with at least one test
+    rating of relevance_threshold or more. train_df and test_df may be
+    DataFrames or RatingsMatrix objects.
+    """
+    user_factors = upcast(model_data["user_factors"])
+    movie_factors = upcast(model_data["movie_factors"])
+    user_biases = upcast(model_data["user_biases"])
+    movie_biases = upcast(model_data["movie_biases"])
+    n_users, n_movies = len(user_factors), len(movie_factors)
+
+    seen = _rows_by_user(model_data, train_df, n_users)
+    relevant = _rows_by_user(model_data, test_df, n_users, relevance_threshold)
+    n_relevant = np.diff(relevant[0])
+    users = np.flatnonzero(n_relevant)
+
+    discounts = 1 / np.log2(np.arange(2, k + 2))
+    precision = recall = ndcg = 0.0
+
+    for lo in range(0, len(users), block_size):
+        block = users[lo : lo + block_size]
+        scores = np.clip(
+            model_data["global_mean"]
+            + user_biases[block, np.newaxis]
+            + movie_biases
+            + user_factors[block] @ movie_factors.T,
+            1,
+            5,
+        )
+        scores[block_cells(seen, block)] = -np.inf
+        top = top_k_indices(scores, k)
+
+        is_relevant = np.zeros((len(block), n_movies), dtype=bool)
+        is_relevant[block_cells(relevant, block)] = True
+        rows = np.arange(len(block))[:, np.newaxis]
+        hits = is_relevant[rows, top] & np.isfinite(scores[rows, top])
+
+        block_relevant = n_relevant[block]
+        ideal = np.cumsum(discounts)[np.minimum(block_relevant, k) - 1]
+        precision += hits.sum() / k
+        recall += (hits.sum(axis=1) / block_relevant).sum()
+        ndcg += ((hits @ discounts[: top.shape[1]]) / ideal).sum()
+
+    n = len(users)
+    return {
+        f"precision@{k}": precision / n if n else float("nan"),
+        f"recall@{k}": recall / n if n else float("nan"),
+        f"NDCG@{k}": ndcg / n if n else float("nan"),
+        "users": n,
+    }
+
+
+def top_k_indices(scores, k):
+    """
+    Column indices of the k highest scores in each row, best first, with
+    ties broken by the lower index. Uses argpartition, so only the selected
+    columns are sorted.
+    """
+    if k < 0:
+        raise ValueError(f"k must not be negative, got {k}")
+    scores = np.atleast_2d(scores)
+    k = min(k, scores.shape[1])
+    if k == 0:
+        return np.empty((len(scores), 0), dtype=np.int64)
+
+    # The k-th best score of each row; every higher score is selected, and
+    # the lowest-index columns tied with it fill the remaining places.
+    kth = np.take_along_axis(
+        scores, np.argpartition(-scores, k - 1, axis=1)[:, k - 1 : k], axis=1
+    )
+    above = scores > kth
+    tied = scores == kth
+    n_tied = k - above.sum(axis=1, keepdims=True)
+    selected = above | (tied & (np.cumsum(tied, axis=1) <= n_tied))
+
+    top = np.nonzero(selected)[1].reshape(len(scores), k)
+    order = np.argsort(-np.take_along_axis(scores, top, axis=1), axis=1, kind="stable")
+    return np.take_along_axis(top, order, axis=1)
+
+
+def _rows_by_user(model_data, ratings_df, n_users, min_rating=None):
+    """
+    CSR layout (indptr, movie rows) of the ratings known to the model,
+    optionally only those of at least min_rating
+    """
+    if isinstance(ratings_df, RatingsMatrix):
+        user_indices, movie_indices = ratings_df.codes_in(
+            model_data["user_to_idx"], model_data["movie_to_idx"]
+        )
+        ratings = ratings_df.ratings
+    else:
+        user_indices = lookup_codes(model_data["user_to_idx"], ratings_df["user_id"])
+        movie_indices = lookup_codes(model_data["movie_to_idx"], ratings_df["movie_id"])
+        ratings = ratings_df["rating"].to_numpy(dtype=float)
+
+    keep = (user_indices >= 0) & (movie_indices >= 0)
+    if min_rating is not None:
+        keep &= ratings >= min_rating
+
+    indptr, movie_rows, _ = compress(
+        user_indices[keep], movie_indices[keep], ratings[keep], n_users
+    )
+    return indptr, movie_rows
+
+
+def block_cells(csr, block):
+    """
+    (row, column) index arrays of a CSR layout's entries for the users in
+    block, with rows numbered within the block
+    """
+    indptr, columns = csr
+    starts, ends = indptr[block], indptr[block + 1]
+    counts = ends - starts
+    rows = np.repeat(np.arange(len(block)), counts)
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    return rows, columns[np.repeat(starts, counts) + offsets]
@@ -0,0 +1,89 @@
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from numba import njit
+except ImportError:  # numba is only needed for multi-threaded SGD
+    njit = None
+
+
+def _sgd_shard(
+    user_factors,
+    movie_factors,
+    user_biases,
+    movie_biases,
+    user_indices,
+    movie_indices,
+    ratings,
+    rows,
+    global_mean,
+    lr,
+    reg,
+):
+    """
+    Per-rating SGD over ratings[rows], updating the factors in place.
+    Returns the SSE of the shard.
+    """
+    n_factors = user_factors.shape[1]
+    total_error = 0.0
+
+    for i in rows:
+        u = user_indices[i]
+        m = movie_indices[i]
+
+        pred = global_mean + user_biases[u] + movie_biases[m]
+        for k in range(n_factors):
+            pred += user_factors[u, k] * movie_factors[m, k]
+
+        error = ratings[i] - pred
+        total_error += error * error
+
+        user_biases[u] += lr * (error - reg * user_biases[u])
+        movie_biases[m] += lr * (error - reg * movie_biases[m])
+
+        for k in range(n_factors):
+            user_factor = user_factors[u, k]
+            movie_factor = movie_factors[m, k]
+            user_factors[u, k] += lr * (error * movie_factor - reg * user_factor)
+            movie_factors[m, k] += lr * (error * user_factor - reg * movie_factor)
+
+    return total_error
+
+
+_sgd_shard_kernel = None if njit is None else njit(nogil=True, cache=True)(_sgd_shard)
+
+
+def hogwild_epoch(
+    factors, user_indices, movie_indices, ratings, global_mean, lr, reg, n_threads
+):
+    """
+    Run one epoch of lock-free parallel SGD and return the SSE.
+
+    The shuffled ratings are split into n_threads shards. Each thread runs
+    the compiled kernel, which releases the GIL, on its shard and writes to
+    the shared factor arrays without locking; with many more rows than
+    threads, conflicting updates to the same row are rare and benign.
+    """
+    if _sgd_shard_kernel is None:
+        raise ImportError("Multi-threaded SGD (n_threads) requires numba.")
+
+    arrays = (
+        factors["user_factors"],
+        factors["movie_factors"],
+        factors["user_biases"],
+        factors["movie_biases"],
+        np.ascontiguousarray(user_indices),
+        np.ascontiguousarray(movie_indices),
+        np.ascontiguousarray(ratings),
+    )
+    shards = np.array_split(np.random.permutation(len(ratings)), n_threads)
+
+    if n_threads == 1:
+        return _sgd_shard_kernel(*arrays, shards[0], global_mean, lr, reg)
+
+    with ThreadPoolExecutor(max_workers=n_threads) as pool:
+        tasks = [
+            pool.submit(_sgd_shard_kernel, *arrays, rows, global_mean, lr, reg)
+            for rows in shards
+        ]
+        return sum(task.result() for task in tasks)
@@ -0,0 +1,57 @@
+from multiprocessing import shared_memory
+import numpy as np
+
+
+class SharedArrays:
+    """
+    Copy NumPy arrays into shared memory so pool workers can attach to them
+    by name instead of receiving pickled copies.
+    """
+
+    def __init__(self, arrays):
+        self._segments = []
+        self.arrays = {}
+        self.spec = {}
+
+        for name, array in arrays.items():
+            array = np.ascontiguousarray(array)
+            segment = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+            shared = np.ndarray(array.shape, dtype=array.dtype, buffer=segment.buf)
+            shared[...] = array
+
+            self._segments.append(segment)
+            self.arrays[name] = shared
+            self.spec[name] = (segment.name, array.shape, array.dtype.str)
+
+    def close(self):
+        """
+        Release and unlink every segment. Arrays must not be used afterwards.
+        """
+        self.arrays = {}
+        for segment in self._segments:
+            segment.close()
+            segment.unlink()
+        self._segments = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def attach_arrays(spec):
+    """
+    Attach to arrays created by SharedArrays from a worker process.
+
+    Returns the arrays and the open segments; the caller must keep the
+    segments referenced for as long as the arrays are in use.
+    """
+    arrays, segments = {}, []
+
+    for name, (segment_name, shape, dtype) in spec.items():
+        segment = shared_memory.SharedMemory(name=segment_name)
+        arrays[name] = np.ndarray(shape, dtype=np.dtype(dtype), buffer=segment.buf)
+        segments.append(segment)
+
+    return arrays, segments
@@ -0,0 +1,91 @@
+"""
+Production entry point: serves app.py with gunicorn.
+
+Usage (from Movie_Recommender):
+    python serve.py
+
+The parent process imports the app once, loading the model, data and
+serving index, and then forks the workers, which share those pages
+copy-on-write; the model arrays are memory-mapped, so they stay shared
+across processes. Each worker starts its own background threads (model
+watcher, popularity refresher, analytics sync, telemetry writers) after
+the fork. The analytics of each worker add what the others have written
+to the telemetry store every ANALYTICS_SYNC_SECONDS, so every dashboard
+counts the events of all workers.
+
+Configured with environment variables: PORT, SERVE_WORKERS (default: one
+per CPU), SERVE_THREADS (per worker, default 4), SERVE_TIMEOUT,
+SERVE_GRACEFUL_TIMEOUT and SERVE_MAX_REQUESTS (restart a worker after that
+many requests; 0 never does).
+
+Send the parent SIGHUP to replace the workers gracefully, or SIGTERM to
+stop once the requests in flight have finished.
+"""
+
+import gc
+import os
+from gunicorn.app.base import BaseApplication
+
+
+def options_from_env():
+    max_requests = int(os.environ.get("SERVE_MAX_REQUESTS", 0))
+    return {
+        "bind": f"0.0.0.0:{int(os.environ.get('PORT', 5000))}",
+        "workers": int(os.environ.get("SERVE_WORKERS", os.cpu_count() or 1)),
+        "threads": int(os.environ.get("SERVE_THREADS", 4)),
+        "worker_class": "gthread",
+        "preload_app": True,
+        "timeout": int(os.environ.get("SERVE_TIMEOUT", 30)),
+        "graceful_timeout": int(os.environ.get("SERVE_GRACEFUL_TIMEOUT", 30)),
+        "max_requests": max_requests,
+        # Spread the restarts so the workers do not all recycle at once.
+        "max_requests_jitter": max_requests // 10,
+        "post_fork": post_fork,
+        "worker_exit": worker_exit,
+    }
+
+
+def post_fork(server, worker):
+    import app as app_module
+
+    # Workers forked after a SIGHUP start from the parent's model and
+    # analytics, which may be older than what is on disk.
+    app_module.model_holder.reload()
+    app_module.analytics.rebuild(app_module.telemetry_store)
+    app_module.start_background_services()
+    # Lets analytics streams end when the worker is told to stop.
+    app_module.shutting_down = lambda: not worker.alive
+
+
+def worker_exit(server, worker):
+    import app as app_module
+
+    app_module.stop_background_services()
+
+
+class Server(BaseApplication):
+    """
+    Gunicorn application that loads app.py in the parent process.
+    """
+
+    def __init__(self, options):
+        self.options = options
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        # The workers start the background threads after the fork.
+        os.environ["START_BACKGROUND_SERVICES"] = "0"
+        from app import app
+
+        # Keep the collector from touching, and so copying, every object
+        # loaded so far in each worker.
+        gc.freeze()
+        return app
+
+
+if __name__ == "__main__":
+    Server(options_from_env()).run()
@@ -11,16 +11,72 @@ document.addEventListener('DOMContentLoaded', function() {
     const ratingCompletionElement = document.getElementById('ratingCompletion');
     const totalRecommendationsElement = document.getElementById('totalRecommendations');
     
-    // Fetch analytics data
-    fetchAnalyticsData();
+    // Time between refreshes when the browser cannot stream
+    const POLL_INTERVAL_MS = 30000;
+    // Stream errors in a row after which the dashboard polls instead
+    const MAX_STREAM_ERRORS = 3;
+    let analyticsStream = null;
+    let pollTimer = null;
+    let currentData = {};
+    
+    // Subscribe to live analytics updates
+    connectAnalyticsStream();
     
     // Add event listener for time range changes
     if (timeRangeSelector) {
         timeRangeSelector.addEventListener('change', function() {
-            fetchAnalyticsData(this.value);
+            connectAnalyticsStream(this.value);
         });
     }
     
+    // Function to stream analytics from the server: a full snapshot first,
+    // then only the metrics that changed. Falls back to polling.
+    function connectAnalyticsStream(timeRange = 'week') {
+        if (analyticsStream) {
+            analyticsStream.close();
+            analyticsStream = null;
+        }
+        clearInterval(pollTimer);
+        
+        if (!window.EventSource) {
+            startPolling(timeRange);
+            return;
+        }
+        
+        let streamErrors = 0;
+        analyticsStream = new EventSource(`/analytics-stream?timeRange=${timeRange}`);
+        analyticsStream.addEventListener('snapshot', event => {
+            streamErrors = 0;
+            currentData = JSON.parse(event.data);
+            renderAnalytics(currentData);
+        });
+        analyticsStream.addEventListener('delta', event => {
+            currentData = { ...currentData, ...JSON.parse(event.data) };
+            renderAnalytics(currentData);
+        });
+        // EventSource reconnects by itself and gets a new snapshot, unless
+        // the server refused the stream (e.g. a 503 when the worker already
+        // streams to enough dashboards) or it keeps failing.
+        analyticsStream.onerror = () => {
+            streamErrors += 1;
+            if (analyticsStream.readyState === EventSource.CLOSED || streamErrors >= MAX_STREAM_ERRORS) {
+                console.error('Analytics stream unavailable, polling instead');
+                analyticsStream.close();
+                analyticsStream = null;
+                startPolling(timeRange);
+            } else {
+                console.error('Analytics stream interrupted, reconnecting...');
+            }
+        };
+    }
+    
+    // Function to refresh the dashboard from /analytics-data periodically
+    function startPolling(timeRange) {
+        clearInterval(pollTimer);
+        fetchAnalyticsData(timeRange);
+        pollTimer = setInterval(() => fetchAnalyticsData(timeRange), POLL_INTERVAL_MS);
+    }
+    
     // Function to validate and normalize percentages
     function normalizePercentage(value) {
         // Ensure the value is a number between 0 and 100
@@ -37,22 +93,7 @@ document.addEventListener('DOMContentLoaded', function() {
                 }
                 return response.json();
             })
-            .then(data => {
-                // Validate and clean the data before updating
-                const cleanedData = {
-                    ...data,
-                    rated_percentage: normalizePercentage(data.rated_percentage),
-                    clicked_not_rated_percentage: normalizePercentage(data.clicked_not_rated_percentage),
-                    not_clicked_percentage: normalizePercentage(data.not_clicked_percentage),
-                    click_through_rate: normalizePercentage(data.click_through_rate),
-                    rating_completion_rate: normalizePercentage(data.rating_completion_rate)
-                };
-                
-                updateDashboard(cleanedData);
-                updateUserEngagementChart(cleanedData);
-                createRatingDistributionChart(cleanedData.rating_distribution);
-
-            })
+            .then(data => renderAnalytics(data))
             .catch(error => {
                 console.error('Error fetching analytics data:', error);
                 // Display error message on the dashboard
@@ -62,6 +103,23 @@ document.addEventListener('DOMContentLoaded', function() {
             });
     }
     
+    // Function to render a complete set of metrics
+    function renderAnalytics(data) {
+        // Validate and clean the data before updating
+        const cleanedData = {
+            ...data,
+            rated_percentage: normalizePercentage(data.rated_percentage),
+            clicked_not_rated_percentage: normalizePercentage(data.clicked_not_rated_percentage),
+            not_clicked_percentage: normalizePercentage(data.not_clicked_percentage),
+            click_through_rate: normalizePercentage(data.click_through_rate),
+            rating_completion_rate: normalizePercentage(data.rating_completion_rate)
+        };
+        
+        updateDashboard(cleanedData);
+        updateUserEngagementChart(cleanedData);
+        createRatingDistributionChart(cleanedData.rating_distribution);
+    }
+    
     // Function to update dashboard metrics
     function updateDashboard(data) {
         // Update summary metrics
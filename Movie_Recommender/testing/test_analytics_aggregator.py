@@ -0,0 +1,138 @@
+from datetime import datetime, timedelta
+import pytest
+from frontend.analytics_aggregator import AnalyticsAggregator
+from frontend.telemetry_store import TelemetryStore
+
+
+def test_query_merges_buckets_in_window():
+    aggregator = AnalyticsAggregator()
+    now = datetime.now()
+    aggregator.add_event(now, "recommendations_shown", 1)
+    aggregator.add_event(now - timedelta(hours=5), "movie_card_clicked", "2")
+    aggregator.add_event(now - timedelta(days=3), "movie_card_clicked", 3)
+    aggregator.add_rating(now.isoformat(), "Movie A", "4")
+    aggregator.add_rating((now - timedelta(hours=2)).isoformat(), "Movie A", 5)
+    aggregator.add_rating(now.isoformat(), "Movie B", 0)
+    aggregator.add_rating("not a time", "Movie C", 3)
+    # A clock far ahead must not push the current buckets out.
+    aggregator.add_rating("2099-01-01T00:00:00", "Movie D", 1)
+
+    day = aggregator.query(now - timedelta(days=1))
+    assert day["events"] == {"recommendations_shown": 1, "movie_card_clicked": 1}
+    assert day["ratings"] == {4.0: 1, 5.0: 1, 0.0: 1, 1.0: 1}
+    assert day["movies"] == {"Movie A": [9.0, 2], "Movie D": [1.0, 1]}
+    assert day["unique_users"] == 2
+
+    assert aggregator.query(now - timedelta(hours=1))["events"] == {"recommendations_shown": 1}
+    assert aggregator.query()["events"]["movie_card_clicked"] == 2
+    assert aggregator.query()["unique_users"] == 3
+
+
+def test_unique_users_estimate():
+    aggregator = AnalyticsAggregator()
+    now = datetime.now()
+    for i in range(20000):
+        aggregator.add_event(now - timedelta(minutes=i % 600), "recommendations_shown", i)
+
+    assert aggregator.query()["unique_users"] == pytest.approx(20000, rel=0.05)
+    assert aggregator.query(now - timedelta(days=1))["unique_users"] == pytest.approx(20000, rel=0.05)
+
+
+def test_minute_buckets_only_cover_recent_hours():
+    aggregator = AnalyticsAggregator(minute_hours=2)
+    now = datetime.now()
+    for i in range(0, 30 * 1440, 7):
+        aggregator.add_event(now - timedelta(minutes=i), "recommendations_shown", i)
+
+    assert len(aggregator._minutes) <= 3 * 60
+    assert len(aggregator._hours) <= 30 * 24 + 1
+    # Recent windows are counted to the minute, older starts to the nearest hour.
+    assert aggregator.query(now - timedelta(minutes=90))["events"]["recommendations_shown"] == 13
+    day = aggregator.query(now - timedelta(days=1))["events"]["recommendations_shown"]
+    assert abs(day - 1440 // 7) <= 5
+
+
+def test_rebuild_matches_live_updates(tmp_path):
+    store = TelemetryStore(str(tmp_path))
+    live = AnalyticsAggregator()
+    now = datetime.now()
+    rows = []
+    for i in range(50):
+        when = now - timedelta(hours=i * 7)
+        event = ["recommendations_shown", "movie_card_clicked", "movie_rated"][i % 3]
+        rows.append([when.isoformat(), event, str(i % 11), "{}"])
+        live.add_event(when, event, i % 11)
+    store.append("telemetry", rows)
+    store.append("ratings", [["1", "Movie A", "3", "True", now.isoformat()]])
+    live.add_rating(now.isoformat(), "Movie A", 3)
+
+    rebuilt = AnalyticsAggregator()
+    rebuilt.rebuild(store)
+
+    for start in (None, now - timedelta(days=1), now - timedelta(days=7)):
+        assert rebuilt.query(start) == live.query(start)
+
+
+def test_events_without_user_are_not_counted_as_users(tmp_path):
+    store = TelemetryStore(str(tmp_path))
+    live = AnalyticsAggregator()
+    now = datetime.now()
+    live.add_event(now, "batch_recommendations_served", None)
+    live.add_event(now, "recommendations_served", "7")
+    store.append("telemetry", [
+        [now.isoformat(), "batch_recommendations_served", None, "{}"],
+        [now.isoformat(), "recommendations_served", "7", "{}"],
+    ])
+
+    rebuilt = AnalyticsAggregator()
+    rebuilt.rebuild(store)
+
+    for aggregator in (live, rebuilt):
+        assert aggregator.query()["events"]["batch_recommendations_served"] == 1
+        assert aggregator.query()["unique_users"] == 1
+        assert aggregator.query(now - timedelta(hours=1))["unique_users"] == 1
+
+
+def test_sync_adds_rows_of_other_processes_once(tmp_path, monkeypatch):
+    import os
+    from datetime import date
+
+    store = TelemetryStore(str(tmp_path))
+    now = datetime.now()
+    own_pid = os.getpid()
+    aggregator = AnalyticsAggregator()
+    aggregator.rebuild(store)
+
+    def log_as(pid, user_id):
+        monkeypatch.setattr(os, "getpid", lambda: pid)
+        store.append("telemetry", [[now.isoformat(), "recommendations_served", user_id, "{}"]])
+        monkeypatch.setattr(os, "getpid", lambda: own_pid)
+
+    # This process counts its own events as they are logged; the other
+    # workers' events arrive through the store.
+    aggregator.add_event(now, "recommendations_served", "1")
+    log_as(own_pid, "1")
+    log_as(own_pid + 1, "2")
+    log_as(own_pid + 2, "3")
+    aggregator.sync(store)
+
+    assert aggregator.query()["events"]["recommendations_served"] == 3
+    assert aggregator.query()["unique_users"] == 3
+
+    store.compact("telemetry", before=date.today() + timedelta(days=1))
+    log_as(own_pid + 1, "4")
+    aggregator.sync(store)
+
+    rebuilt = AnalyticsAggregator()
+    rebuilt.rebuild(store)
+    assert aggregator.query()["events"]["recommendations_served"] == 4
+    assert aggregator.query() == rebuilt.query()
+
+
+def test_wait_for_change():
+    aggregator = AnalyticsAggregator()
+    version = aggregator.version
+
+    assert aggregator.wait_for_change(version, timeout=0.01) == version
+    aggregator.add_event(datetime.now(), "movie_rated", 1)
+    assert aggregator.wait_for_change(version, timeout=0.01) == version + 1
@@ -22,6 +22,16 @@ def test_get_recommendations(mock_recommend, client):
     assert "recommendations" in response.json
     assert len(response.json["recommendations"]) == 2
 
+@pytest.mark.parametrize("count", [0, -3, 101])
+def test_recommendation_count_out_of_range(client, count):
+    response = client.get(f"/recommendations/123?count={count}")
+    assert response.status_code == 400
+    assert "count" in response.json["error"]
+
+    response = client.post("/recommendations/batch", json={"user_ids": ["123"], "count": count})
+    assert response.status_code == 400
+    assert "count" in response.json["error"]
+
 def test_submit_rating(client):
     rating_data = {
         "user_id": "123",
@@ -34,3 +44,140 @@ def test_submit_rating(client):
     
     assert response.status_code == 200
     assert response.json["success"] is True
+
+def test_writers_not_started(client, monkeypatch):
+    import app as app_module
+
+    monkeypatch.setattr(app_module, "telemetry_writer", None)
+    monkeypatch.setattr(app_module, "ratings_writer", None)
+    monkeypatch.setattr(app_module.model_holder, "snapshot", lambda: ({}, "v1"))
+
+    response = client.get("/health")
+    assert response.status_code == 200
+    assert response.json["telemetry"] == "not started"
+
+    rating_data = {
+        "user_id": "123",
+        "movie_name": "Test Movie",
+        "rating": 5,
+        "watched": True,
+        "timestamp": "2025-03-18T12:00:00"
+    }
+    response = client.post("/submit-rating", json=rating_data)
+    assert response.status_code == 503
+
+def test_analytics_data(client):
+    response = client.get("/analytics-data?timeRange=day")
+
+    assert response.status_code == 200
+    assert "error" not in response.json
+    assert "unique_users" in response.json
+
+def test_analytics_stream_sends_snapshot_then_delta(client, monkeypatch):
+    import json
+    import app as app_module
+
+    monkeypatch.setattr(app_module, "ANALYTICS_STREAM_INTERVAL", 0)
+    response = client.get("/analytics-stream?timeRange=day", buffered=False)
+    events = iter(response.response)
+
+    first = next(events)
+    first = first.decode() if isinstance(first, bytes) else first
+    assert first.startswith("event: snapshot\n")
+
+    client.post("/log-telemetry", json={"event": "recommendations_shown", "user_id": "stream-test"})
+    delta = next(events)
+    delta = delta.decode() if isinstance(delta, bytes) else delta
+    assert delta.startswith("event: delta\n")
+    assert "total_recommendations" in json.loads(delta.split("data: ", 1)[1])
+    response.close()
+
+
+def test_analytics_streams_are_capped_per_process(client, monkeypatch):
+    import threading
+    import app as app_module
+
+    monkeypatch.setattr(app_module, "analytics_streams", threading.BoundedSemaphore(1))
+    first = client.get("/analytics-stream?timeRange=day", buffered=False)
+    assert first.status_code == 200
+
+    # Over the cap the dashboard is told to poll instead.
+    refused = client.get("/analytics-stream?timeRange=day", buffered=False)
+    assert refused.status_code == 503
+
+    first.close()
+    again = client.get("/analytics-stream?timeRange=day", buffered=False)
+    assert again.status_code == 200
+    again.close()
+
+
+def test_analytics_stream_ends_on_shutdown(client, monkeypatch):
+    import app as app_module
+
+    monkeypatch.setattr(app_module, "shutting_down", lambda: True)
+    response = client.get("/analytics-stream?timeRange=day", buffered=False)
+
+    events = [e.decode() if isinstance(e, bytes) else e for e in response.response]
+    assert len(events) == 1 and events[0].startswith("event: snapshot\n")
+    response.close()
+
+
+def test_load_serving_state_without_ratings_file(tmp_path, monkeypatch):
+    import json
+    import os
+    import numpy as np
+    import pandas as pd
+    import app as app_module
+    from model.artifact import save_artifact
+    from utils.serving_index import seen_index_from_rows, seen_popularity
+
+    model = {
+        "user_to_idx": {"u1": 0, "u2": 1},
+        "movie_to_idx": {"m1": 0, "m2": 1, "m3": 2},
+        "user_factors": np.array([[0.1, 0.2], [0.3, 0.1]]),
+        "movie_factors": np.array([[0.3, 0.4], [0.5, 0.6], [0.2, 0.1]]),
+        "user_biases": np.array([0.0, 0.1]),
+        "movie_biases": np.array([0.1, 0.0, -0.1]),
+        "global_mean": 3.5,
+    }
+    seen_index = seen_index_from_rows(np.array([0, 1, 1]), np.array([1, 1, 2]), 2)
+    monkeypatch.chdir(tmp_path)
+    os.makedirs("dataframes")
+    pd.DataFrame({
+        "movie_id": ["m1", "m2", "m3"],
+        "json_data": [json.dumps({"title": f"Title {i}"}) for i in (1, 2, 3)],
+    }).to_csv("dataframes/movies.csv", index=False)
+    save_artifact(model, app_module.MODEL_DIR, extras={
+        "seen_index": {"indptr": seen_index[0], "movie_rows": seen_index[1]},
+        "popularity": seen_popularity(model, seen_index),
+    })
+
+    # The model carries everything ratings.csv was read for.
+    state = app_module.load_serving_state()
+
+    assert state["ratings_df"] is None
+    assert app_module.recommend_movies_for_user(
+        state["model"], state["movies_df"], None, "u2", 3, serving_index=state["serving_index"]
+    ) == ["Title 1"]
+    assert app_module.recommend_movies_for_user(
+        state["model"], state["movies_df"], None, "new", 2, serving_index=state["serving_index"]
+    ) == ["Title 2", "Title 3"]
+
+
+def test_recent_ratings_maps_titles_to_movie_ids(tmp_path, monkeypatch):
+    import app as app_module
+    from frontend.telemetry_store import TelemetryStore
+    from datetime import datetime, timedelta, timezone
+
+    store = TelemetryStore(str(tmp_path))
+    now = datetime.now(timezone.utc)
+    store.append("ratings", [
+        ["u1", "The Matrix", 5, True, now.isoformat()],
+        ["u2", "Unknown Movie", 4, True, now.isoformat()],
+        ["u3", "The Matrix", 3, True, (now - timedelta(days=30)).isoformat()],
+    ])
+    monkeypatch.setattr(app_module, "telemetry_store", store)
+
+    ratings = app_module.recent_ratings({"titles": {"the+matrix+1999": "The+Matrix"}})
+
+    assert ratings["movie_id"].tolist() == ["the+matrix+1999"]
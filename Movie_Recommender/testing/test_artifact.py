@@ -0,0 +1,148 @@
+import os
+import time
+import numpy as np
+import pandas as pd
+import pytest
+from data.ratings_matrix import IdIndex, lookup_codes
+from model.artifact import (
+    CURRENT_FILE,
+    artifact_path,
+    artifact_version,
+    load_artifact,
+    load_extra,
+    save_artifact,
+)
+from model.collaborative_filtering import train_collaborative_filtering
+from model.evaluation import predict_ratings_batch
+from utils.recommender import top_movies_for_user
+
+
+@pytest.fixture
+def ratings_df():
+    return pd.DataFrame({
+        "user_id": [3, 1, 2, 3, 1, 2, 4, 3, 2, 1],
+        "movie_id": ["c", "a", "a", "b", "b", "c", "d", "a", "b", "c"],
+        "rating": [5, 4, 3, 2, 3, 4, 5, 1, 2, 4],
+    })
+
+
+def test_id_index_matches_dict():
+    id_to_idx = {"b": 0, "a": 1, "c": 2}
+    index = IdIndex.from_dict(id_to_idx)
+
+    assert len(index) == 3
+    assert dict(index.items()) == id_to_idx
+    assert index["a"] == 1 and index.get("c") == 2
+    assert "z" not in index and index.get("z", -1) == -1
+    # Like a dict, ids of another type are simply unknown.
+    assert 1 not in index
+    with pytest.raises(KeyError):
+        index["z"]
+
+    ids = pd.Series(["c", "z", "a", "b", None])
+    assert lookup_codes(index, ids).tolist() == [2, -1, 1, 0, -1]
+    assert lookup_codes(index, ids).tolist() == lookup_codes(id_to_idx, ids).tolist()
+
+
+def test_artifact_round_trip(ratings_df, tmp_path):
+    model = train_collaborative_filtering(ratings_df, n_factors=3, n_epochs=5)
+    directory = str(tmp_path / "cf_model")
+
+    version = save_artifact(model, directory)
+    loaded = load_artifact(directory)
+
+    assert artifact_version(directory) == version
+    assert isinstance(loaded["user_factors"], np.memmap)
+    assert not loaded["user_factors"].flags.writeable
+    assert loaded["global_mean"] == pytest.approx(model["global_mean"])
+    assert dict(loaded["movie_to_idx"].items()) == model["movie_to_idx"]
+
+    users, movies = [1, 2, 5, 4], ["a", "c", "a", "x"]
+    assert predict_ratings_batch(loaded, users, movies) == predict_ratings_batch(
+        model, users, movies
+    )
+    assert top_movies_for_user(loaded, ratings_df, 4, 3) == top_movies_for_user(
+        model, ratings_df, 4, 3
+    )
+
+
+def test_save_artifact_replaces_previous(ratings_df, tmp_path):
+    directory = str(tmp_path / "cf_model")
+    first = train_collaborative_filtering(ratings_df, n_factors=3, n_epochs=1)
+    second = train_collaborative_filtering(ratings_df, n_factors=4, n_epochs=1)
+
+    save_artifact(first, directory)
+    previous = artifact_path(directory)
+    save_artifact(second, directory)
+    save_artifact(second, directory)
+
+    assert load_artifact(directory)["user_factors"].shape[1] == 4
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["cf_model"]
+    # Only the current version and the one before it are kept.
+    versions = [p for p in (tmp_path / "cf_model").iterdir() if p.is_dir()]
+    assert len(versions) == 2
+    assert not (tmp_path / "cf_model" / previous).exists()
+    assert (tmp_path / "cf_model" / CURRENT_FILE).read_text() in [p.name for p in versions]
+    assert artifact_version(str(tmp_path / "missing")) is None
+
+
+def test_save_artifact_removes_stale_staging(ratings_df, tmp_path):
+    directory = tmp_path / "cf_model"
+    model = train_collaborative_filtering(ratings_df, n_factors=3, n_epochs=1)
+    save_artifact(model, str(directory))
+
+    # Left by saves that crashed a day ago, and by one still running.
+    crashed = directory / ".20240101T000000000000.tmp"
+    crashed.mkdir()
+    (crashed / "user_factors.npy").write_bytes(b"")
+    crashed_pointer = directory / ".20240101T000000000000.CURRENT"
+    crashed_pointer.write_text("20240101T000000000000")
+    a_day_ago = time.time() - 86400
+    for path in (crashed / "user_factors.npy", crashed, crashed_pointer):
+        os.utime(path, (a_day_ago, a_day_ago))
+    running = directory / ".29990101T000000000000.tmp"
+    running.mkdir()
+
+    save_artifact(model, str(directory))
+
+    assert not crashed.exists()
+    assert not crashed_pointer.exists()
+    assert running.exists()
+
+
+def test_artifact_extras_round_trip(ratings_df, tmp_path):
+    model = train_collaborative_filtering(ratings_df, n_factors=3, n_epochs=1)
+    directory = str(tmp_path / "cf_model")
+
+    save_artifact(model, directory, extras={
+        "seen_index": {"indptr": np.array([0, 1, 3]), "movie_rows": np.array([2, 0, 1])},
+        "popularity": {"all_time": np.array(["b", "a"], dtype=object)},
+    })
+
+    seen = load_extra(directory, "seen_index")
+    assert seen["indptr"].tolist() == [0, 1, 3]
+    assert seen["movie_rows"].tolist() == [2, 0, 1]
+    assert load_extra(directory, "popularity")["all_time"].tolist() == ["b", "a"]
+    assert load_extra(directory, "missing") is None
+
+
+def test_load_artifact_saved_before_versions(ratings_df, tmp_path):
+    model = train_collaborative_filtering(ratings_df, n_factors=3, n_epochs=1)
+    directory = tmp_path / "cf_model"
+    save_artifact(model, str(directory))
+
+    # Lay the version out flat, as artifacts were saved before versions.
+    version = directory / (directory / CURRENT_FILE).read_text()
+    for path in version.iterdir():
+        path.rename(directory / path.name)
+    version.rmdir()
+    (directory / CURRENT_FILE).unlink()
+
+    assert artifact_path(str(directory)) == str(directory)
+    assert dict(load_artifact(str(directory))["movie_to_idx"].items()) == model["movie_to_idx"]
+
+    # The next save moves to the versioned layout and drops the flat files.
+    save_artifact(model, str(directory))
+    assert not (directory / "manifest.json").exists()
+    assert not list(directory.glob("*.npy"))
+    assert load_artifact(str(directory))["user_factors"].shape == model["user_factors"].shape
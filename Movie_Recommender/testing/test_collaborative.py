@@ -1,8 +1,14 @@
 import math
+import numpy as np
 import pandas as pd
 import pytest
 from unittest.mock import patch
-from model.collaborative_filtering import train_collaborative_filtering, tune_collaborative_filtering
+from model.collaborative_filtering import (
+    get_trainer,
+    train_als_collaborative_filtering,
+    train_collaborative_filtering,
+    tune_collaborative_filtering,
+)
 
 @pytest.fixture
 def dummy_ratings_df():
@@ -81,3 +87,274 @@ def test_tune_collaborative_filtering(mock_evaluate_model, dummy_ratings_df):
         "coverage": 0.8,
     }
     assert best_params == expected_best
+
+def test_train_collaborative_filtering_minibatch(dummy_ratings_df):
+    # Mini-batch training should return the same model layout as per-rating SGD.
+    model_data = train_collaborative_filtering(
+        dummy_ratings_df, n_factors=4, n_epochs=3, lr=0.01, reg=0.01, batch_size=4
+    )
+
+    assert model_data["user_factors"].shape == (3, 4)
+    assert model_data["movie_factors"].shape == (3, 4)
+    assert model_data["user_to_idx"] == {1: 0, 2: 1, 3: 2}
+    assert model_data["idx_to_movie"] == {0: 101, 1: 102, 2: 103}
+
+def test_minibatch_epoch_matches_single_rating_update(dummy_ratings_df):
+    # With one rating per batch, a mini-batch epoch is exactly per-rating SGD.
+    from model.collaborative_filtering import _sgd_epoch, _sgd_minibatch_epoch
+
+    user_indices = np.array([0, 1, 2, 0, 1, 2])
+    movie_indices = np.array([0, 0, 0, 1, 1, 2])
+    ratings = dummy_ratings_df["rating"].to_numpy(dtype=float)
+
+    np.random.seed(0)
+    initial = {
+        "user_factors": np.random.normal(0, 0.1, (3, 4)),
+        "movie_factors": np.random.normal(0, 0.1, (3, 4)),
+        "user_biases": np.zeros(3),
+        "movie_biases": np.zeros(3),
+    }
+    serial = {key: value.copy() for key, value in initial.items()}
+    batched = {key: value.copy() for key, value in initial.items()}
+
+    np.random.seed(1)
+    serial_sse = _sgd_epoch(serial, user_indices, movie_indices, ratings, 3.5, 0.01, 0.01)
+    np.random.seed(1)
+    batched_sse = _sgd_minibatch_epoch(
+        batched, user_indices, movie_indices, ratings, 3.5, 0.01, 0.01, 1
+    )
+
+    assert math.isclose(serial_sse, batched_sse, rel_tol=1e-9)
+    for key in initial:
+        np.testing.assert_allclose(serial[key], batched[key])
+
+def test_train_als_collaborative_filtering(dummy_ratings_df):
+    model_data = train_als_collaborative_filtering(
+        dummy_ratings_df, n_factors=2, n_epochs=5, reg=0.1, n_jobs=1
+    )
+
+    assert set(model_data.keys()) == {
+        "user_factors", "movie_factors", "user_biases", "movie_biases",
+        "global_mean", "user_to_idx", "movie_to_idx", "idx_to_user", "idx_to_movie",
+    }
+    assert model_data["user_factors"].shape == (3, 2)
+    assert model_data["movie_biases"].shape == (3,)
+
+def test_als_process_pool_matches_in_process(dummy_ratings_df):
+    # Worker processes solve the same ridge systems, so results are identical.
+    np.random.seed(0)
+    serial = train_als_collaborative_filtering(dummy_ratings_df, 2, 3, reg=0.1, n_jobs=1)
+    np.random.seed(0)
+    pooled = train_als_collaborative_filtering(dummy_ratings_df, 2, 3, reg=0.1, n_jobs=2)
+
+    for key in ("user_factors", "movie_factors", "user_biases", "movie_biases"):
+        np.testing.assert_allclose(serial[key], pooled[key])
+
+def test_get_trainer_unknown_solver():
+    assert get_trainer("als") is train_als_collaborative_filtering
+    with pytest.raises(ValueError):
+        get_trainer("svd")
+
+def test_tune_collaborative_filtering_parallel(dummy_ratings_df):
+    # Grid points run in a process pool against shared-memory arrays.
+    param_grid = {"n_factors": [2, 3], "n_epochs": [2], "lr": [0.01], "reg": [0.1]}
+
+    best_params = tune_collaborative_filtering(
+        dummy_ratings_df, dummy_ratings_df.copy(), param_grid, n_jobs=2, batch_size=2
+    )
+
+    assert set(best_params) == {"n_factors", "n_epochs", "lr", "reg", "rmse", "mae", "coverage"}
+    assert best_params["n_factors"] in (2, 3)
+    assert best_params["coverage"] == 1.0
+
+@patch("model.collaborative_filtering.evaluate_model")
+def test_tune_successive_halving(mock_evaluate_model, dummy_ratings_df):
+    from model.collaborative_filtering import tune_successive_halving
+
+    # Two configurations and a 4-epoch budget: both train 2 epochs, then only
+    # the better one (n_factors=20) resumes to epoch 4.
+    param_grid = {"n_factors": [10, 20], "n_epochs": [4], "lr": [0.01], "reg": [0.01]}
+    mock_evaluate_model.side_effect = [
+        {"RMSE": 1.5, "MAE": 1.0, "coverage": 0.8, "count": 100},
+        {"RMSE": 1.3, "MAE": 1.0, "coverage": 0.8, "count": 100},
+        {"RMSE": 1.1, "MAE": 0.9, "coverage": 0.8, "count": 100},
+    ]
+
+    best_params, rung_log = tune_successive_halving(
+        dummy_ratings_df, dummy_ratings_df.copy(), param_grid, min_epochs=2
+    )
+
+    assert best_params == {
+        "n_factors": 20,
+        "n_epochs": 4,
+        "lr": 0.01,
+        "reg": 0.01,
+        "rmse": 1.1,
+        "mae": 0.9,
+        "coverage": 0.8,
+    }
+    assert [rung["epochs"] for rung in rung_log] == [2, 4]
+    assert [rung["configs"] for rung in rung_log] == [2, 1]
+    assert all(rung["seconds"] >= 0 for rung in rung_log)
+
+@patch("model.collaborative_filtering.evaluate_model")
+def test_tune_successive_halving_early_stopping(mock_evaluate_model, dummy_ratings_df):
+    from model.collaborative_filtering import tune_successive_halving
+
+    # RMSE stops improving after the first rung, so training ends before the
+    # 16-epoch budget and the best score keeps its epoch count.
+    param_grid = {"n_factors": [10], "n_epochs": [16], "lr": [0.01], "reg": [0.01]}
+    mock_evaluate_model.side_effect = [
+        {"RMSE": 1.0, "MAE": 0.8, "coverage": 1.0, "count": 6},
+        {"RMSE": 1.2, "MAE": 0.9, "coverage": 1.0, "count": 6},
+    ]
+
+    best_params, rung_log = tune_successive_halving(
+        dummy_ratings_df, dummy_ratings_df.copy(), param_grid, min_epochs=2, patience=1
+    )
+
+    assert best_params["n_epochs"] == 2
+    assert best_params["rmse"] == 1.0
+    assert rung_log[-1]["stopped_early"] == 1
+    assert len(rung_log) == 2
+
+@patch("model.collaborative_filtering.evaluate_model")
+def test_tune_successive_halving_fractional_reduction_factor(mock_evaluate_model, dummy_ratings_df):
+    from model.collaborative_filtering import tune_successive_halving
+
+    # Rungs grow 1 -> 2 -> 3 -> 5 epochs and keep 3 -> 2 -> 1 configurations.
+    param_grid = {"n_factors": [2, 3, 4], "n_epochs": [5], "lr": [0.01], "reg": [0.01]}
+    mock_evaluate_model.side_effect = [
+        {"RMSE": 2.0 - 0.1 * i, "MAE": 1.0, "coverage": 1.0, "count": 6} for i in range(7)
+    ]
+
+    best_params, rung_log = tune_successive_halving(
+        dummy_ratings_df, dummy_ratings_df.copy(), param_grid, min_epochs=1, reduction_factor=1.5
+    )
+
+    assert [rung["epochs"] for rung in rung_log] == [1, 2, 3, 5]
+    assert [rung["configs"] for rung in rung_log] == [3, 2, 1, 1]
+    assert best_params["n_epochs"] == 5
+
+def test_tune_successive_halving_rejects_rungs_that_never_grow(dummy_ratings_df):
+    from model.collaborative_filtering import tune_successive_halving
+
+    param_grid = {"n_factors": [10], "n_epochs": [4], "lr": [0.01], "reg": [0.01]}
+    with pytest.raises(ValueError):
+        tune_successive_halving(
+            dummy_ratings_df, dummy_ratings_df.copy(), param_grid, reduction_factor=1
+        )
+    with pytest.raises(ValueError):
+        tune_successive_halving(
+            dummy_ratings_df, dummy_ratings_df.copy(), param_grid, min_epochs=0
+        )
+
+def test_warm_start_collaborative_filtering(dummy_ratings_df):
+    from model.collaborative_filtering import warm_start_collaborative_filtering
+
+    model_data = train_collaborative_filtering(dummy_ratings_df, 4, 2, 0.01, 0.01)
+    old_user_factors = model_data["user_factors"].copy()
+
+    # One known user rates a new movie, and a new user rates a known movie.
+    delta_df = pd.DataFrame({
+        "user_id": [1, 4],
+        "movie_id": [104, 101],
+        "rating": [5, 3],
+    })
+    updated = warm_start_collaborative_filtering(
+        model_data, delta_df, n_epochs=2, replay_df=dummy_ratings_df, batch_size=4
+    )
+
+    assert updated["user_to_idx"] == {1: 0, 2: 1, 3: 2, 4: 3}
+    assert updated["movie_to_idx"][104] == 3
+    assert updated["idx_to_user"][3] == 4
+    assert updated["user_factors"].shape == (4, 4)
+    assert updated["movie_factors"].shape == (4, 4)
+    assert updated["movie_biases"].shape == (4,)
+    assert updated["global_mean"] == model_data["global_mean"]
+    # The previous model is not modified.
+    np.testing.assert_array_equal(model_data["user_factors"], old_user_factors)
+    assert len(model_data["user_to_idx"]) == 3
+
+@pytest.mark.parametrize("trainer", [train_collaborative_filtering, train_als_collaborative_filtering])
+def test_train_float32(trainer, dummy_ratings_df):
+    model_data = trainer(dummy_ratings_df, n_factors=2, n_epochs=2, dtype="float32")
+
+    for key in ("user_factors", "movie_factors", "user_biases", "movie_biases"):
+        assert model_data[key].dtype == np.float32
+
+@pytest.mark.parametrize("batch_size", [None, 64])
+def test_float32_rmse_close_to_float64(batch_size):
+    from model.evaluation import evaluate_model
+
+    rng = np.random.default_rng(0)
+    users, movies = rng.integers(0, 50, 4000), rng.integers(0, 40, 4000)
+    ratings_df = pd.DataFrame({
+        "user_id": users,
+        "movie_id": movies,
+        "rating": np.clip(np.round(3 + (users % 3) - (movies % 2) + rng.normal(0, 0.5, 4000)), 1, 5),
+    })
+
+    rmse = {}
+    for dtype in ("float64", "float32"):
+        np.random.seed(0)
+        model_data = train_collaborative_filtering(
+            ratings_df, 5, 10, 0.01, 0.01, batch_size=batch_size, dtype=dtype
+        )
+        assert model_data["user_factors"].dtype == dtype
+        rmse[dtype] = evaluate_model(model_data, ratings_df)["RMSE"]
+    assert abs(rmse["float64"] - rmse["float32"]) < 1e-3
+
+def test_cast_model_float16_predictions(dummy_ratings_df):
+    from model.collaborative_filtering import cast_model
+    from model.evaluation import evaluate_model
+
+    model_data = train_collaborative_filtering(dummy_ratings_df, 4, 5, dtype="float32")
+    compact = cast_model(model_data, "float16")
+
+    assert compact["user_factors"].dtype == np.float16
+    assert model_data["user_factors"].dtype == np.float32
+    full_rmse = evaluate_model(model_data, dummy_ratings_df)["RMSE"]
+    compact_rmse = evaluate_model(compact, dummy_ratings_df)["RMSE"]
+    assert abs(full_rmse - compact_rmse) < 1e-2
+
+def test_hogwild_single_thread_matches_serial_epoch(dummy_ratings_df):
+    pytest.importorskip("numba")
+    from model.collaborative_filtering import _encode_ratings, _init_factors, _sgd_epoch
+    from model.hogwild import hogwild_epoch
+
+    data = _encode_ratings(dummy_ratings_df)
+    args = (data["user_indices"], data["movie_indices"], data["ratings"], data["global_mean"], 0.05, 0.01)
+    np.random.seed(0)
+    initial = _init_factors(data["n_users"], data["n_movies"], 3)
+    serial = {key: value.copy() for key, value in initial.items()}
+    threaded = {key: value.copy() for key, value in initial.items()}
+
+    # Both draw the same shuffle from the seeded global generator.
+    np.random.seed(1)
+    serial_sse = _sgd_epoch(serial, *args)
+    np.random.seed(1)
+    threaded_sse = hogwild_epoch(threaded, *args, n_threads=1)
+
+    assert math.isclose(serial_sse, threaded_sse, rel_tol=1e-9)
+    for key in initial:
+        np.testing.assert_allclose(serial[key], threaded[key])
+
+def test_hogwild_rmse_close_to_serial():
+    pytest.importorskip("numba")
+    from model.evaluation import evaluate_model
+
+    rng = np.random.default_rng(0)
+    users, movies = rng.integers(0, 50, 4000), rng.integers(0, 40, 4000)
+    ratings_df = pd.DataFrame({
+        "user_id": users,
+        "movie_id": movies,
+        "rating": np.clip(np.round(3 + (users % 3) - (movies % 2) + rng.normal(0, 0.5, 4000)), 1, 5),
+    })
+
+    serial = train_collaborative_filtering(ratings_df, 5, 10, 0.01, 0.01, n_threads=1)
+    threaded = train_collaborative_filtering(ratings_df, 5, 10, 0.01, 0.01, n_threads=4)
+
+    serial_rmse = evaluate_model(serial, ratings_df)["RMSE"]
+    threaded_rmse = evaluate_model(threaded, ratings_df)["RMSE"]
+    assert abs(serial_rmse - threaded_rmse) < 0.05
@@ -66,3 +66,93 @@ def test_evaluate_model(dummy_model_data):
     assert result["count"] == 2
     # Check that the result dictionary has exactly the expected keys.
     assert set(result.keys()) == {"RMSE", "MAE", "coverage", "count"}
+
+def test_evaluate_encoded_matches_evaluate_model(dummy_model_data):
+    from model.evaluation import evaluate_encoded
+    # Row indices for the rows of test_evaluate_model; -1 marks the unknown movie.
+    result = evaluate_encoded(
+        dummy_model_data, np.array([0, 0, 0]), np.array([0, 0, -1]), [5, 4, 3]
+    )
+    assert math.isclose(result["RMSE"], math.sqrt(0.5), rel_tol=1e-4)
+    assert math.isclose(result["MAE"], 0.5, rel_tol=1e-4)
+    assert math.isclose(result["coverage"], 2/3, rel_tol=1e-4)
+    assert result["count"] == 2
+
+def test_predict_ratings_batch_matches_predict_rating():
+    rng = np.random.default_rng(0)
+    model_data = {
+        "user_to_idx": {"u1": 0, "u2": 1, "u3": 2},
+        "movie_to_idx": {10: 0, 20: 1},
+        "user_factors": rng.normal(0, 1, (3, 4)),
+        "movie_factors": rng.normal(0, 1, (2, 4)),
+        "user_biases": rng.normal(0, 0.1, 3),
+        "movie_biases": rng.normal(0, 0.1, 2),
+        "global_mean": 3.5,
+    }
+    user_ids = ["u1", "u2", "u3", "u4", "u2", "u3"]
+    movie_ids = [10, 20, 30, 10, 10, 20]
+
+    preds = predict_ratings_batch(model_data, user_ids, movie_ids)
+
+    expected = [predict_rating(model_data, u, m) for u, m in zip(user_ids, movie_ids)]
+    assert [p is None for p in preds] == [e is None for e in expected]
+    np.testing.assert_allclose(
+        [p for p in preds if p is not None], [e for e in expected if e is not None]
+    )
+
+def test_missing_ids_are_unknown(dummy_model_data):
+    # pd.factorize codes missing ids as -1; they must not take the row of
+    # the last distinct id.
+    preds = predict_ratings_batch(dummy_model_data, [1, None, 1, 1], [101, 101, np.nan, 101])
+    assert preds == [5, None, None, 5]
+
+    test_df = pd.DataFrame({"user_id": [1, None], "movie_id": [101, 101], "rating": [4, 1]})
+    result = evaluate_model(dummy_model_data, test_df)
+    assert result["count"] == 1
+    assert math.isclose(result["MAE"], 1.0, rel_tol=1e-4)
+
+def test_top_k_indices_breaks_ties_by_index():
+    from model.evaluation import top_k_indices
+
+    scores = np.array([[5.0, 1.0, 5.0, 3.0, 5.0], [2.0, 4.0, 4.0, -np.inf, 1.0]])
+    np.testing.assert_array_equal(top_k_indices(scores, 2), [[0, 2], [1, 2]])
+    np.testing.assert_array_equal(top_k_indices(scores, 4), [[0, 2, 4, 3], [1, 2, 0, 4]])
+    with pytest.raises(ValueError):
+        top_k_indices(scores, -1)
+
+def test_evaluate_ranking_matches_per_user_loop():
+    from model.evaluation import evaluate_ranking
+
+    rng = np.random.default_rng(1)
+    model_data = {
+        "user_to_idx": {u: u for u in range(6)},
+        "movie_to_idx": {m: m for m in range(12)},
+        "user_factors": rng.normal(0, 1, (6, 3)),
+        "movie_factors": rng.normal(0, 1, (12, 3)),
+        "user_biases": rng.normal(0, 0.1, 6),
+        "movie_biases": rng.normal(0, 0.1, 12),
+        "global_mean": 3.0,
+    }
+    train_df = pd.DataFrame({"user_id": rng.integers(0, 6, 20), "movie_id": rng.integers(0, 12, 20), "rating": 3.0})
+    test_df = pd.DataFrame({"user_id": rng.integers(0, 7, 25), "movie_id": rng.integers(0, 12, 25), "rating": rng.integers(1, 6, 25).astype(float)})
+
+    result = evaluate_ranking(model_data, train_df, test_df, k=3, block_size=2)
+
+    # Reference: rank each user's unseen movies with predict_rating.
+    precisions, recalls, ndcgs = [], [], []
+    for user in range(6):
+        relevant = set(test_df[(test_df.user_id == user) & (test_df.rating >= 4)].movie_id)
+        if not relevant:
+            continue
+        seen = set(train_df[train_df.user_id == user].movie_id)
+        ranked = sorted((m for m in range(12) if m not in seen), key=lambda m: (-predict_rating(model_data, user, m), m))[:3]
+        hits = [m in relevant for m in ranked]
+        precisions.append(sum(hits) / 3)
+        recalls.append(sum(hits) / len(relevant))
+        idcg = sum(1 / math.log2(i + 2) for i in range(min(len(relevant), 3)))
+        ndcgs.append(sum(h / math.log2(i + 2) for i, h in enumerate(hits)) / idcg)
+
+    assert result["users"] == len(precisions)
+    assert math.isclose(result["precision@3"], np.mean(precisions))
+    assert math.isclose(result["recall@3"], np.mean(recalls))
+    assert math.isclose(result["NDCG@3"], np.mean(ndcgs))
@@ -11,6 +11,7 @@ import pandas as pd
 
 import pytest
 from unittest.mock import patch
+import numpy as np
 import pandas as pd
 from data.data_loader import load_ratings, load_movies
 
@@ -84,10 +85,10 @@ def test_recommendation(mock_recommend):
     mock_model = {
         "user_to_idx": {"123": 0},
         "movie_to_idx": {"Movie A": 0, "Movie B": 1},  # ✅ Add another movie
-        "user_factors": {0: [0.1, 0.2]},
-        "movie_factors": {0: [0.3, 0.4], 1: [0.5, 0.6]},  # ✅ Add movie factors for 2nd movie
-        "user_biases": {0: 0.01},
-        "movie_biases": {0: 0.02, 1: 0.03},  # ✅ Add bias for 2nd movie
+        "user_factors": np.array([[0.1, 0.2]]),
+        "movie_factors": np.array([[0.3, 0.4], [0.5, 0.6]]),  # ✅ Add movie factors for 2nd movie
+        "user_biases": np.array([0.01]),
+        "movie_biases": np.array([0.02, 0.03]),  # ✅ Add bias for 2nd movie
         "global_mean": 3.5,
     }
 
@@ -104,3 +105,45 @@ def test_recommendation(mock_recommend):
     assert isinstance(recommendations, list)
     assert len(recommendations) == 2  
 
+
+
+def test_warm_start_extends_seen_index_and_appends_after_save(tmp_path, monkeypatch):
+    import json
+    import main
+    from model.artifact import load_extra
+    from utils.serving_index import build_seen_index
+
+    history = pd.DataFrame({
+        "user_id": [1, 1, 2, 3, 3],
+        "movie_id": ["a", "b", "a", "c", "b"],
+        "rating": [4, 3, 5, 2, 4],
+        "time": ["2025-03-01 10:00:00"] * 5,
+    })
+    delta = pd.DataFrame({
+        "user_id": [2, 4, 4],
+        "movie_id": ["c", "a", "d"],
+        "rating": [3, 5, 4],
+        "time": ["2025-03-02 10:00:00"] * 3,
+    })
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "models").mkdir()
+    monkeypatch.setitem(main.TRAINING_CONFIG, "replay_size", 0)
+    monkeypatch.setattr(main, "load_ratings_since", lambda since: delta)
+
+    model = train_collaborative_filtering(history, 3, 2, 0.01, 0.1)
+    main.save_model(model, {"lr": 0.01, "reg": 0.1}, "2025-03-01 10:00:00", build_seen_index(model, history))
+
+    # Streaming training writes no ratings.csv; the seen index comes from
+    # the saved model and the file is created with a header.
+    main.warm_start()
+
+    seen = load_extra(main.MODEL_DIR, "seen_index")
+    warm_model = main.load_artifact(main.MODEL_DIR)
+    expected = build_seen_index(warm_model, pd.concat([history, delta]))
+    assert seen["indptr"].tolist() == expected[0].tolist()
+    for u in range(len(expected[0]) - 1):
+        lo, hi = expected[0][u], expected[0][u + 1]
+        assert sorted(seen["movie_rows"][lo:hi]) == sorted(expected[1][lo:hi])
+    assert pd.read_csv(main.RATINGS_PATH)["user_id"].tolist() == [2, 4, 4]
+    with open(main.MODEL_META_PATH) as f:
+        assert json.load(f)["last_rating_time"] == "2025-03-02 10:00:00"
@@ -0,0 +1,42 @@
+from frontend.model_holder import ModelHolder
+
+
+def test_reload_swaps_on_new_version():
+    versions = iter(["v1", "v1", "v2"])
+    loads = []
+    swapped = []
+
+    def load_state():
+        loads.append(1)
+        return {"model": len(loads)}
+
+    holder = ModelHolder(load_state, lambda: next(versions), on_swap=swapped.append)
+
+    assert holder.reload() is True
+    assert holder.reload() is False  # same version, nothing to load
+    assert holder.reload() is True
+    assert holder.snapshot() == ({"model": 2}, "v2")
+    assert swapped == [{"model": 1}, {"model": 2}]
+
+
+def test_failed_load_keeps_old_state():
+    versions = iter(["v1", "v2", "v2", "v3"])
+    results = iter([{"model": 1}, RuntimeError("corrupt"), {"model": 3}])
+
+    def load_state():
+        result = next(results)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    holder = ModelHolder(load_state, lambda: next(versions))
+    holder.reload()
+
+    assert holder.reload() is False
+    assert holder.snapshot() == ({"model": 1}, "v1")
+    assert holder.last_error == "corrupt"
+    # The failed version is not retried until the artifact changes.
+    assert holder.reload() is False
+    assert holder.reload() is True
+    assert holder.snapshot() == ({"model": 3}, "v3")
+    assert holder.last_error is None
@@ -0,0 +1,57 @@
+import time
+import pandas as pd
+from utils.popularity import PopularityRefresher, build_popularity, popular_movies, recent_popularity
+
+DAY = 86400
+
+
+def create_ratings_df():
+    # m1 is the most rated overall, m3 the most rated in the last week and m2
+    # the only movie rated in the last day.
+    return pd.DataFrame({
+        "user_id": [1, 2, 3, 4, 5, 6, 7, 8],
+        "movie_id": ["m1", "m1", "m1", "m1", "m3", "m3", "m3", "m2"],
+        "rating": [4, 5, 3, 4, 5, 4, 3, 3],
+        "time": [0, DAY, 2 * DAY, 3 * DAY, 22 * DAY, 22 * DAY, 22 * DAY, 23 * DAY],
+    })
+
+
+def test_build_popularity_variants():
+    popularity = build_popularity(create_ratings_df(), now=23 * DAY + 1)
+
+    assert popularity["all_time"].tolist() == ["m1", "m3", "m2"]
+    assert popularity["week"].tolist() == ["m3", "m2"]
+    assert popularity["day"].tolist() == ["m2"]
+
+
+def test_recent_popularity_is_anchored_at_now():
+    # A day after the last rating the day window is empty; a month after,
+    # both are, however recent the ratings are relative to each other.
+    assert recent_popularity(create_ratings_df(), now=24 * DAY + 1)["day"].tolist() == []
+    assert recent_popularity(create_ratings_df(), now=24 * DAY + 1)["week"].tolist() == ["m3", "m2"]
+    assert all(not len(ranked) for ranked in recent_popularity(create_ratings_df(), now=60 * DAY).values())
+
+
+def test_popular_movies_tops_up_from_all_time():
+    popularity = build_popularity(create_ratings_df(), now=23 * DAY + 1)
+
+    assert popular_movies(popularity, 2) == ["m1", "m3"]
+    assert popular_movies(popularity, 3, "day") == ["m2", "m1", "m3"]
+    assert popular_movies(popularity, 1, "unknown") == ["m1"]
+
+
+def test_popularity_refresher_swaps_windows():
+    serving_index = {"popularity": build_popularity(create_ratings_df(), now=23 * DAY + 1)}
+    newer = pd.DataFrame({"movie_id": ["m9"], "time": [int(time.time()) - 60]})
+
+    refresher = PopularityRefresher(lambda: serving_index, lambda: newer, interval=0.01)
+    refresher.start()
+    deadline = time.time() + 5
+    while serving_index["popularity"]["day"].tolist() != ["m9"] and time.time() < deadline:
+        time.sleep(0.01)
+    refresher.stop()
+
+    assert serving_index["popularity"]["day"].tolist() == ["m9"]
+    assert serving_index["popularity"]["week"].tolist() == ["m9"]
+    # The all-time list comes with the model and is kept.
+    assert serving_index["popularity"]["all_time"].tolist() == ["m1", "m3", "m2"]
@@ -0,0 +1,50 @@
+import numpy as np
+import pandas as pd
+import pytest
+from data.rating_chunks import RatingChunkCache
+from model.collaborative_filtering import train_collaborative_filtering_streaming
+
+
+@pytest.fixture
+def rating_chunks():
+    ratings_df = pd.DataFrame({
+        "user_id": [1, 2, 3, 1, 2, 3, 4],
+        "movie_id": ["a", "a", "b", "b", "c", "c", "a"],
+        "rating": [5, 4, 3, 2, 3, 4, 5],
+        "time": [10, 20, 30, 40, 50, 60, 70],
+    })
+    return [ratings_df.iloc[i : i + 3] for i in range(0, len(ratings_df), 3)]
+
+
+def test_build_chunk_cache(rating_chunks, tmp_path):
+    cache = RatingChunkCache.build(iter(rating_chunks), str(tmp_path))
+
+    assert cache.n_chunks == 3
+    assert cache.n_ratings == 7
+    assert cache.global_mean == pytest.approx(26 / 7)
+    assert cache.last_rating_time == 70
+    assert list(cache.user_ids) == [1, 2, 3, 4]
+    assert list(cache.movie_ids) == ["a", "b", "c"]
+
+    # Codes stay consistent across chunks, and the cache can be reopened.
+    reopened = RatingChunkCache(str(tmp_path))
+    user_codes, movie_codes, ratings = map(
+        np.concatenate, zip(*reopened.iter_chunks())
+    )
+    assert user_codes.tolist() == [0, 1, 2, 0, 1, 2, 3]
+    assert movie_codes.tolist() == [0, 0, 1, 1, 2, 2, 0]
+    assert ratings.dtype == np.float32
+
+
+def test_train_streaming(rating_chunks, tmp_path):
+    cache = RatingChunkCache.build(rating_chunks, str(tmp_path))
+
+    model_data = train_collaborative_filtering_streaming(
+        cache, n_factors=2, n_epochs=2, batch_size=2, buffer_size=4
+    )
+
+    assert model_data["user_factors"].shape == (4, 2)
+    assert model_data["movie_factors"].shape == (3, 2)
+    assert model_data["user_to_idx"] == {1: 0, 2: 1, 3: 2, 4: 3}
+    assert model_data["idx_to_movie"] == {0: "a", 1: "b", 2: "c"}
+    assert model_data["global_mean"] == pytest.approx(26 / 7)
@@ -0,0 +1,87 @@
+import numpy as np
+import pandas as pd
+import pytest
+from data.preprocessing import time_based_split
+from data.ratings_matrix import RatingsMatrix
+from model.collaborative_filtering import train_collaborative_filtering
+from model.evaluation import evaluate_model
+from utils.segment import evaluate_user_segments
+from utils.validation import validate_before_training
+
+
+@pytest.fixture
+def ratings_df():
+    return pd.DataFrame({
+        "user_id": [1, 2, 3, 1, 2, 3, 4, 3, 2, 1],
+        "movie_id": ["a", "a", "b", "b", "c", "c", "d", "a", "b", "c"],
+        "rating": [5, 4, 3, 2, 3, 4, 5, 1, 2, 4],
+        "time": [10, 20, 30, 40, 50, 60, 70, 80, 90, 100],
+    })
+
+
+def test_from_dataframe(ratings_df):
+    matrix = RatingsMatrix.from_dataframe(ratings_df)
+
+    assert len(matrix) == 10
+    assert matrix.user_codes.dtype == np.int32
+    assert matrix.ratings.dtype == np.float32
+    assert list(matrix.user_ids) == [1, 2, 3, 4]
+    assert list(matrix.movie_ids) == ["a", "b", "c", "d"]
+    # The code tables map back to the original ids.
+    assert list(matrix.user_ids[matrix.user_codes]) == list(ratings_df["user_id"])
+    np.testing.assert_array_equal(matrix.timestamps, ratings_df["time"].to_numpy())
+
+
+def test_time_split_matches_time_based_split(ratings_df):
+    matrix = RatingsMatrix.from_dataframe(ratings_df)
+    train, val, test = matrix.time_split()
+    train_df, val_df, test_df = time_based_split(ratings_df.copy())
+
+    for split, split_df in ((train, train_df), (val, val_df), (test, test_df)):
+        assert list(split.user_ids[split.user_codes]) == list(split_df["user_id"])
+        assert list(split.ratings) == list(split_df["rating"])
+        # Splits share the id tables of the full matrix.
+        assert split.user_ids is matrix.user_ids
+
+
+def test_compact_and_csr(ratings_df):
+    matrix = RatingsMatrix.from_dataframe(ratings_df)
+    # Ratings (3, b), (1, b) and (3, a) only.
+    subset = matrix.take(np.array([2, 3, 7])).compact()
+
+    assert list(subset.user_ids) == [1, 3]
+    assert list(subset.movie_ids) == ["a", "b"]
+
+    indptr, movie_codes, ratings = subset.csr
+    assert list(indptr) == [0, 1, 3]
+    assert list(subset.movie_ids[movie_codes]) == ["b", "b", "a"]
+    assert list(ratings) == [2, 3, 1]
+
+
+def test_codes_in_model(ratings_df):
+    matrix = RatingsMatrix.from_dataframe(ratings_df)
+    user_rows, movie_rows = matrix.codes_in({3: 0, 1: 1}, {"a": 0})
+
+    assert list(user_rows[:4]) == [1, -1, 0, 1]
+    assert list(movie_rows[:4]) == [0, 0, -1, -1]
+
+
+def test_pipeline_stages_accept_matrix(ratings_df):
+    matrix = RatingsMatrix.from_dataframe(ratings_df)
+    train, val, test = matrix.time_split()
+
+    np.random.seed(0)
+    model_data = train_collaborative_filtering(train, n_factors=2, n_epochs=2)
+    train_df, val_df, test_df = time_based_split(ratings_df.copy())
+
+    # Matrix and DataFrame inputs give the same metrics.
+    assert evaluate_model(model_data, test) == pytest.approx(
+        evaluate_model(model_data, test_df), nan_ok=True
+    )
+    assert validate_before_training(train, val, test) == validate_before_training(
+        train_df, val_df, test_df
+    )
+    segments = evaluate_user_segments(train, model_data, val)
+    assert segments["low_activity"]["count"] == evaluate_user_segments(
+        train_df, model_data, val_df
+    )["low_activity"]["count"]
@@ -102,3 +102,23 @@ def test_recommend_movies_for_user_without_json():
     recommendations = recommend_movies_for_user(model_data, movies_df, ratings_df, "user2", num_recommendations=5)
     # Without json_data, the function should return the movie_id directly.
     assert recommendations == ["movie2"]
+
+def test_recommend_movies_for_users_matches_single_user():
+    from frontend.recommendation_utils import recommend_movies_for_users
+    from utils.serving_index import build_serving_index
+
+    model_data = create_model_data()
+    movies_df = create_movies_df()
+    ratings_df = create_ratings_df()
+    user_ids = ["user2", "unknown", "user1", "user2"]
+
+    for serving_index in (None, build_serving_index(model_data, movies_df, ratings_df)):
+        batch = recommend_movies_for_users(
+            model_data, movies_df, ratings_df, user_ids, num_recommendations=2, serving_index=serving_index
+        )
+        assert batch == [
+            recommend_movies_for_user(
+                model_data, movies_df, ratings_df, user_id, num_recommendations=2, serving_index=serving_index
+            )
+            for user_id in user_ids
+        ]
@@ -1,11 +1,13 @@
 import json
+import numpy as np
 import pandas as pd
 
 # Import functions from your recommender module.
-from utils.recommender import recommend_movies_for_user, _get_movie_title
+from utils.recommender import recommend_movies_for_user
+from utils.serving_index import title_from_movies_df
 
 # -------------------------
-# Tests for _get_movie_title
+# Tests for title_from_movies_df
 # -------------------------
 
 def test_get_movie_title_valid():
@@ -13,7 +15,7 @@ def test_get_movie_title_valid():
         "movie_id": ["m1"],
         "json_data": [json.dumps({"title": "Movie 1"})]
     })
-    title = _get_movie_title("m1", movies_df)
+    title = title_from_movies_df("m1", movies_df)
     assert title == "Movie 1"
 
 def test_get_movie_title_missing():
@@ -22,7 +24,7 @@ def test_get_movie_title_missing():
         "json_data": [json.dumps({"title": "Movie 1"})]
     })
     # When movie_id is not found, it should return the movie_id as a string.
-    title = _get_movie_title("m2", movies_df)
+    title = title_from_movies_df("m2", movies_df)
     assert title == "m2"
 
 # -------------------------
@@ -65,14 +67,21 @@ def test_recommend_movies_for_user_user_not_in_training():
     expected = ["Movie 2", "Movie 1", "Movie 3"]
     assert recs == expected
 
-def test_recommend_movies_for_user_user_in_training(monkeypatch):
+def test_recommend_movies_for_user_user_in_training():
     """
     When the user is present in model_data, candidate movies (those the user hasn't
-    rated) are scored using predict_rating. We patch predict_rating to return fixed values.
+    rated) are ranked by predicted rating.
     """
+    # With zero biases and factors, predictions are 3.0 plus the movie bias:
+    # m3 -> 3.5 and m4 -> 4.0; m1 and m2 would score higher but are rated.
     model_data = {
         "user_to_idx": {100: 0},
-        "movie_to_idx": {"m1": 0, "m2": 1, "m3": 2, "m4": 3}
+        "movie_to_idx": {"m1": 0, "m2": 1, "m3": 2, "m4": 3},
+        "user_factors": np.zeros((1, 2)),
+        "movie_factors": np.zeros((4, 2)),
+        "user_biases": np.zeros(1),
+        "movie_biases": np.array([2.0, 2.0, 0.5, 1.0]),
+        "global_mean": 3.0,
     }
     # Ratings DataFrame: user 100 has rated m1 and m2.
     ratings_data = [
@@ -89,19 +98,39 @@ def test_recommend_movies_for_user_user_in_training(monkeypatch):
             json.dumps({"title": "Movie 4"})
         ]
     })
-    
-    # Patch predict_rating to control the predicted ratings for candidate movies.
-    def fake_predict_rating(model_data, user_id, movie_id):
-        if movie_id == "m3":
-            return 3.5
-        elif movie_id == "m4":
-            return 4.0
-        return None
-    
-    monkeypatch.setattr("utils.recommender.predict_rating", fake_predict_rating)
-    
+
     recs = recommend_movies_for_user(model_data, movies_df, ratings_df, user_id=100, num_recommendations=10)
     # Candidate movies are m3 and m4. With predictions 3.5 and 4.0,
     # sorted descending yields m4 then m3.
     expected = ["Movie 4", "Movie 3"]
     assert recs == expected
+
+def test_top_movies_for_user_matches_sorted_predictions():
+    from model.evaluation import predict_rating
+    from utils.recommender import top_movies_for_user
+
+    rng = np.random.default_rng(0)
+    movie_ids = [f"m{i}" for i in range(30)]
+    model_data = {
+        "user_to_idx": {1: 0, 2: 1},
+        "movie_to_idx": {m: i for i, m in enumerate(movie_ids)},
+        "user_factors": rng.normal(0, 1, (2, 4)),
+        "movie_factors": rng.normal(0, 1, (30, 4)),
+        "user_biases": rng.normal(0, 0.1, 2),
+        "movie_biases": rng.normal(0, 0.1, 30),
+        "global_mean": 3.5,
+    }
+    ratings_df = pd.DataFrame({"user_id": [1, 1, 2], "movie_id": ["m3", "m7", "m3"], "rating": [4, 2, 5]})
+
+    top = top_movies_for_user(model_data, ratings_df, 1, 8)
+
+    # Reference: sort every unrated movie by clamped prediction, then by index.
+    candidates = [m for m in movie_ids if m not in {"m3", "m7"}]
+    candidates.sort(key=lambda m: (-predict_rating(model_data, 1, m), model_data["movie_to_idx"][m]))
+    assert top == candidates[:8]
+
+    # Scoring users together, in blocks, gives the same lists.
+    from utils.recommender import top_movies_for_users
+
+    batch = top_movies_for_users(model_data, ratings_df, [2, 1, 2], 8, block_size=1)
+    assert batch == [top_movies_for_user(model_data, ratings_df, u, 8) for u in [2, 1, 2]]
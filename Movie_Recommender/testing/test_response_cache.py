@@ -0,0 +1,38 @@
+import time
+from frontend.response_cache import ResponseCache
+
+
+def test_hit_miss_and_lru_eviction():
+    cache = ResponseCache(max_size=2, ttl=60)
+    cache.put(("v1", "u1", 10, "all_time"), ["A"])
+    cache.put(("v1", "u2", 10, "all_time"), ["B"])
+
+    assert cache.get(("v1", "u1", 10, "all_time")) == ["A"]
+    # u2 is now least recently used and is evicted by the third entry.
+    cache.put(("v1", "u3", 10, "all_time"), ["C"])
+
+    assert cache.get(("v1", "u2", 10, "all_time")) is None
+    assert cache.get(("v2", "u1", 10, "all_time")) is None
+    assert cache.stats() == {"hits": 1, "misses": 2, "hit_rate": 1 / 3, "size": 2}
+
+
+def test_ttl_expiry():
+    cache = ResponseCache(ttl=0.01)
+    cache.put(("v1", "u1", 10), ["A"])
+    time.sleep(0.02)
+
+    assert cache.get(("v1", "u1", 10)) is None
+    assert cache.stats()["size"] == 0
+
+
+def test_invalidate_user():
+    cache = ResponseCache()
+    cache.put(("v1", "u1", 10), ["A"])
+    cache.put(("v1", "u1", 5), ["A"])
+    cache.put(("v1", "u2", 10), ["B"])
+
+    cache.invalidate_user("u1")
+
+    assert cache.get(("v1", "u1", 10)) is None
+    assert cache.get(("v1", "u1", 5)) is None
+    assert cache.get(("v1", "u2", 10)) == ["B"]
@@ -1,10 +1,21 @@
+import math
+import numpy as np
 import pandas as pd
 import pytest
-from utils.segment import evaluate_user_segments
-# Define a fake evaluate_model function to be used in our tests.
-def fake_evaluate_model(model_data, test_df):
-    # For testing, simply return fixed metrics with count equal to the number of rows.
-    return {"RMSE": 1.0, "MAE": 0.5, "coverage": 1.0, "count": len(test_df)}
+from utils.segment import evaluate_segments, evaluate_user_segments
+
+
+def constant_model(user_ids, movie_ids, prediction=4.0):
+    # A model without factors or biases predicts global_mean for every known pair.
+    return {
+        "user_to_idx": {u: i for i, u in enumerate(user_ids)},
+        "movie_to_idx": {m: i for i, m in enumerate(movie_ids)},
+        "user_factors": np.zeros((len(user_ids), 2)),
+        "movie_factors": np.zeros((len(movie_ids), 2)),
+        "user_biases": np.zeros(len(user_ids)),
+        "movie_biases": np.zeros(len(movie_ids)),
+        "global_mean": prediction,
+    }
 
 # Fixture for dummy data:
 @pytest.fixture
@@ -16,7 +27,7 @@ def dummy_data():
        * user 2: medium activity (7 ratings)
        * user 3: high activity (25 ratings)
     - val_df is a copy of ratings_df.
-    - model_data is a dummy dictionary (contents not used because evaluate_model is patched).
+    - model_data predicts 4.0 for every pair.
     """
     # Low activity: user 1 with 3 ratings.
     low = pd.DataFrame({
@@ -38,39 +49,58 @@ def dummy_data():
     })
     ratings_df = pd.concat([low, medium, high], ignore_index=True)
     val_df = ratings_df.copy()
-    # Dummy model_data (not used in fake_evaluate_model).
-    model_data = {}
+    model_data = constant_model(
+        ratings_df["user_id"].unique(), ratings_df["movie_id"].unique()
+    )
     return ratings_df, model_data, val_df
 
 # Import the function to test from segment.py.
 # Adjust the module path as needed; here we assume it's in the 'model' package.
 
 
-def test_evaluate_user_segments_all(dummy_data, monkeypatch):
+def test_evaluate_user_segments_all(dummy_data):
     ratings_df, model_data, val_df = dummy_data
     # No changes: all segments are present.
     # Our dummy user counts:
     #   - user 1: 3 ratings (low activity: count < 5)
     #   - user 2: 7 ratings (medium: between 5 and 20)
     #   - user 3: 25 ratings (high: >= 20)
-    monkeypatch.setattr("utils.segment.evaluate_model", fake_evaluate_model)
-    
     results = evaluate_user_segments(ratings_df, model_data, val_df)
     
     # Expect segments for low, medium, and high activity.
     assert set(results.keys()) == {"low_activity", "medium_activity", "high_activity"}
     
     # For user 1 (low activity), expect count = 3.
+    # Ratings 4, 5, 3 against a prediction of 4 give errors 0, 1, -1.
     low_result = results["low_activity"]
-    assert low_result["RMSE"] == 1.0
-    assert low_result["MAE"] == 0.5
+    assert math.isclose(low_result["RMSE"], math.sqrt(2 / 3))
+    assert math.isclose(low_result["MAE"], 2 / 3)
     assert low_result["coverage"] == 1.0
     assert low_result["count"] == 3
     
     # For user 2 (medium activity), count should be 7.
     med_result = results["medium_activity"]
     assert med_result["count"] == 7
+    assert med_result["RMSE"] == 1.0
     
     # For user 3 (high activity), count should be 25.
     high_result = results["high_activity"]
     assert high_result["count"] == 25
+
+
+def test_evaluate_segments_multiple_keys(dummy_data):
+    ratings_df, model_data, val_df = dummy_data
+    # An unknown user lowers coverage without affecting the errors.
+    val_df = pd.concat(
+        [val_df, pd.DataFrame({"user_id": [9], "movie_id": [101], "rating": [1]})],
+        ignore_index=True,
+    )
+    parity = np.where(val_df["movie_id"] % 2 == 0, "even", "odd")
+    cold = np.where(val_df["user_id"] == 9, "cold", "warm")
+
+    results = evaluate_segments(model_data, val_df, {"parity": parity, "cold": cold})
+
+    assert results["cold"]["cold"] == {"RMSE": None, "MAE": None, "coverage": 0.0, "count": 0}
+    assert results["cold"]["warm"]["count"] == 35
+    assert results["parity"]["odd"]["count"] + results["parity"]["even"]["count"] == 35
+    assert math.isclose(results["parity"]["odd"]["coverage"], results["parity"]["odd"]["count"] / (parity == "odd").sum())
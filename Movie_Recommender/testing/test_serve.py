@@ -0,0 +1,20 @@
+import pytest
+
+
+def test_options_from_env(monkeypatch):
+    pytest.importorskip("gunicorn")
+    from serve import Server, options_from_env
+
+    monkeypatch.setenv("PORT", "8000")
+    monkeypatch.setenv("SERVE_WORKERS", "3")
+    monkeypatch.setenv("SERVE_THREADS", "8")
+    monkeypatch.setenv("SERVE_MAX_REQUESTS", "1000")
+
+    server = Server(options_from_env())
+
+    assert server.cfg.bind == ["0.0.0.0:8000"]
+    assert server.cfg.workers == 3
+    assert server.cfg.threads == 8
+    assert server.cfg.preload_app
+    assert server.cfg.max_requests == 1000
+    assert server.cfg.max_requests_jitter == 100
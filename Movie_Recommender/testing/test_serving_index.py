@@ -0,0 +1,118 @@
+import json
+import numpy as np
+import pandas as pd
+from frontend.recommendation_utils import recommend_movies_for_user
+from utils.serving_index import build_serving_index, build_title_index, movie_title, movie_titles
+
+
+def create_model_data():
+    return {
+        "user_to_idx": {"user1": 0, "user2": 1},
+        "movie_to_idx": {"movie1": 0, "movie2": 1, "movie3": 2},
+        "user_factors": np.array([[0.3, 0.4], [0.1, 0.2]]),
+        "movie_factors": np.array([[0.2, 0.5], [0.3, 0.1], [0.4, 0.6]]),
+        "user_biases": np.array([0.1, 0.2]),
+        "movie_biases": np.array([-0.2, 0.0, 0.1]),
+        "global_mean": 3.0,
+    }
+
+
+def create_movies_df():
+    return pd.DataFrame({
+        "movie_id": ["movie1", "movie2", "movie3", "movie4"],
+        "json_data": [
+            json.dumps({"title": "Title 1", "genres": [{"id": 1, "name": "Drama"}]}),
+            json.dumps({"title": "Title 2", "genres": ["Comedy", "Romance"]}),
+            json.dumps({"genres": "Action, Thriller"}),
+            "not json",
+        ],
+    })
+
+
+def test_build_title_index():
+    titles, genres = build_title_index(create_movies_df())
+
+    assert titles == {"movie1": "Title 1", "movie2": "Title 2", "movie3": "movie3", "movie4": "movie4"}
+    assert genres == {"movie1": ["Drama"], "movie2": ["Comedy", "Romance"], "movie3": ["Action", "Thriller"]}
+
+
+def test_serving_index_matches_movies_df_path():
+    model_data = create_model_data()
+    movies_df = create_movies_df()
+    ratings_df = pd.DataFrame({"user_id": ["user1", "user2"], "movie_id": ["movie2", "movie4"], "rating": [4, 5]})
+    serving_index = build_serving_index(model_data, movies_df)
+
+    assert serving_index["movie_ids"].tolist() == ["movie1", "movie2", "movie3"]
+    assert movie_title(serving_index, "unknown") == "unknown"
+    for user_id in ("user1", "user2", "new_user"):
+        expected = recommend_movies_for_user(model_data, movies_df, ratings_df, user_id, 3)
+        indexed = recommend_movies_for_user(
+            model_data, movies_df[["movie_id"]], ratings_df, user_id, 3, serving_index=serving_index
+        )
+        assert indexed == expected
+
+
+def test_movie_titles_fall_back_to_string_ids():
+    movies_df = create_movies_df()
+    serving_index = build_serving_index(create_model_data(), movies_df)
+
+    movie_ids = ["movie1", "movie3", 42]
+    assert movie_titles(movie_ids, movies_df) == ["Title 1", "movie3", "42"]
+    assert movie_titles(movie_ids, movies_df, serving_index) == ["Title 1", "movie3", "42"]
+
+
+def test_seen_index_round_trip(tmp_path):
+    from utils.serving_index import build_seen_index, load_seen_index, save_seen_index, seen_movie_rows
+
+    model_data = create_model_data()
+    # Unknown users and movies are skipped.
+    ratings_df = pd.DataFrame({
+        "user_id": ["user2", "user1", "user2", "user3", "user1"],
+        "movie_id": ["movie3", "movie2", "movie1", "movie1", "movie9"],
+        "rating": [4, 5, 3, 2, 1],
+    })
+    path = str(tmp_path / "seen_index.npz")
+    save_seen_index(build_seen_index(model_data, ratings_df), path)
+
+    serving_index = build_serving_index(model_data, create_movies_df(), seen_index=load_seen_index(path))
+
+    assert seen_movie_rows(serving_index, 0).tolist() == [1]
+    assert sorted(seen_movie_rows(serving_index, 1).tolist()) == [0, 2]
+    # The saved index excludes rated movies without ratings_df.
+    recs = recommend_movies_for_user(model_data, None, None, "user2", 3, serving_index=serving_index)
+    assert recs == ["Title 2"]
+
+
+def test_seen_popularity_serves_without_ratings():
+    from utils.serving_index import seen_index_from_rows, seen_popularity
+
+    model_data = create_model_data()
+    # movie3 is rated twice, movie1 and movie2 once each and tie by ID.
+    seen_index = seen_index_from_rows(np.array([0, 0, 1, 1]), np.array([2, 1, 0, 2]), 2)
+
+    popularity = seen_popularity(model_data, seen_index)
+    serving_index = build_serving_index(
+        model_data, create_movies_df(), seen_index=seen_index, popularity=popularity
+    )
+
+    assert popularity["all_time"].tolist() == ["movie3", "movie1", "movie2"]
+    recs = recommend_movies_for_user(model_data, None, None, "new_user", 2, serving_index=serving_index)
+    assert recs == ["movie3", "Title 1"]
+
+
+def test_serving_index_upcasts_float16_factors_once():
+    from model.collaborative_filtering import cast_model
+    from utils.recommender import top_movies_for_user
+
+    model_data = create_model_data()
+    compact = cast_model(model_data, np.float16)
+    serving_index = build_serving_index(compact, create_movies_df())
+
+    assert serving_index["movie_factors"].dtype == np.float32
+    # Models that need no widening are scored from their own array.
+    assert build_serving_index(model_data, create_movies_df())["movie_factors"] is model_data["movie_factors"]
+    no_ratings = pd.DataFrame({"user_id": [], "movie_id": []})
+    for user_id in ("user1", "user2"):
+        assert top_movies_for_user(compact, no_ratings, user_id, 3, serving_index) == top_movies_for_user(
+            compact, no_ratings, user_id, 3
+        )
@@ -0,0 +1,132 @@
+import os
+from datetime import date, datetime, timedelta
+import numpy as np
+import pandas as pd
+import pytest
+from frontend.telemetry_store import TelemetryStore, parse_times
+
+
+def telemetry_row(when, event, user_id):
+    return [when.isoformat(), event, user_id, "{}"]
+
+
+def test_read_only_partitions_in_window(tmp_path):
+    store = TelemetryStore(str(tmp_path))
+    now = datetime.now()
+    store.append("telemetry", [
+        telemetry_row(now - timedelta(days=10), "movie_rated", "4"),
+        telemetry_row(now - timedelta(days=1), "recommendations_shown", "1"),
+        ["not a time", "movie_rated", "5", "{}"],
+    ])
+    store.append("telemetry", [telemetry_row(now, "movie_card_clicked", 2)])
+
+    assert len(store.partitions("telemetry")) == 3
+    everything = store.read("telemetry")
+    assert everything["user_id"].tolist() == ["4", "1", "2"]
+
+    recent = store.read("telemetry", start=now - timedelta(days=2), columns=["event"])
+    assert list(recent.columns) == ["time", "event"]
+    assert recent["event"].tolist() == ["recommendations_shown", "movie_card_clicked"]
+    assert store.read("telemetry", start=now + timedelta(days=1)).empty
+
+
+def test_compact_and_prune(tmp_path):
+    store = TelemetryStore(str(tmp_path))
+    yesterday = datetime.now() - timedelta(days=1)
+    for user_id in ["1", "2", "1"]:
+        store.append("ratings", [[user_id, f"Movie {user_id}", "4", "True", yesterday.isoformat()]])
+    before = store.read("ratings")
+
+    store.compact("ratings")
+
+    partition = tmp_path / "ratings" / str(yesterday.date())
+    assert sorted(os.listdir(partition)) == ["compacted.npz"]
+    pd.testing.assert_frame_equal(store.read("ratings"), before, check_categorical=False)
+
+    store.prune("ratings", retention_days=0)
+    assert store.partitions("ratings") == []
+
+
+def test_compact_skips_held_locks_only(tmp_path):
+    fcntl = pytest.importorskip("fcntl")
+    store = TelemetryStore(str(tmp_path))
+    yesterday = datetime.now() - timedelta(days=1)
+    for user_id in ["1", "2"]:
+        store.append("ratings", [[user_id, "Movie", "4", "True", yesterday.isoformat()]])
+    partition = tmp_path / "ratings" / str(yesterday.date())
+
+    with open(partition / ".compacting", "w") as held:
+        fcntl.flock(held, fcntl.LOCK_EX)
+        store.compact("ratings")
+        assert len([name for name in os.listdir(partition) if name.endswith(".npz")]) == 2
+
+    # The lock file left behind, as by a process killed mid-merge, is not held.
+    assert os.path.exists(partition / ".compacting")
+    store.compact("ratings")
+    assert sorted(os.listdir(partition)) == ["compacted.npz"]
+
+
+def test_read_new_returns_each_row_once(tmp_path, monkeypatch):
+    store = TelemetryStore(str(tmp_path))
+    yesterday = datetime.now() - timedelta(days=1)
+    marks = {}
+
+    def append_as(pid, user_id):
+        monkeypatch.setattr(os, "getpid", lambda: pid)
+        store.append("telemetry", [telemetry_row(yesterday, "movie_rated", user_id)])
+
+    def new_user_ids(**kwargs):
+        return [u for frame in store.read_new("telemetry", marks, **kwargs) for u in frame["user_id"].tolist()]
+
+    append_as(101, "1")
+    append_as(202, "2")
+    assert new_user_ids() == ["1", "2"]
+    assert new_user_ids() == []
+
+    append_as(101, "3")
+    append_as(303, "skipped")
+    # Merged files list their source segments, so rows already read are
+    # not returned again.
+    store.compact("telemetry")
+    append_as(202, "4")
+    assert sorted(new_user_ids(skip_pid=303)) == ["3", "4"]
+    assert new_user_ids(skip_pid=303) == []
+    assert sorted(store.read("telemetry")["user_id"].tolist()) == ["1", "2", "3", "4", "skipped"]
+
+
+def test_import_csv(tmp_path):
+    csv_path = tmp_path / "user_ratings.csv"
+    pd.DataFrame({
+        "user_id": [1, 2],
+        "movie_name": ["Movie A", "Movie B"],
+        "rating": [5, 0],
+        "watched": [True, False],
+        "timestamp": ["2025-03-18T12:00:00Z", "2025-03-19T08:30:00"],
+    }).to_csv(csv_path, index=False)
+    store = TelemetryStore(str(tmp_path / "store"))
+
+    store.import_csv("ratings", str(csv_path))
+
+    assert store.partitions("ratings") == [date(2025, 3, 18), date(2025, 3, 19)]
+    ratings = store.read("ratings")
+    assert ratings["rating"].tolist() == [5.0, 0.0]
+    assert ratings["time"].iloc[0] == pd.Timestamp("2025-03-18 12:00:00")
+
+
+def test_parse_times_mixed_iso_formats():
+    times = parse_times([
+        "2024-01-01T10:00:00",
+        "2024-01-01T10:00:00.250000",
+        "2024-01-02T10:00:00.500Z",
+        "2024-01-03 10:00:00",
+        "garbage",
+        None,
+    ])
+
+    assert times[:4].tolist() == np.array([
+        "2024-01-01T10:00:00",
+        "2024-01-01T10:00:00.25",
+        "2024-01-02T10:00:00.5",
+        "2024-01-03T10:00:00",
+    ], dtype="datetime64[ns]").tolist()
+    assert np.isnat(times[4:]).all()
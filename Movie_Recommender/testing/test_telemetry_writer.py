@@ -0,0 +1,44 @@
+import pandas as pd
+import pytest
+from frontend.telemetry_writer import TelemetryWriter
+
+
+def read_rows(path):
+    return pd.read_csv(path, header=None, names=["timestamp", "event", "user_id", "data"])
+
+
+def test_rows_are_written_in_batches(tmp_path):
+    path = tmp_path / "telemetry.csv"
+    writer = TelemetryWriter(str(path), batch_size=4, flush_interval=60)
+    writer.start()
+
+    for i in range(10):
+        assert writer.log([f"t{i}", "recommendations_served", i, '{"count": 1}'])
+    writer.close()
+
+    rows = read_rows(path)
+    assert rows["user_id"].tolist() == list(range(10))
+    assert rows["data"].iloc[0] == '{"count": 1}'
+    # Two full batches, then the rest when closing.
+    assert writer.stats() == {"queued": 0, "written": 10, "dropped": 0, "flushes": 3}
+    assert not writer.is_alive()
+
+
+def test_full_queue_drops_rows(tmp_path):
+    path = tmp_path / "telemetry.csv"
+    writer = TelemetryWriter(str(path), max_queue=2, fsync="always")
+
+    # Not started, so nothing leaves the queue until close().
+    assert writer.log(["t0", "e", 0, ""])
+    assert writer.log(["t1", "e", 1, ""])
+    assert not writer.log(["t2", "e", 2, ""])
+    writer.close()
+    assert not writer.log(["t3", "e", 3, ""])
+
+    assert read_rows(path)["user_id"].tolist() == [0, 1]
+    assert writer.stats()["dropped"] == 2
+
+
+def test_unknown_fsync_policy():
+    with pytest.raises(ValueError):
+        TelemetryWriter("telemetry.csv", fsync="sometimes")
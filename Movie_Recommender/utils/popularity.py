@@ -0,0 +1,157 @@
+import threading
+import time
+import numpy as np
+import pandas as pd
+from data.ratings_matrix import epoch_seconds
+
+# Window length in seconds of each popularity variant; None is all-time.
+POPULARITY_WINDOWS = {"all_time": None, "week": 7 * 86400, "day": 86400}
+
+
+def build_popularity(ratings_df, max_movies=1000, now=None):
+    """
+    Rank movies by popularity once, for every variant in POPULARITY_WINDOWS.
+
+    all_time ranks by rating count, like the cold-start fallback always has;
+    the windowed variants are those of recent_popularity. Ties go to the
+    lower movie ID.
+
+    Args:
+        ratings_df (pd.DataFrame): Ratings with movie_id and, for the
+            windowed variants, a time column.
+        max_movies (int, optional): Length of each ranked list.
+        now (int, optional): End of the windows in epoch seconds; defaults
+            to the current time.
+
+    Returns:
+        dict: Variant name -> array of movie IDs, most popular first.
+    """
+    movie_codes, movie_ids = pd.factorize(ratings_df["movie_id"], sort=True)
+    popularity = {
+        "all_time": _ranked(
+            movie_ids, np.bincount(movie_codes, minlength=len(movie_ids)), max_movies
+        )
+    }
+
+    if "time" not in ratings_df.columns:
+        return popularity
+    return {**popularity, **recent_popularity(ratings_df, max_movies, now)}
+
+
+def recent_popularity(ratings_df, max_movies=1000, now=None):
+    """
+    The windowed popularity variants: each counts the ratings of the week
+    or day before now, weighted by exp(-age / (window / 4)) so the most
+    recent ratings count most.
+
+    Args:
+        ratings_df (pd.DataFrame): Ratings with movie_id and time columns.
+        max_movies (int, optional): Length of each ranked list.
+        now (int, optional): End of the windows in epoch seconds; defaults
+            to the current time.
+
+    Returns:
+        dict: Variant name -> array of movie IDs, most popular first; empty
+        for a window without ratings.
+    """
+    now = time.time() if now is None else now
+    movie_codes, movie_ids = pd.factorize(ratings_df["movie_id"], sort=True)
+    age = now - epoch_seconds(ratings_df["time"])
+
+    popularity = {}
+    for variant, window in POPULARITY_WINDOWS.items():
+        if window is None:
+            continue
+        recent = (age >= 0) & (age < window)
+        weights = np.exp(-age[recent] / (window / 4))
+        scores = np.bincount(
+            movie_codes[recent], weights=weights, minlength=len(movie_ids)
+        )
+        popularity[variant] = _ranked(
+            movie_ids[scores > 0], scores[scores > 0], max_movies
+        )
+
+    return popularity
+
+
+def popularity_from_counts(movie_ids, counts, max_movies=1000):
+    """
+    all_time popularity from each movie's rating count, e.g. counted from a
+    seen index. Movies without ratings are left out; ties go to the lower
+    movie ID.
+    """
+    movie_ids, counts = np.asarray(movie_ids), np.asarray(counts)
+    order = np.argsort(movie_ids, kind="stable")
+    order = order[counts[order] > 0]
+    return {"all_time": _ranked(movie_ids[order], counts[order], max_movies)}
+
+
+def popular_movies(popularity, num_recommendations, variant="all_time"):
+    """
+    The num_recommendations most popular movie IDs of a variant, topped up
+    from the all-time list when a window has too few rated movies.
+    """
+    ranked = popularity.get(variant, popularity["all_time"])
+    top = ranked[:num_recommendations].tolist()
+
+    if len(top) < num_recommendations and ranked is not popularity["all_time"]:
+        chosen = set(top)
+        for movie_id in popularity["all_time"].tolist():
+            if len(top) == num_recommendations:
+                break
+            if movie_id not in chosen:
+                top.append(movie_id)
+
+    return top
+
+
+class PopularityRefresher(threading.Thread):
+    """
+    Daemon thread that recomputes the windowed popularity lists of the
+    current serving index, as returned by get_serving_index(), every
+    interval seconds from load_recent_ratings(), which returns the ratings
+    of the longest window. The all-time list saved with the model is kept.
+
+    The new lists are computed off the request path and swapped in with a
+    single assignment, so requests never wait on a refresh.
+    """
+
+    def __init__(self, get_serving_index, load_recent_ratings, interval):
+        super().__init__(daemon=True, name="popularity-refresh")
+        self.get_serving_index = get_serving_index
+        self.load_recent_ratings = load_recent_ratings
+        self.interval = interval
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            refresh_recent_popularity(
+                self.get_serving_index(), self.load_recent_ratings
+            )
+
+    def stop(self):
+        self._stopped.set()
+
+
+def refresh_recent_popularity(serving_index, load_recent_ratings):
+    """
+    Replace the windowed popularity lists of serving_index with ones
+    computed now from load_recent_ratings(). On failure the current lists
+    are kept.
+    """
+    if serving_index is None or serving_index["popularity"] is None:
+        return
+    try:
+        recent = recent_popularity(load_recent_ratings())
+    except Exception as e:
+        print(f"Error refreshing popularity: {e}")
+        return
+    serving_index["popularity"] = {
+        "all_time": serving_index["popularity"]["all_time"],
+        **recent,
+    }
+
+
+def _ranked(movie_ids, scores, max_movies):
+    order = np.argsort(-scores, kind="stable")[:max_movies]
+    return np.asarray(movie_ids)[order]
@@ -1,9 +1,18 @@
-import json
-from model.evaluation import predict_rating
+import numpy as np
+from data.ratings_matrix import lookup_codes
+from model.evaluation import block_cells, predict_users, top_k_indices
+from utils.popularity import popular_movies
+from utils.serving_index import movie_titles, seen_index_from_rows
 
 
 def recommend_movies_for_user(
-    model_data, movies_df, ratings_df, user_id, num_recommendations=10
+    model_data,
+    movies_df,
+    ratings_df,
+    user_id,
+    num_recommendations=10,
+    serving_index=None,
+    popularity="all_time",
 ):
     """
     Recommend movies for a user.
@@ -14,6 +23,10 @@ def recommend_movies_for_user(
         ratings_df (pd.DataFrame): Dataframe containing user ratings.
         user_id (int): The user ID for whom recommendations are generated.
         num_recommendations (int, optional): Number of recommendations to return. Defaults to 10.
+        serving_index (dict, optional): Lookups from build_serving_index; when
+            given, titles come from it instead of movies_df.
+        popularity (str, optional): Popularity variant for unknown users
+            ("all_time", "week" or "day"); used with a serving_index.
 
     Returns:
         list: Recommended movie titles.
@@ -22,64 +35,142 @@ def recommend_movies_for_user(
         print(
             f"User {user_id} not found in training data. Using popularity-based recommendations."
         )
-        popular_movies = (
-            ratings_df.groupby("movie_id")["rating"]
-            .count()
-            .sort_values(ascending=False)
-            .head(num_recommendations)
-            .index
+        popular = popular_movie_ids(
+            ratings_df, num_recommendations, serving_index, popularity
         )
+        return movie_titles(popular, movies_df, serving_index)
 
-        recommendations = [
-            _get_movie_title(movie_id, movies_df) for movie_id in popular_movies
-        ]
-        return recommendations
+    top_movie_ids = top_movies_for_user(
+        model_data, ratings_df, user_id, num_recommendations, serving_index
+    )
+    return movie_titles(top_movie_ids, movies_df, serving_index)
 
-    user_rated_movies = set(ratings_df[ratings_df["user_id"] == user_id]["movie_id"])
-    all_movies = set(model_data["movie_to_idx"].keys())
-    candidate_movies = list(all_movies - user_rated_movies)
 
-    predictions = [
-        (movie_id, predict_rating(model_data, user_id, movie_id))
-        for movie_id in candidate_movies
-    ]
-    predictions = [
-        (movie_id, rating) for movie_id, rating in predictions if rating is not None
-    ]
-    predictions.sort(key=lambda x: x[1], reverse=True)
+def popular_movie_ids(
+    ratings_df, num_recommendations, serving_index=None, popularity="all_time"
+):
+    """
+    The most popular movie IDs, the fallback for users the model does not
+    know: the serving index's popularity variant when it has one, else the
+    most rated movies in ratings_df.
+    """
+    if serving_index is not None and serving_index["popularity"] is not None:
+        return popular_movies(
+            serving_index["popularity"], num_recommendations, popularity
+        )
+    return (
+        ratings_df.groupby("movie_id")["rating"]
+        .count()
+        .sort_values(ascending=False)
+        .head(num_recommendations)
+        .index
+    )
+
 
-    top_movie_ids = [movie_id for movie_id, _ in predictions[:num_recommendations]]
-    recommendations = [
-        _get_movie_title(movie_id, movies_df) for movie_id in top_movie_ids
-    ]
+def top_movies_for_user(
+    model_data, ratings_df, user_id, num_recommendations, serving_index=None
+):
+    """
+    Ids of the highest-scoring movies the user has not rated.
 
-    return recommendations
+    All movies are scored at once, rated ones are masked out and the top
+    num_recommendations are selected with argpartition. Movies with equal
+    (clamped) scores are ordered by their model index.
 
+    Args:
+        model_data (dict): The trained model data.
+        ratings_df (pd.DataFrame): Dataframe containing user ratings; not
+            used when serving_index has a seen index.
+        user_id: A user ID known to the model.
+        num_recommendations (int): Number of movie IDs to return.
+        serving_index (dict, optional): Lookups from build_serving_index.
 
-def _get_movie_title(movie_id, movies_df):
+    Returns:
+        list: Movie IDs, best first.
     """
-    Retrieve the title of a movie given its ID.
+    return top_movies_for_users(
+        model_data, ratings_df, [user_id], num_recommendations, serving_index
+    )[0]
+
+
+def top_movies_for_users(
+    model_data,
+    ratings_df,
+    user_ids,
+    num_recommendations,
+    serving_index=None,
+    block_size=1024,
+):
+    """
+    top_movies_for_user for many users, scoring block_size users at a time
+    with one matrix product against all movie factors. Each row's rated
+    movies are masked out before its top-K is taken.
 
     Args:
-        movie_id (int): The movie ID.
-        movies_df (pd.DataFrame): Dataframe containing movie details.
+        user_ids (list): User IDs known to the model; repeated IDs are
+            scored once.
+        block_size (int, optional): Users per matrix product; bounds the
+            memory of the score matrix.
 
     Returns:
-        str: Movie title if available, else the movie ID as a string.
+        list: One list of movie IDs per user ID, best first.
+    """
+    user_rows = lookup_codes(model_data["user_to_idx"], user_ids)
+    if (user_rows < 0).any():
+        raise KeyError(f"Unknown user IDs: {np.asarray(user_ids)[user_rows < 0]}")
+    user_rows, inverse = np.unique(user_rows, return_inverse=True)
+
+    if serving_index is not None and serving_index["seen"] is not None:
+        seen, seen_rows = serving_index["seen"], user_rows
+    else:
+        seen = _seen_by_position(model_data, ratings_df, user_ids, user_rows)
+        seen_rows = np.arange(len(user_rows))
+
+    movie_offsets = movie_factors = None
+    if serving_index is not None:
+        movie_offsets = serving_index["movie_offsets"]
+        movie_factors = serving_index["movie_factors"]
+    movie_ids = _movie_ids_by_row(model_data, serving_index)
+
+    top_ids = []
+    for lo in range(0, len(user_rows), block_size):
+        scores = predict_users(
+            model_data, user_rows[lo : lo + block_size], movie_offsets, movie_factors
+        )
+        scores[block_cells(seen, seen_rows[lo : lo + block_size])] = -np.inf
+        top = top_k_indices(scores, num_recommendations)
+        for row_scores, row_top in zip(scores, top):
+            top_ids.append(
+                movie_ids[row_top[np.isfinite(row_scores[row_top])]].tolist()
+            )
+
+    return [top_ids[i] for i in inverse]
+
+
+def _seen_by_position(model_data, ratings_df, user_ids, user_rows):
+    """
+    Seen index over positions in the sorted user_rows, from ratings_df.
+    """
+    rated = ratings_df[ratings_df["user_id"].isin(list(user_ids))]
+    rated_users = lookup_codes(model_data["user_to_idx"], rated["user_id"])
+    rated_movies = lookup_codes(model_data["movie_to_idx"], rated["movie_id"])
+    known = (rated_users >= 0) & (rated_movies >= 0)
+
+    positions = np.searchsorted(user_rows, rated_users[known])
+    return seen_index_from_rows(positions, rated_movies[known], len(user_rows))
+
+
+def _movie_ids_by_row(model_data, serving_index):
+    """
+    Array of the movie ID of each model row.
     """
-    movie_row = movies_df[movies_df["movie_id"] == movie_id]
-
-    if not movie_row.empty:
-        if "json_data" in movies_df.columns:
-            try:
-                json_str = movie_row["json_data"].iloc[0]
-                json_data = (
-                    json.loads(json_str) if isinstance(json_str, str) else json_str
-                )
-                return json_data.get("title", str(movie_id))
-            except (json.JSONDecodeError, AttributeError):
-                return str(movie_id)
-
-        return str(movie_id)
-
-    return str(movie_id)
+    if serving_index is not None:
+        return serving_index["movie_ids"]
+    idx_to_movie = model_data.get("idx_to_movie")
+    if isinstance(idx_to_movie, np.ndarray):
+        return idx_to_movie
+
+    movie_ids = np.empty(len(model_data["movie_to_idx"]), dtype=object)
+    for movie_id, i in model_data["movie_to_idx"].items():
+        movie_ids[i] = movie_id
+    return movie_ids
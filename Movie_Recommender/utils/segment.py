@@ -1,37 +1,165 @@
-from model.evaluation import evaluate_model
+import numpy as np
+import pandas as pd
+from data.ratings_matrix import RatingsMatrix, lookup_codes
+from model.evaluation import predict_encoded
+
+ACTIVITY_SEGMENTS = ["low_activity", "medium_activity", "high_activity"]
 
 
 def evaluate_user_segments(ratings_df, model_data, val_df):
     """
     Evaluate model performance across different user segments
+
+    ratings_df and val_df may be DataFrames or RatingsMatrix objects.
     """
-    user_counts = ratings_df.groupby("user_id").size()
-    low_activity_users = set(user_counts[user_counts < 5].index)
-    medium_activity_users = set(
-        user_counts[(user_counts >= 5) & (user_counts < 20)].index
-    )
-    high_activity_users = set(user_counts[user_counts >= 20].index)
-    segments = {
-        "low_activity": low_activity_users,
-        "medium_activity": medium_activity_users,
-        "high_activity": high_activity_users,
+    labels = activity_segments(ratings_df, val_df)
+    by_activity = evaluate_segments(model_data, val_df, {"activity": labels})[
+        "activity"
+    ]
+    segment_results = {
+        name: by_activity.get(
+            name, {"RMSE": None, "MAE": None, "coverage": 0, "count": 0}
+        )
+        for name in ACTIVITY_SEGMENTS
     }
-    segment_results = {}
-    for segment_name, user_set in segments.items():
-        segment_val = val_df[val_df["user_id"].isin(user_set)]
-        if len(segment_val) == 0:
-            segment_results[segment_name] = {
-                "rmse": None,
-                "mae": None,
-                "coverage": 0,
-                "count": 0,
-            }
-            continue
-        metrics = evaluate_model(model_data, segment_val)
-        segment_results[segment_name] = metrics
     print("\nPerformance across user segments:")
     for segment, metrics in segment_results.items():
         print(
             f"{segment}: RMSE={metrics['RMSE']}, Coverage={metrics['coverage'] * 100:.2f}%, Count={metrics['count']}"
         )
     return segment_results
+
+
+def evaluate_segments(model_data, val_df, segment_keys):
+    """
+    Evaluate the model once on val_df and report metrics per segment.
+
+    segment_keys maps a key name to one label per val_df row (for example
+    from activity_segments, cold_warm_segments, user_attribute_segments or
+    time_segments). Returns {key: {label: metrics}} with the same metrics as
+    evaluate_model; RMSE and MAE are None for segments without predictions.
+    """
+    errors = _prediction_errors(model_data, val_df)
+    predicted = ~np.isnan(errors)
+    squared = np.where(predicted, errors**2, 0.0)
+    absolute = np.where(predicted, np.abs(errors), 0.0)
+
+    results = {}
+    for key, labels in segment_keys.items():
+        codes, names = pd.factorize(np.asarray(labels))
+        n_rows = np.bincount(codes, minlength=len(names))
+        counts = np.bincount(codes, weights=predicted, minlength=len(names))
+        sse = np.bincount(codes, weights=squared, minlength=len(names))
+        sae = np.bincount(codes, weights=absolute, minlength=len(names))
+
+        results[key] = {
+            name: _segment_metrics(n_rows[i], int(counts[i]), sse[i], sae[i])
+            for i, name in enumerate(names)
+        }
+    return results
+
+
+def activity_segments(ratings_df, val_df):
+    """
+    Label each val_df row by its user's number of ratings in ratings_df:
+    low (1-4), medium (5-19) or high (20+) activity, or no_history.
+    """
+    activity = _user_activity(ratings_df, val_df)
+    return np.select(
+        [activity >= 20, activity >= 5, activity >= 1],
+        ACTIVITY_SEGMENTS[::-1],
+        default="no_history",
+    )
+
+
+def cold_warm_segments(model_data, val_df):
+    """
+    Label each val_df row "warm" if the model knows its user, else "cold".
+    """
+    user_indices = _user_indices(model_data, val_df)
+    return np.where(user_indices >= 0, "warm", "cold")
+
+
+def user_attribute_segments(users_df, val_df, column):
+    """
+    Label each val_df row with a user_info column (e.g. gender or age) of
+    its user; users missing from users_df are labelled "unknown".
+    """
+    attribute = users_df.set_index("user_id")[column]
+    attribute = attribute[~attribute.index.duplicated()]
+    return _map_user_ids(attribute, val_df).fillna("unknown").astype(str).to_numpy()
+
+
+def time_segments(val_df, freq="M"):
+    """
+    Label each val_df row with the calendar period of its rating time
+    (epoch seconds or datetimes).
+    """
+    if isinstance(val_df, RatingsMatrix):
+        times = pd.to_datetime(val_df.timestamps, unit="s")
+    elif pd.api.types.is_numeric_dtype(val_df["time"]):
+        times = pd.to_datetime(val_df["time"], unit="s")
+    else:
+        times = pd.to_datetime(val_df["time"])
+    return pd.DatetimeIndex(times).to_period(freq).astype(str).to_numpy()
+
+
+def _prediction_errors(model_data, val_df):
+    """
+    Rating minus prediction for every val_df row, NaN where the model does
+    not know the user or the movie.
+    """
+    if isinstance(val_df, RatingsMatrix):
+        user_indices, movie_indices = val_df.codes_in(
+            model_data["user_to_idx"], model_data["movie_to_idx"]
+        )
+        ratings = val_df.ratings
+    else:
+        user_indices = lookup_codes(model_data["user_to_idx"], val_df["user_id"])
+        movie_indices = lookup_codes(model_data["movie_to_idx"], val_df["movie_id"])
+        ratings = val_df["rating"].to_numpy(dtype=float)
+
+    known = (user_indices >= 0) & (movie_indices >= 0)
+    errors = np.full(len(known), np.nan)
+    errors[known] = ratings[known] - predict_encoded(
+        model_data, user_indices[known], movie_indices[known]
+    )
+    return errors
+
+
+def _segment_metrics(n_rows, count, sse, sae):
+    return {
+        "RMSE": float(np.sqrt(sse / count)) if count else None,
+        "MAE": float(sae / count) if count else None,
+        "coverage": count / n_rows if n_rows else 0,
+        "count": count,
+    }
+
+
+def _user_indices(model_data, val_df):
+    if isinstance(val_df, RatingsMatrix):
+        user_rows = lookup_codes(model_data["user_to_idx"], val_df.user_ids)
+        return user_rows[val_df.user_codes]
+    return lookup_codes(model_data["user_to_idx"], val_df["user_id"])
+
+
+def _map_user_ids(values_by_user, val_df):
+    """
+    Look up a per-user Series for every val_df row.
+    """
+    if isinstance(val_df, RatingsMatrix):
+        by_code = values_by_user.reindex(val_df.user_ids)
+        return pd.Series(by_code.to_numpy()[val_df.user_codes])
+    return val_df["user_id"].map(values_by_user).reset_index(drop=True)
+
+
+def _user_activity(ratings_df, val_df):
+    """
+    Number of ratings in ratings_df by the user of each val_df row.
+    """
+    if isinstance(ratings_df, RatingsMatrix):
+        user_counts = pd.Series(ratings_df.user_counts(), index=ratings_df.user_ids)
+    else:
+        user_counts = ratings_df.groupby("user_id").size()
+
+    return _map_user_ids(user_counts, val_df).fillna(0).to_numpy()
@@ -0,0 +1,189 @@
+import json
+import numpy as np
+from data.ratings_matrix import IdIndex, compress, lookup_codes
+from model.evaluation import upcast
+from utils.popularity import build_popularity, popularity_from_counts
+
+
+def build_serving_index(
+    model_data, movies_df, ratings_df=None, seen_index=None, popularity=None
+):
+    """
+    Precompute the lookups the recommendation endpoints need for a model.
+
+    Built once when the app loads the model and data, so requests no longer
+    scan movies_df, parse JSON or filter ratings_df.
+
+    Args:
+        model_data (dict): The trained model data.
+        movies_df (pd.DataFrame): Dataframe containing movie details.
+        ratings_df (pd.DataFrame, optional): Ratings to rank popular movies
+            by, and to build the seen index from when no saved seen_index
+            is given.
+        seen_index (tuple, optional): A seen index from load_seen_index.
+        popularity (dict, optional): Saved popularity lists, used instead
+            of ranking ratings_df.
+
+    Returns:
+        dict: movie_ids (model row -> movie ID), movie_offsets (global mean
+        plus movie bias per row), movie_factors (widened to float32 once for
+        float16 models), titles and genres (movie ID -> parsed
+        metadata), seen (see build_seen_index) and popularity (see
+        build_popularity); the last two are None without the data for them.
+    """
+    if seen_index is None and ratings_df is not None:
+        seen_index = build_seen_index(model_data, ratings_df)
+
+    if popularity is None and ratings_df is not None:
+        popularity = build_popularity(ratings_df)
+
+    movie_ids = model_movie_ids(model_data)
+    titles, genres = build_title_index(movies_df)
+
+    return {
+        "movie_ids": movie_ids,
+        "movie_offsets": model_data["global_mean"]
+        + np.asarray(model_data["movie_biases"], dtype=float),
+        "movie_factors": upcast(model_data["movie_factors"]),
+        "titles": titles,
+        "genres": genres,
+        "seen": seen_index,
+        "popularity": popularity,
+    }
+
+
+def model_movie_ids(model_data):
+    """
+    Array of the movie ID of each model row.
+    """
+    movie_to_idx = model_data["movie_to_idx"]
+    if isinstance(movie_to_idx, IdIndex):
+        return movie_to_idx.ids.astype(object)
+    movie_ids = np.empty(len(movie_to_idx), dtype=object)
+    for movie_id, i in movie_to_idx.items():
+        movie_ids[i] = movie_id
+    return movie_ids
+
+
+def build_seen_index(model_data, ratings_df):
+    """
+    Movies rated by each model user, as a CSR layout over user rows:
+    (indptr, movie_rows), where the movies of user row u are
+    movie_rows[indptr[u]:indptr[u + 1]]. Ratings of users or movies the
+    model does not know are skipped.
+    """
+    user_rows = lookup_codes(model_data["user_to_idx"], ratings_df["user_id"])
+    movie_rows = lookup_codes(model_data["movie_to_idx"], ratings_df["movie_id"])
+    known = (user_rows >= 0) & (movie_rows >= 0)
+
+    return seen_index_from_rows(
+        user_rows[known], movie_rows[known], len(model_data["user_to_idx"])
+    )
+
+
+def seen_index_from_rows(user_rows, movie_rows, n_users):
+    """
+    Build a seen index from ratings already mapped to model rows.
+    """
+    indptr, movie_rows, _ = compress(
+        user_rows,
+        np.asarray(movie_rows, dtype=np.int32),
+        np.empty(len(user_rows), dtype=np.int8),
+        n_users,
+    )
+    return indptr, movie_rows
+
+
+def seen_popularity(model_data, seen_index):
+    """
+    all_time popularity of the model's movies, counted from a seen index,
+    so it can be saved with the model and served without the ratings.
+    """
+    movie_ids = model_movie_ids(model_data)
+    counts = np.bincount(seen_index[1], minlength=len(movie_ids))
+    return popularity_from_counts(movie_ids, counts)
+
+
+def seen_movie_rows(serving_index, user_index):
+    """
+    Model rows of the movies a user row has rated.
+    """
+    indptr, movie_rows = serving_index["seen"]
+    return movie_rows[indptr[user_index] : indptr[user_index + 1]]
+
+
+def save_seen_index(seen_index, path):
+    indptr, movie_rows = seen_index
+    np.savez(path, indptr=indptr, movie_rows=movie_rows)
+
+
+def load_seen_index(path):
+    with np.load(path) as seen:
+        return seen["indptr"], seen["movie_rows"]
+
+
+def build_title_index(movies_df):
+    """
+    Parse every movie's json_data once into movie ID -> title and
+    movie ID -> genre names dicts.
+
+    Movies without json_data, or whose JSON cannot be parsed, are titled by
+    their ID like title_from_movies_df does.
+    """
+    movie_ids = movies_df["movie_id"].tolist()
+    if "json_data" not in movies_df.columns:
+        return {movie_id: str(movie_id) for movie_id in movie_ids}, {}
+
+    titles, genres = {}, {}
+    for movie_id, json_str in zip(movie_ids, movies_df["json_data"].tolist()):
+        try:
+            json_data = json.loads(json_str) if isinstance(json_str, str) else json_str
+            titles[movie_id] = str(json_data.get("title", movie_id))
+            genres[movie_id] = _genre_names(json_data.get("genres"))
+        except (json.JSONDecodeError, AttributeError):
+            titles[movie_id] = str(movie_id)
+
+    return titles, genres
+
+
+def movie_title(serving_index, movie_id):
+    """
+    Title of a movie, or its ID as a string if the movie is unknown.
+    """
+    return serving_index["titles"].get(movie_id, str(movie_id))
+
+
+def movie_titles(movie_ids, movies_df, serving_index=None):
+    """
+    Titles for movie IDs, from the serving index when there is one and
+    parsed from movies_df otherwise.
+    """
+    if serving_index is not None:
+        return [movie_title(serving_index, movie_id) for movie_id in movie_ids]
+    return [title_from_movies_df(movie_id, movies_df) for movie_id in movie_ids]
+
+
+def title_from_movies_df(movie_id, movies_df):
+    """
+    Parse a movie's title out of its json_data row; like movie_title,
+    falls back to the ID as a string.
+    """
+    movie_row = movies_df[movies_df["movie_id"] == movie_id]
+    if movie_row.empty or "json_data" not in movies_df.columns:
+        return str(movie_id)
+
+    try:
+        json_str = movie_row["json_data"].iloc[0]
+        json_data = json.loads(json_str) if isinstance(json_str, str) else json_str
+        return str(json_data.get("title", movie_id))
+    except (json.JSONDecodeError, AttributeError):
+        return str(movie_id)
+
+
+def _genre_names(genres):
+    # Genres come either as names or as {"id": ..., "name": ...} objects.
+    if not genres:
+        return []
+    if isinstance(genres, str):
+        return [genre.strip() for genre in genres.split(",")]
+    return [genre["name"] if isinstance(genre, dict) else genre for genre in genres]
@@ -1,18 +1,25 @@
 import pandas as pd
+from data.ratings_matrix import RatingsMatrix
 
 
 def validate_before_training(train_df, val_df, test_df):
     """
     Run validation checks before training to prevent common evaluation pitfalls.
+
+    The splits may be DataFrames or RatingsMatrix objects; for matrices the
+    checks work on the integer codes and id tables instead of rebuilding
+    sets of ids.
     """
     all_checks_passed = True
 
-    # Check temporal splitting (if time column exists)
-    if "time" in train_df.columns and "time" in test_df.columns:
-        train_max_time = pd.to_datetime(train_df["time"]).max()
-        test_min_time = pd.to_datetime(test_df["time"]).min()
+    if isinstance(train_df, RatingsMatrix):
+        stats = _matrix_stats(train_df, test_df)
+    else:
+        stats = _dataframe_stats(train_df, test_df)
 
-        if train_max_time >= test_min_time:
+    # Check temporal splitting (if time column exists)
+    if stats["train_max_time"] is not None and stats["test_min_time"] is not None:
+        if stats["train_max_time"] >= stats["test_min_time"]:
             print(
                 "⚠️ WARNING: Temporal leakage detected - "
                 "train data contains timestamps after test data"
@@ -20,12 +27,9 @@ def validate_before_training(train_df, val_df, test_df):
             all_checks_passed = False
 
     # Check for user/item overlap
-    train_users = set(train_df["user_id"].unique())
-    test_users = set(test_df["user_id"].unique())
-
-    if not test_users.issubset(train_users):
-        n_cold_users = len(test_users - train_users)
-        pct_cold_users = (n_cold_users / len(test_users)) * 100
+    n_cold_users = stats["n_cold_users"]
+    if n_cold_users > 0:
+        pct_cold_users = (n_cold_users / stats["n_test_users"]) * 100
         print(
             f"ℹ️ INFO: {n_cold_users} cold-start users in test set "
             f"({pct_cold_users:.1f}%)"
@@ -41,8 +45,8 @@ def validate_before_training(train_df, val_df, test_df):
         )
 
     # Check for class imbalance or distribution shifts
-    train_rating_dist = train_df["rating"].value_counts(normalize=True)
-    test_rating_dist = test_df["rating"].value_counts(normalize=True)
+    train_rating_dist = stats["train_ratings"].value_counts(normalize=True)
+    test_rating_dist = stats["test_ratings"].value_counts(normalize=True)
 
     max_diff = (train_rating_dist - test_rating_dist).abs().max()
     if max_diff > 0.1:  # 10% threshold
@@ -54,8 +58,8 @@ def validate_before_training(train_df, val_df, test_df):
         all_checks_passed = False
 
     # Check sample independence
-    n_users = len(train_df["user_id"].unique())
-    n_movies = len(train_df["movie_id"].unique())
+    n_users = stats["n_train_users"]
+    n_movies = stats["n_train_movies"]
     sparsity = 1 - (len(train_df) / (n_users * n_movies))
 
     if sparsity < 0.95:
@@ -66,3 +70,46 @@ def validate_before_training(train_df, val_df, test_df):
         print(f"    Sparsity: {sparsity:.4f}")
 
     return all_checks_passed
+
+
+def _dataframe_stats(train_df, test_df):
+    train_max_time = test_min_time = None
+    if "time" in train_df.columns and "time" in test_df.columns:
+        train_max_time = pd.to_datetime(train_df["time"]).max()
+        test_min_time = pd.to_datetime(test_df["time"]).min()
+
+    train_users = set(train_df["user_id"].unique())
+    test_users = set(test_df["user_id"].unique())
+
+    return {
+        "train_max_time": train_max_time,
+        "test_min_time": test_min_time,
+        "n_test_users": len(test_users),
+        "n_cold_users": len(test_users - train_users),
+        "train_ratings": train_df["rating"],
+        "test_ratings": test_df["rating"],
+        "n_train_users": len(train_users),
+        "n_train_movies": len(train_df["movie_id"].unique()),
+    }
+
+
+def _matrix_stats(train, test):
+    train_max_time = test_min_time = None
+    if train.timestamps is not None and test.timestamps is not None:
+        if len(train) and len(test):
+            train_max_time = train.timestamps.max()
+            test_min_time = test.timestamps.min()
+
+    train_users = train.user_ids[train.present_users()]
+    test_users = test.user_ids[test.present_users()]
+
+    return {
+        "train_max_time": train_max_time,
+        "test_min_time": test_min_time,
+        "n_test_users": len(test_users),
+        "n_cold_users": int((~test_users.isin(train_users)).sum()),
+        "train_ratings": pd.Series(train.ratings),
+        "test_ratings": pd.Series(test.ratings),
+        "n_train_users": int(train.present_users().sum()),
+        "n_train_movies": int(train.present_movies().sum()),
+    }